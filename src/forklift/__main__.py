@@ -13,12 +13,14 @@ Usage:
     forklift garage open
     forklift gift-wrap --output <folder-path> [--input <fgdb-path>|--pallet <file-path>] [--verbose]
     forklift git-update
-    forklift lift [<file-path>] [--pallet-arg <arg>] [--verbose] [--skip-emails|--send-emails] [--preserve-drop-off-data]
+    forklift lift [<file-path>] [--pallet-arg <arg>] [--verbose] [--skip-emails|--send-emails] [--preserve-drop-off-data] [--resume] [--crate=<crate-pattern>] [--destination-workspace=<workspace-path>] [--only-failed] [--plan]
     forklift list-pallets
     forklift scorched-earth
+    forklift serve [--stop] [--verbose]
     forklift ship [--verbose] [--pallet-arg <arg>] [--skip-emails|--send-emails] [--by-service]
     forklift special-delivery <file-path> [--pallet-arg <arg>] [--verbose]
     forklift speedtest
+    forklift stats [--crate=<crate-pattern>] [--days=<days>]
 
 Arguments:
     repo            The name of a GitHub repository in <owner>/<name> format.
@@ -26,6 +28,9 @@ Arguments:
     fgdb-path       A path to a file geodatabase.
     folder-path     A path to a folder.
     pallet-arg      A string to be used as an optional initialization parameter to the pallet.
+    crate-pattern   A crate destination name or a glob pattern of destination names e.g. Roads*.
+    workspace-path  A crate destination workspace or a glob pattern of destination workspaces.
+    days            A number of days.
 
 Examples:
     forklift build                                                          Builds pallets without lifting or shipping. This is used for testing
@@ -42,14 +47,26 @@ Examples:
     forklift git-update                                                     Pulls the latest updates to all git repositories.
     forklift lift                                                           The main entry for running all of pallets found in the warehouse folder.
     forklift lift --preserve-drop-off-data                                  Does not clear out existing data in `dropoffLocation`. [not yet implemented]
+    forklift lift --resume                                                  Continues the last lift if it did not finish. Finished crates and phases are skipped.
+    forklift lift path/to/pallet_file.py --crate Roads*                     Updates only the crates whose destination name matches and processes, drops off,
+                                                                            and reports only their pallets.
+    forklift lift --destination-workspace path/to/roads.gdb                 Updates only the crates that are written to the workspace.
+    forklift lift --only-failed                                             Updates only the crates whose last result was an error or invalid data.
+    forklift lift --plan                                                    Prints the update strategy, adds, deletes, and estimated time of each crate
+                                                                            without writing any data and saves them to `plan.json` in the garage.
     forklift lift --send-emails                                             Force sending emails. Overrides `sendEmails` config as True.
     forklift lift --skip-emails                                             Skip sending emails. Overrides `sendEmails` config as False.
     forklift lift --verbose                                                 Print DEBUG statements to the console.
     forklift lift path/to/pallet_file.py                                    Run a specific pallet.
     forklift lift path/to/pallet_file.py --pallet-arg arg                   Run a specific pallet with "arg" as an initialization parameter.
-    forklift list-pallets                                                   Outputs the list of pallets from the config.
+    forklift list-pallets                                                   Outputs the list of pallets in the warehouse from the pallet index without
+                                                                            importing them.
     forklift scorched-earth                                                 WARNING!!! Deletes all data in `config.stagingDestination` as well as the
                                                                             `hashes.gdb` & `scratch.gdb` file geodatabases.
+    forklift serve                                                          Runs forklift as a long running process that keeps a worker with arcpy loaded,
+                                                                            lifts at the `serveSchedule` times or when change detection tables change, and
+                                                                            runs `forklift lift` commands from other terminals in the warm worker.
+    forklift serve --stop                                                   Stops the running forklift server.
     forklift ship                                                           Moves data from the drop off location to the ship to location.
     forklift ship --by-service path/to/pallet_file.py                       Shuts down only those services that are related to the data that was changed related
                                                                             to the pallet(s) in the passed in file rather than shutting down the entire server
@@ -59,23 +76,13 @@ Examples:
                                                                             use the data that was updated rather than the entire ArcGIS Server instance. Note: this
                                                                             will only work for pallets that are in the warehouse.
     forklift speedtest                                                      Test the speed on a predefined pallet.
+    forklift stats                                                          Prints the recent lifts and ships, the median, 90th percentile, and trend of
+                                                                            each phase and server, and the slowest crates from the history in the garage.
+    forklift stats --crate Parcels* --days 30                               Also prints every run of the matching crates from the last 30 days with their
+                                                                            rows, adds, deletes, and phase times.
+    forklift config repos --list --profile-startup                          Runs any command and prints the modules that took the longest to import.
 """
 
-#: check for Pro license
-try:
-    import arcpy  # noqa: F401
-except RuntimeError as exception:
-    import socket
-
-    from . import config, messaging
-
-    messaging.send_emails_override = True
-    messaging.send_email(config.get_config_prop("notify"), f"Forklift Error on {socket.gethostname()}", str(exception))
-
-    print("ERROR: Cannot import arcpy! This is usually caused by ArcGIS Pro not having a valid license.")
-    exit(1)
-
-
 import faulthandler
 import logging.config
 import socket
@@ -83,25 +90,36 @@ import sys
 from logging import shutdown
 from os import linesep, makedirs, startfile
 from os.path import abspath, dirname, join, realpath
+from time import perf_counter
 
-from docopt import docopt
+from docopt import DocoptExit, docopt
 
-from . import config, engine, messaging
+from . import config, engine, messaging, seat, server
 
 log_location = join(abspath(dirname(__file__)), "..", "forklift-garage", "forklift.log")
 detailed_formatter = logging.Formatter(
     fmt="%(levelname)-7s %(asctime)s %(module)10s:%(lineno)5s %(message)s", datefmt="%m-%d %H:%M:%S"
 )
 speedtest = join(dirname(realpath(__file__)), "..", "..", "speedtest", "SpeedTestPallet.py")
+#: the commands that use arcpy. The other commands don't import it so that they start quickly
+arcpy_commands = ["build", "gift-wrap", "scorched-earth", "ship", "special-delivery", "speedtest"]
+#: the number of the slowest imports that are printed by --profile-startup
+profile_startup_count = 30
 
 
 def main():
     """Main entry point for program. Parse arguments and pass to engine module"""
 
+    if "--profile-startup" in sys.argv:
+        return _profile_startup([arg for arg in sys.argv[1:] if arg != "--profile-startup"])
+
     args = docopt(__doc__, version="9.4.1")
     _setup_logging(args["--verbose"])
     _add_global_error_handler()
 
+    if any(args[command] for command in arcpy_commands) or (args["serve"] and not args["--stop"]):
+        _check_pro_license()
+
     if args["--skip-emails"]:
         messaging.send_emails_override = False
     elif args["--send-emails"]:
@@ -153,22 +171,48 @@ def main():
         engine.gift_wrap(args["<folder-path>"], args["<fgdb-path>"], args["<file-path>"])
     elif args["git-update"]:
         engine.git_update()
+    elif args["lift"] and args["--plan"]:
+        _check_pro_license()
+
+        pallet_arg = args["<arg>"] if args["--pallet-arg"] else None
+        engine.plan_lift(args["<file-path>"], pallet_arg, _get_selectors(args))
+    elif args["lift"] and not args["--resume"] and server.is_running():
+        file_path = abspath(args["<file-path>"]) if args["<file-path>"] else None
+
+        print(
+            server.send(
+                {
+                    "command": "lift",
+                    "file_path": file_path,
+                    "pallet_arg": args["<arg>"],
+                    "selectors": _get_selectors(args),
+                    "send_emails": messaging.send_emails_override,
+                }
+            )
+        )
     elif args["lift"]:
+        _check_pro_license()
+
         if args["<file-path>"]:
             if args["--pallet-arg"]:
-                engine.lift_pallets(args["<file-path>"], args["<arg>"])
+                engine.lift_pallets(
+                    args["<file-path>"], args["<arg>"], resume=args["--resume"], selectors=_get_selectors(args)
+                )
             else:
-                engine.lift_pallets(args["<file-path>"])
+                engine.lift_pallets(args["<file-path>"], resume=args["--resume"], selectors=_get_selectors(args))
         else:
-            engine.lift_pallets()
+            engine.lift_pallets(resume=args["--resume"], selectors=_get_selectors(args))
     elif args["list-pallets"]:
-        pallets = engine.list_pallets()
+        pallets, parse_errors = engine.list_pallets()
 
         if len(pallets) == 0:
             print("No pallets found!")
         else:
-            for path, pallet_class in pallets:
-                print((": ".join([path, str(pallet_class)])))
+            for path, class_name in pallets:
+                print((": ".join([path, class_name])))
+
+        for parse_error in parse_errors:
+            print(parse_error)
     elif args["scorched-earth"]:
         engine.scorched_earth()
     elif args["ship"]:
@@ -176,6 +220,11 @@ def main():
             engine.ship_data(args["<arg>"])
         else:
             engine.ship_data()
+    elif args["serve"]:
+        if args["--stop"]:
+            print(server.send({"command": "stop"}))
+        else:
+            server.Server().serve_forever()
     elif args["special-delivery"]:
         warehouse = config.get_config_prop("warehouse").lower()
 
@@ -197,10 +246,93 @@ def main():
             engine.move_dropoff_data(False)
     elif args["speedtest"]:
         engine.speedtest(speedtest)
+    elif args["stats"]:
+        print(engine.stats(args["--crate"], _get_days(args["--days"])))
 
     shutdown()
 
 
+def _get_selectors(args):
+    """args: dictionary - the docopt arguments
+
+    returns the crate selectors for a selective lift or None if all of the crates should be lifted
+    """
+    if not (args["--crate"] or args["--destination-workspace"] or args["--only-failed"]):
+        return None
+
+    return {
+        "crate_pattern": args["--crate"],
+        "destination_workspace": args["--destination-workspace"],
+        "only_failed": args["--only-failed"],
+    }
+
+
+def _get_days(days):
+    """days: string - the --days argument
+
+    exits with the usage if the days are not a positive number
+
+    returns the number of days or None if they were not passed
+    """
+    if days is None:
+        return None
+
+    try:
+        number = float(days)
+    except ValueError:
+        number = 0
+
+    if not number > 0:
+        raise DocoptExit("--days must be a positive number of days")
+
+    return number
+
+
+def _check_pro_license():
+    """imports arcpy and exits if it can't be imported. The modules that were imported lazily are finished here on
+    the main thread before any crate or build workers start
+    """
+    try:
+        import arcpy  # noqa: F401
+
+        seat.finish_lazy_imports()
+    except RuntimeError as exception:
+        messaging.send_emails_override = True
+        messaging.send_email(
+            config.get_config_prop("notify"), f"Forklift Error on {socket.gethostname()}", str(exception)
+        )
+
+        print("ERROR: Cannot import arcpy! This is usually caused by ArcGIS Pro not having a valid license.")
+        exit(1)
+
+
+def _profile_startup(argv):
+    """argv: string[] - the cli arguments without --profile-startup
+
+    runs the command in a new python process with `-X importtime` and prints the modules that took the longest to import
+    """
+    import subprocess
+
+    from .seat import format_time, get_import_times
+
+    start = perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "forklift", *argv], stderr=subprocess.PIPE, text=True
+    )
+    total = perf_counter() - start
+
+    import_times = get_import_times(process.stderr)
+
+    print(f"{'module':<60}{'self':>12}{'cumulative':>14}")
+    for module, self_time, cumulative in import_times[:profile_startup_count]:
+        print(f"{module:<60}{format_time(self_time / 1e6):>12}{format_time(cumulative / 1e6):>14}")
+
+    imports = sum(self_time for _, self_time, _ in import_times)
+    print(f"{linesep}imports: {format_time(imports / 1e6)} of {format_time(total)} total")
+
+    return process.returncode
+
+
 def global_exception_handler(ex_cls, ex, tb):
     """
     ex_cls: Class - the type of the exception
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+anomalies.py
+
+A module that compares the durations and row throughput of the crates and phases of a lift or ship with their recent
+history in the garage and describes the outliers for the reports
+"""
+
+import logging
+from fnmatch import fnmatchcase
+from statistics import median
+
+from . import config, history, seat
+
+log = logging.getLogger("forklift")
+#: the number of scaled median absolute deviations above the median that a duration must be to be an outlier
+default_sensitivity = 3.5
+#: durations that are less than this many seconds longer than their median are never outliers
+default_minimum_seconds = 60
+#: the number of earlier runs that are needed before a crate or phase is checked
+minimum_runs = 3
+#: the number of earlier runs that a crate or phase is compared to
+compared_runs = 20
+#: makes the median absolute deviation comparable to a standard deviation for normally distributed durations
+deviation_scale = 1.4826
+#: the smallest deviation as a fraction of the median so that a crate that always takes the same time is not flagged
+#: for small changes
+minimum_deviation = 0.1
+
+
+def find_anomalies(run=None, location=None):
+    """run: number - an optional run id. Defaults to the run that is being recorded
+    location: string - an optional path to the history database
+
+    Compares each crate and phase of the run with its earlier runs and each crate with its budget from the
+    `crateTimeBudgets` config value. The sensitivity is set with the `anomalySensitivity` and `anomalyMinimumSeconds`
+    config values.
+
+    returns a list of messages describing the outliers
+    """
+    run = run if run is not None else history.current_run
+    if run is None:
+        return []
+
+    sensitivity = config.get_config_prop("anomalySensitivity", default_sensitivity)
+    minimum_seconds = config.get_config_prop("anomalyMinimumSeconds", default_minimum_seconds)
+    budgets = config.get_config_prop("crateTimeBudgets", {})
+    messages = []
+
+    for duration in history.get_run_durations(run, compared_runs, location):
+        label = _get_label(duration)
+        seconds = duration["seconds"]
+
+        if duration["kind"] == history.CRATE:
+            budget = get_budget(duration["name"], budgets)
+
+            if budget is not None and seconds > budget:
+                messages.append(
+                    "{} took {} which is over its budget of {}".format(
+                        label, seat.format_time(seconds), seat.format_time(budget)
+                    )
+                )
+
+        earlier = [earlier_seconds for earlier_seconds, _ in duration["earlier"] if earlier_seconds is not None]
+        if len(earlier) < minimum_runs:
+            continue
+
+        typical = median(earlier)
+        if seconds - typical >= minimum_seconds and is_outlier(seconds, earlier, sensitivity):
+            messages.append(
+                "{} took {} which is {} its median of {}".format(
+                    label, seat.format_time(seconds), _format_ratio(seconds, typical), seat.format_time(typical)
+                )
+            )
+
+            continue
+
+        rows = duration["rows"]
+        earlier_rates = [
+            earlier_rows / earlier_seconds
+            for earlier_seconds, earlier_rows in duration["earlier"]
+            if earlier_rows and earlier_seconds
+        ]
+        if not rows or not seconds or len(earlier_rates) < minimum_runs or seconds - typical < minimum_seconds:
+            continue
+
+        rate = rows / seconds
+        if is_outlier(1 / rate, [1 / earlier_rate for earlier_rate in earlier_rates], sensitivity):
+            messages.append(
+                "{} processed {:.0f} rows per second which is below its median of {:.0f}".format(
+                    label, rate, median(earlier_rates)
+                )
+            )
+
+    for message in messages:
+        log.warning("duration anomaly: %s", message)
+
+    return messages
+
+
+def is_outlier(value, earlier, sensitivity=default_sensitivity):
+    """value: number
+    earlier: number[] - the values from earlier runs
+    sensitivity: number - the number of scaled median absolute deviations above the median that is an outlier
+
+    The median absolute deviation is used rather than the standard deviation so that one slow run does not hide the
+    next one
+
+    returns True if the value is unusually high compared to the earlier values
+    """
+    typical = median(earlier)
+    deviation = max(median([abs(item - typical) for item in earlier]) * deviation_scale, typical * minimum_deviation)
+
+    return value > typical + sensitivity * deviation
+
+
+def get_budget(crate_name, budgets):
+    """crate_name: string - `Crate.name`
+    budgets: dictionary - crate destination names or glob patterns of names to seconds
+
+    returns the seconds of the first budget that matches the crate or None
+    """
+    names = [crate_name.lower(), _get_destination_name(crate_name).lower()]
+
+    for pattern, seconds in budgets.items():
+        if any(fnmatchcase(name, pattern.lower()) for name in names):
+            return seconds
+
+    return None
+
+
+def _get_label(duration):
+    """duration: dictionary - an item from `history.get_run_durations`
+
+    returns the name of the crate or phase for the report
+    """
+    if duration["kind"] == history.CRATE:
+        return "crate {}".format(_get_destination_name(duration["name"]))
+
+    if duration["kind"] == history.PALLET:
+        return "{} {}".format(duration["target"].split(":")[-1], duration["name"])
+
+    if duration["target"]:
+        return "{} {}".format(duration["target"], duration["name"])
+
+    return duration["name"]
+
+
+def _get_destination_name(crate_name):
+    """crate_name: string - `Crate.name`
+
+    returns the crate name without the hash of its destination
+    """
+    return crate_name.rsplit("_", 1)[0]
+
+
+def _format_ratio(seconds, typical):
+    """seconds: number
+    typical: number
+
+    returns how many times longer the seconds are than the typical seconds
+    """
+    if not typical:
+        return "much longer than"
+
+    return "{:.1f}x".format(seconds / typical)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+cache.py
+
+A module that contains a persistent key value cache that pallets can use between lifts
+"""
+
+import logging
+import pickle
+import sqlite3
+from contextlib import closing
+from os.path import dirname, join
+from threading import Lock
+from time import time
+
+from xxhash import xxh64
+
+from . import config
+
+log = logging.getLogger("forklift")
+cache_file_name = "cache.db"
+#: the total size of all of the cached values before the least recently used values are removed
+default_max_bytes = 256 * 1024 * 1024
+_missing = object()
+
+
+def get_cache_location():
+    """returns the path to the cache database in the garage"""
+    return join(dirname(config.config_location), cache_file_name)
+
+
+def make_key(*parts):
+    """parts: any picklable values - e.g. a url and its query parameters
+
+    returns a key that is a hash of the contents of the parts
+    """
+    return xxh64(pickle.dumps(parts, protocol=4)).hexdigest()
+
+
+class PalletCache(object):
+    """A persistent key value cache stored in a SQLite database in the garage. Values are pickled.
+
+    Values can expire after a number of seconds and the least recently used values are removed once the total size of
+    the cache is larger than the `cacheMaxBytes` config value. Each pallet gets its own namespace within the cache.
+    """
+
+    def __init__(self, namespace, location=None, max_bytes=None):
+        #: the keys of this cache are separate from the keys of caches with other namespaces
+        self.namespace = namespace
+        self.location = location or get_cache_location()
+        #: the total size of all of the values in the cache database
+        self.max_bytes = max_bytes or config.get_config_prop("cacheMaxBytes", default_max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """key: string
+        default: any - the value to return if the key is not cached or has expired
+
+        returns the cached value for the key
+        """
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ? AND (expires IS NULL OR expires > ?)",
+                (self.namespace, key, time()),
+            ).fetchone()
+
+            if row is not None:
+                connection.execute(
+                    "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?", (time(), self.namespace, key)
+                )
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+
+                return default
+
+            self.hits += 1
+
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """key: string
+        value: any picklable value
+        ttl: number - the number of seconds before the value expires. The value does not expire if None
+
+        caches the value and removes the least recently used values if the cache is larger than `max_bytes`
+        """
+        data = pickle.dumps(value, protocol=4)
+        now = time()
+        expires = now + ttl if ttl is not None else None
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, sqlite3.Binary(data), len(data), expires, now),
+            )
+            connection.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (now,))
+
+            self._evict(connection)
+
+    def get_or_set(self, key, function, ttl=None):
+        """key: string
+        function: Function - called to create the value if it is not cached
+        ttl: number - the number of seconds before the value expires
+
+        returns the cached value or the return value of the function after caching it
+        """
+        value = self.get(key, _missing)
+
+        if value is _missing:
+            value = function()
+            self.set(key, value, ttl)
+
+        return value
+
+    def delete(self, key):
+        """key: string
+
+        removes the key from the cache
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def get_report(self):
+        """returns a dictionary of the hits and misses or None if the cache was not used"""
+        if self.hits + self.misses == 0:
+            return None
+
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _evict(self, connection):
+        """connection: sqlite3.Connection
+
+        removes the least recently used values until the cache is no larger than `max_bytes`
+        """
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        removed = 0
+        for namespace, key, size in connection.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY accessed"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+
+            connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            total -= size
+            removed += 1
+
+        log.debug("removed %d least recently used values from the cache", removed)
+
+    def _connect(self):
+        """returns a sqlite3 connection to the cache database, creating the table if needed"""
+        connection = sqlite3.connect(self.location, timeout=30)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+
+        return connection
@@ -7,13 +7,13 @@ a module to track changes from change detection tables
 
 import logging
 from os import path
+from threading import Lock
 
-import arcpy
-
-from . import config
+from . import config, seat
 from .core import update_while_preserving_global_ids
 from .models import Crate
 
+arcpy = seat.lazy_import("arcpy")
 log = logging.getLogger("forklift")
 hash_fgdb_name = "changedetection.gdb"
 hash_fgdb = path.join(config.get_config_prop("hashLocation"), hash_fgdb_name)
@@ -21,21 +21,29 @@ hash_table_name = "TableHashes"
 hash_table = path.join(hash_fgdb, hash_table_name)
 table_name_field = "table_name"
 hash_field = "hash"
+#: crates may be updated on multiple threads but only one of them should write to the hash table at a time
+hash_table_lock = Lock()
 
 
 class ChangeDetection(object):
     """A class that models data obtained from the change detection tables"""
 
-    def __init__(self, table_paths, root_folder, hash_table=hash_table):
+    def __init__(self, table_paths, root_folder, hash_table=hash_table, read_only=False):
+        """read_only: boolean - don't create the hash table if it doesn't exist e.g. when planning a lift"""
         self.hash_table = hash_table
-        if not arcpy.Exists(hash_table):
+        hash_table_exists = arcpy.Exists(hash_table)
+        if not hash_table_exists and not read_only:
             log.info(f"creating change detection table: {hash_table}")
             arcpy.management.CreateTable(path.dirname(hash_table), path.basename(hash_table))
             arcpy.management.AddField(hash_table, table_name_field, "TEXT")
             arcpy.management.AddField(hash_table, hash_field, "TEXT")
+            hash_table_exists = True
 
         self.current_hashes = _get_hashes([path.join(root_folder, table_path) for table_path in table_paths])
-        self.previous_hashes = _get_hashes([hash_table])
+        self.previous_hashes = _get_hashes([hash_table]) if hash_table_exists else {}
+        #: the tables whose hashes are left for the lift process to write when the crates are updated in worker
+        #: processes. None to write them as soon as the crate is loaded
+        self.deferred_tables = None
 
     def has_table(self, table_name):
         """table_name: string
@@ -79,20 +87,34 @@ class ChangeDetection(object):
                 arcpy.management.Append(crate.source, crate.destination, schema_type="NO_TEST")
 
         table_name = crate.source_name.lower()
-        with arcpy.da.UpdateCursor(
-            self.hash_table, [hash_field], where_clause=f"{table_name_field} = '{table_name}'"
-        ) as cursor:
-            try:
-                next(cursor)
-                log.info(f"updating value in hash table for {table_name}")
-                cursor.updateRow((self.current_hashes[table_name],))
-            except StopIteration:
-                log.info(f"adding new row in hash table for {table_name}")
-                with arcpy.da.InsertCursor(self.hash_table, [table_name_field, hash_field]) as insert_cursor:
-                    insert_cursor.insertRow((table_name, self.current_hashes[table_name]))
+        if self.deferred_tables is not None:
+            self.deferred_tables.append(table_name)
+        else:
+            self.write_hash(table_name)
 
         return (status, None)
 
+    def write_hash(self, table_name):
+        """table_name: string
+
+        writes the current hash of the table to the hash table. The lock only serializes the threads of this process
+        so crate worker processes defer their writes to the lift process with `deferred_tables`
+        """
+        table_name = table_name.lower()
+
+        with hash_table_lock:
+            with arcpy.da.UpdateCursor(
+                self.hash_table, [hash_field], where_clause=f"{table_name_field} = '{table_name}'"
+            ) as cursor:
+                try:
+                    next(cursor)
+                    log.info(f"updating value in hash table for {table_name}")
+                    cursor.updateRow((self.current_hashes[table_name],))
+                except StopIteration:
+                    log.info(f"adding new row in hash table for {table_name}")
+                    with arcpy.da.InsertCursor(self.hash_table, [table_name_field, hash_field]) as insert_cursor:
+                        insert_cursor.insertRow((table_name, self.current_hashes[table_name]))
+
 
 def _get_hashes(table_paths):
     """table_paths: string[] - paths to change detection tables relative to the garage
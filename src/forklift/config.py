@@ -7,13 +7,61 @@ A module that contains logic for reading and writing the config file
 """
 
 import logging
+from copy import deepcopy
 from json import dumps, loads
-from os import makedirs
+from os import makedirs, stat
 from os.path import abspath, dirname, exists, join
+from threading import Lock
 
 log = logging.getLogger("forklift")
 config_location = join(abspath(dirname(__file__)), "..", "forklift-garage", "config.json")
 default_warehouse_location = "c:\\forklift\\warehouse"
+_no_default = object()
+_number = (int, float)
+_optional_number = (int, float, type(None))
+#: the types that are allowed for each config value. Values that are not in the schema are not checked
+schema = {
+    "adaptiveCrateWorkers": (dict, type(None)),
+    "anomalyMinimumSeconds": _number,
+    "anomalySensitivity": _number,
+    "buildWorkers": int,
+    "cacheMaxBytes": int,
+    "captureMaxBytes": int,
+    "changeDetectionTables": list,
+    "configuration": str,
+    "crateTimeBudgets": dict,
+    "crateTimeoutSeconds": _optional_number,
+    "crateWorkers": int,
+    "describeCacheSeconds": _optional_number,
+    "dropoffLocation": str,
+    "editChunkSize": (int, type(None)),
+    "email": dict,
+    "gitRepositoryTimeoutSeconds": _optional_number,
+    "gitTimeoutSeconds": _optional_number,
+    "gitWorkers": int,
+    "hashLocation": str,
+    "hostConcurrency": dict,
+    "ignoredFolders": list,
+    "notify": list,
+    "palletExecutorWorkers": (int, type(None)),
+    "palletWorkers": int,
+    "pipelinePallets": bool,
+    "progressIntervalSeconds": _number,
+    "progressPort": (int, type(None)),
+    "repositories": list,
+    "sendEmails": bool,
+    "servePort": int,
+    "serveSchedule": list,
+    "serveTriggerSeconds": _optional_number,
+    "servers": (dict, type(None)),
+    "serverStartWaitSeconds": _number,
+    "shipTo": str,
+    "slackWebhookUrl": (str, type(None)),
+    "warehouse": str,
+}
+#: the config that was last read from `config_location` and the modified time and size of the file when it was read
+_loaded = {"location": None, "signature": None, "config": None, "servers": None}
+_lock = Lock()
 
 
 def create_default_config():
@@ -49,43 +97,155 @@ def create_default_config():
 
         json_config_file.write(dumps(data, sort_keys=True, indent=2, separators=(",", ": ")))
 
-        return abspath(json_config_file.name)
+    clear_cache()
+
+    return abspath(json_config_file.name)
+
+
+def clear_cache():
+    """forces the config file to be read again the next time that a value is used"""
+    with _lock:
+        _loaded.update(location=None, signature=None, config=None, servers=None)
+
+
+def validate(config):
+    """config: dictionary
+
+    checks the types of the values in the config against the `schema`
+
+    raises a ValueError listing all of the invalid values
+    """
+    problems = []
+
+    for key, value in config.items():
+        if key not in schema:
+            continue
+
+        types = schema[key]
+        if not isinstance(types, tuple):
+            types = (types,)
+
+        #: booleans are integers in python but true is never a valid number of workers or seconds
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            problems.append(
+                "{} must be {} but is {!r}".format(key, " or ".join(_get_type_name(item) for item in types), value)
+            )
+
+    if len(problems) > 0:
+        raise ValueError("invalid config values in {}: {}".format(config_location, "; ".join(problems)))
+
+
+def _get_type_name(value_type):
+    """value_type: type
+
+    returns the name of the type as it is written in json
+    """
+    return {
+        dict: "an object",
+        list: "an array",
+        str: "a string",
+        int: "an integer",
+        float: "a number",
+        bool: "a boolean",
+        type(None): "null",
+    }.get(value_type, value_type.__name__)
 
 
 def _get_config():
-    """returns a dictionary representing the current config file (creating one if it doesn't not already exist)"""
+    """returns a dictionary representing the current config file (creating one if it doesn't not already exist)
+
+    The file is read and validated once and is only read again when its modified time or size changes or
+    `config_location` is changed. Use `get_config_prop` rather than changing the returned dictionary.
+    """
     #: write default config if the file does not exist
     if not exists(config_location):
         create_default_config()
 
+    stats = stat(config_location)
+    signature = (stats.st_mtime_ns, stats.st_size)
+
+    with _lock:
+        if _loaded["location"] == config_location and _loaded["signature"] == signature:
+            return _loaded["config"]
+
+        config = _read_config()
+
+        validate(config)
+
+        _loaded.update(
+            location=config_location, signature=signature, config=config, servers=_merge_servers(config.get("servers"))
+        )
+
+        return config
+
+
+def _read_config():
+    """returns a new dictionary of the config file without validating it (creating one if it doesn't already exist)"""
+    if not exists(config_location):
+        create_default_config()
+
     with open(config_location, "r") as json_config_file:
         return loads(json_config_file.read())
 
 
-def get_config_prop(key):
-    """key: string
+def _merge_servers(servers):
+    """servers: dictionary - the servers config value
 
-    returns the config value for the specified key
+    returns a new dictionary of the servers with the `options` merged into each server
     """
-    if key.lower() != "servers":
-        return _get_config()[key]
-
-    servers = _get_config()[key]
-
     if servers is None or len(servers) == 0:
-        log.info("no servers defined in config")
         return {}
 
     if "options" not in servers.keys():
         return servers
 
-    options = servers.pop("options")
+    options = servers["options"]
+    merged = {}
     for key, item in servers.items():
+        if key == "options":
+            continue
+
         temp = options.copy()
         temp.update(item)
-        servers[key] = temp
+        merged[key] = temp
+
+    return merged
+
+
+def get_config_prop(key, default=_no_default):
+    """key: string
+    default: any - an optional value to return if the key is not in the config
+
+    returns a copy of the config value for the specified key
+    """
+    config = _get_config()
+
+    if key.lower() != "servers":
+        if default is not _no_default:
+            return _copy(config.get(key, default))
+
+        return _copy(config[key])
+
+    if config is _loaded["config"]:
+        servers = _loaded["servers"]
+    else:
+        servers = _merge_servers(config[key])
+
+    if len(servers) == 0:
+        log.info("no servers defined in config")
+
+    return deepcopy(servers)
 
-    return servers
+
+def _copy(value):
+    """value: any
+
+    returns a copy of lists and dictionaries so that changing them doesn't change the cached config
+    """
+    if isinstance(value, (list, dict)):
+        return deepcopy(value)
+
+    return value
 
 
 def set_config_prop(key, value, override=False):
@@ -94,11 +254,12 @@ def set_config_prop(key, value, override=False):
     value: any
     override: boolean
 
-    Sets the key for the config to the passed in value.
+    Sets the key for the config to the passed in value. The file is read without validating it so that an invalid
+    value can be replaced and the changed config is validated before it is written.
 
     returns a string describing the results
     """
-    config = _get_config()
+    config = _read_config()
 
     if key not in config:
         return "{} not found in config.".format(key)
@@ -120,7 +281,11 @@ def set_config_prop(key, value, override=False):
     else:
         config[key] = value
 
+    validate(config)
+
     with open(config_location, "w") as json_config_file:
         json_config_file.write(dumps(config, sort_keys=True, indent=2, separators=(",", ": ")))
 
+    clear_cache()
+
     return "Added {} to {}".format(value, key)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+connections.py
+
+A module that keeps enterprise geodatabase connections warm while crates are being processed
+"""
+
+import logging
+from threading import Lock
+from time import perf_counter
+from urllib.parse import urlparse
+
+from . import seat
+
+arcpy = seat.lazy_import("arcpy")
+log = logging.getLogger("forklift")
+
+#: fragments of geoprocessing messages that indicate that a schema lock was encountered
+schema_lock_messages = ["schema lock", "000464"]
+#: the host names of connection files keyed by the connection file path
+hosts_cache = {}
+
+
+def is_schema_lock(message):
+    """message: string
+
+    returns True if the message describes a schema lock
+    """
+    if message is None:
+        return False
+
+    message = str(message).lower()
+
+    return any(fragment in message for fragment in schema_lock_messages)
+
+
+def is_connection_file(workspace):
+    """workspace: string
+
+    returns True if the workspace is an enterprise geodatabase connection file
+    """
+    return workspace is not None and workspace.lower().endswith(".sde")
+
+
+def get_source_host(crate):
+    """crate: Crate
+
+    returns the lower-cased name of the server that the crate's source data is read from
+    or None if the data is not on a remote server
+    """
+    if crate.source.lower().startswith("http"):
+        return urlparse(crate.source).hostname
+
+    if not is_connection_file(crate.source_workspace):
+        return None
+
+    if crate.source_workspace not in hosts_cache:
+        try:
+            properties = arcpy.Describe(crate.source_workspace).connectionProperties
+            #: the instance looks like sde:sqlserver:host\instance for direct connections
+            host = getattr(properties, "instance", None) or getattr(properties, "server", None)
+            hosts_cache[crate.source_workspace] = host.split(":")[-1].lower()
+        except Exception as e:
+            log.warning("could not find the host for %s: %s", crate.source_workspace, e)
+            hosts_cache[crate.source_workspace] = crate.source_workspace
+
+    return hosts_cache[crate.source_workspace]
+
+
+class ConnectionManager(object):
+    """Tracks the crates that are queued for each source workspace so that the arcpy workspace cache is
+    only cleared once all of a workspace's crates are finished or a schema lock is detected rather than
+    after every crate.
+    """
+
+    def __init__(self, crates=None):
+        #: the number of crates that are still queued for each source workspace
+        self.pending = {}
+        #: the workspaces that currently have a warm connection
+        self.connected = set()
+        #: the total seconds spent establishing connections to each source workspace
+        self.connect_times = {}
+        #: crates may be processed on multiple threads
+        self._lock = Lock()
+
+        for crate in crates or []:
+            self.queue(crate.source_workspace)
+
+    def queue(self, workspace):
+        """workspace: string
+
+        Records that a crate from `workspace` is waiting to be processed
+        """
+        if not is_connection_file(workspace):
+            return
+
+        with self._lock:
+            self.pending[workspace] = self.pending.get(workspace, 0) + 1
+
+    def open(self, workspace):
+        """workspace: string
+
+        Connects to the workspace if it was queued and there is not already a warm connection and records the time it
+        took
+        """
+        if workspace not in self.pending or workspace in self.connected:
+            return
+
+        start_seconds = perf_counter()
+        arcpy.Exists(workspace)
+        seconds = perf_counter() - start_seconds
+
+        with self._lock:
+            self.connected.add(workspace)
+            self.connect_times[workspace] = self.connect_times.get(workspace, 0) + seconds
+
+        log.debug("connected to %s in %s", workspace, seat.format_time(seconds))
+
+    def release(self, workspace, result=(None, None)):
+        """workspace: string
+        result: (string, string) - the result of processing the crate
+
+        Records that a crate from `workspace` is finished and clears the workspace cache if there
+        are no more crates queued for it or if a schema lock was detected
+        """
+        if workspace not in self.pending:
+            return
+
+        with self._lock:
+            remaining = max(self.pending.get(workspace, 0) - 1, 0)
+            self.pending[workspace] = remaining
+
+        if is_schema_lock(result[1]):
+            log.info("schema lock detected, clearing the workspace cache for %s", workspace)
+            self.clear(workspace)
+        elif remaining == 0:
+            log.debug("finished with %s, clearing the workspace cache", workspace)
+            self.clear(workspace)
+
+    def clear(self, workspace=None):
+        """workspace: string - optional, all workspaces are cleared if this is not passed
+
+        Clears the arcpy workspace cache so that the next crate reconnects
+        """
+        if workspace is None:
+            arcpy.ClearWorkspaceCache_management()
+            self.connected.clear()
+
+            return
+
+        arcpy.ClearWorkspaceCache_management(workspace)
+        self.connected.discard(workspace)
+
+    def get_report(self):
+        """Returns a dictionary of the formatted connect times for each workspace"""
+        return {workspace: seat.format_time(seconds) for workspace, seconds in self.connect_times.items()}
@@ -6,17 +6,19 @@ core.py
 Tools for updating the data associated with a models.Crate
 """
 
+from contextlib import nullcontext
+from itertools import islice
 from os import path
+from time import perf_counter
 
-from arcgisscripting import ExecuteError
 from xxhash import xxh64
 
-import arcpy
-
+from . import config, progress, seat
 from .config import config_location
 from .exceptions import ValidationException
-from .models import Changes, Crate
+from .models import Changes, Crate, RowCapture
 
+arcpy = seat.lazy_import("arcpy")
 log = None
 
 reproject_temp_suffix = "_fl"
@@ -34,6 +36,13 @@ scratch_gdb_path = path.join(garage, _scratch_gdb)
 
 shape_field_index = -2
 
+#: the default estimated size of the rows that are captured for a crate before they are dropped
+default_capture_max_bytes = 256 * 1024 * 1024
+
+#: the most hashes in the where clause of each delete so that large edit chunks don't go over the sql limits of
+#: the destination database
+max_where_hashes = 500
+
 
 def init(logger):
     """
@@ -51,7 +60,7 @@ def init(logger):
         log.info("%s exists, deleting", scratch_gdb_path)
         try:
             arcpy.Delete_management(scratch_gdb_path)
-        except ExecuteError:
+        except arcpy.ExecuteError:
             #: swallow error thrown by Pro 2.0
             pass
 
@@ -75,6 +84,9 @@ def update(crate, validate_crate, change_detection):
     """
     arcpy.env.geographicTransformations = crate.geographic_transformation
     change_status = (Crate.NO_CHANGES, None)
+    crate.adds = crate.deletes = None
+    crate.phase_times = {}
+    start_seconds = perf_counter()
 
     try:
         if not arcpy.Exists(crate.destination):
@@ -91,24 +103,38 @@ def update(crate, validate_crate, change_detection):
         except Exception as e:
             log.warning("validation error: %s for crate %r", e, crate, exc_info=True)
             return (Crate.INVALID_DATA, str(e))
+        finally:
+            start_seconds = _add_phase_time(crate, "validate", start_seconds)
 
         #: use change detection data if it exists for this table
         if change_detection.has_table(crate.source_name):
             if change_detection.has_changed(crate.source_name) or change_status[0] == Crate.CREATED:
-                return change_detection.update(crate)
+                try:
+                    return change_detection.update(crate)
+                finally:
+                    _add_phase_time(crate, "truncate and load", start_seconds)
             else:
                 return change_status
         else:
             #: create source hash and store
             changes = _hash(crate)
+            crate.total_rows = changes.total_rows
+            crate.adds = len(changes.adds)
+            crate.deletes = len(changes._deletes)
+            start_seconds = _add_phase_time(crate, "hash", start_seconds)
 
         if changes.has_changes():
             if "hasGlobalID" in crate.source_describe and crate.source_describe["hasGlobalID"]:
                 update_while_preserving_global_ids(crate)
                 change_status = (Crate.UPDATED, None)
             else:
+                #: with a chunk size each chunk is committed in its own edit session so that a failure only rolls back
+                #: the current chunk. The next update picks up where it left off because the hashes of the committed
+                #: rows are already in the destination.
+                chunk_size = config.get_config_prop("editChunkSize", None)
+
                 log.debug("starting edit session...")
-                with arcpy.da.Editor(crate.destination_workspace):
+                with nullcontext() if chunk_size else arcpy.da.Editor(crate.destination_workspace):
                     #: delete un-accessed hashes
                     if changes.has_deletes():
                         log.debug("number of rows to be deleted: %d", len(changes._deletes))
@@ -117,10 +143,7 @@ def update(crate, validate_crate, change_detection):
                             change_status = (Crate.UPDATED, None)
 
                         log.debug("deleting from destination table")
-                        with arcpy.da.UpdateCursor(crate.destination, hash_field) as cursor:
-                            for row in cursor:
-                                if row[0] in changes._deletes:
-                                    cursor.deleteRow()
+                        _delete_rows(crate, changes._deletes, chunk_size)
 
                     #: add new/updated rows
                     if changes.has_adds():
@@ -139,20 +162,12 @@ def update(crate, validate_crate, change_detection):
                                 in_coor_system=crate.source_describe["spatialReference"],
                             )[0]
 
-                        #: cache this so we don't have to call it for every record
-                        is_table = crate.is_table()
-                        if not is_table:
+                        if not crate.is_table():
                             changes.fields[shape_field_index] = changes.fields[shape_field_index].rstrip("WKT")
 
-                        with arcpy.da.SearchCursor(changes.table, changes.fields) as add_cursor, arcpy.da.InsertCursor(
-                            crate.destination, changes.fields
-                        ) as cursor:
-                            for row in add_cursor:
-                                #: skip null geometries
-                                if not is_table and row[shape_field_index] is None:
-                                    continue
+                        _insert_rows(crate, changes, chunk_size)
 
-                                cursor.insertRow(row)
+            start_seconds = _add_phase_time(crate, "edit", start_seconds)
 
             if changes.has_dups:
                 change_status = (Crate.UPDATED_OR_CREATED_WITH_WARNINGS, "duplicate features detected!")
@@ -164,6 +179,7 @@ def update(crate, validate_crate, change_detection):
 
         #: sanity check the row counts between source and destination
         count_status = _check_counts(crate, changes)
+        _add_phase_time(crate, "check counts", start_seconds)
 
         return count_status or change_status
     except Exception as e:
@@ -171,21 +187,121 @@ def update(crate, validate_crate, change_detection):
 
         return (Crate.UNHANDLED_EXCEPTION, str(e))
     finally:
+        #: the workspace cache is managed by connections.ConnectionManager so that connections stay warm between crates
         arcpy.ResetEnvironments()
-        arcpy.ClearWorkspaceCache_management()
 
 
-def _hash(crate):
+def _add_phase_time(crate, phase, start_seconds):
     """crate: Crate
+    phase: string - the name of the part of the update that finished
+    start_seconds: number - the perf_counter value when the phase started
 
-    returns a Changes model with deltas for the source
+    records the seconds that the phase took on the crate for the history
+
+    returns the perf_counter value to start the next phase from
+    """
+    now = perf_counter()
+    crate.phase_times[phase] = now - start_seconds
+
+    return now
+
+
+def _delete_rows(crate, hashes, chunk_size=None):
+    """crate: Crate
+    hashes: dictionary - the hashes of the rows to delete
+    chunk_size: int - the number of rows to delete in each edit session. All rows are deleted in the current edit
+        session if None
+
+    deletes the rows with matching hashes from the destination. The rows of each edit session are deleted with where
+    clauses of at most `max_where_hashes` hashes
+    """
+    if not chunk_size:
+        with arcpy.da.UpdateCursor(crate.destination, hash_field) as cursor:
+            for row in cursor:
+                if row[0] in hashes:
+                    cursor.deleteRow()
+
+        return
+
+    for number, chunk in enumerate(_chunk(hashes, chunk_size), 1):
+        with arcpy.da.Editor(crate.destination_workspace):
+            for where_hashes in _chunk(chunk, max_where_hashes):
+                where = "{} IN ({})".format(hash_field, ", ".join("'{}'".format(digest) for digest in where_hashes))
+
+                with arcpy.da.UpdateCursor(crate.destination, hash_field, where) as cursor:
+                    for _ in cursor:
+                        cursor.deleteRow()
+
+        log.debug("committed delete chunk %d (%d rows)", number, len(chunk))
+
+
+def _insert_rows(crate, changes, chunk_size=None):
+    """crate: Crate
+    changes: Changes - the changes with the table of rows to add
+    chunk_size: int - the number of rows to insert in each edit session. All rows are inserted in the current edit
+        session if None
+
+    inserts the rows from the changes table into the destination skipping null geometries
+    """
+    #: cache this so we don't have to call it for every record
+    is_table = crate.is_table()
+
+    with arcpy.da.SearchCursor(changes.table, changes.fields) as add_cursor:
+        #: skip null geometries
+        rows = (row for row in add_cursor if is_table or row[shape_field_index] is not None)
+
+        if not chunk_size:
+            with arcpy.da.InsertCursor(crate.destination, changes.fields) as cursor:
+                for inserted, row in enumerate(rows, 1):
+                    cursor.insertRow(row)
+
+                    if inserted % progress.row_interval == 0:
+                        progress.tracker.set_rows(crate, "insert", inserted)
+
+            return
+
+        inserted = 0
+        for number, chunk in enumerate(_chunk(rows, chunk_size), 1):
+            with arcpy.da.Editor(crate.destination_workspace):
+                with arcpy.da.InsertCursor(crate.destination, changes.fields) as cursor:
+                    for row in chunk:
+                        cursor.insertRow(row)
+                        inserted += 1
+
+                        if inserted % progress.row_interval == 0:
+                            progress.tracker.set_rows(crate, "insert", inserted)
+
+            log.debug("committed insert chunk %d (%d rows)", number, len(chunk))
+
+
+def _chunk(items, size):
+    """items: iterable
+    size: int
+
+    yields lists of up to size items
+    """
+    iterator = iter(items)
+
+    while True:
+        chunk = list(islice(iterator, size))
+
+        if len(chunk) == 0:
+            return
+
+        yield chunk
+
+
+def _get_hash_fields(crate):
+    """crate: Crate
+
+    returns the common fields between the source and destination that are hashed followed by the shape token for
+    feature classes and the hash field
     """
     shape_token = "SHAPE@WKT"
 
-    log.info("checking for changes...")
     #: finding and filtering common fields between source and destination
     fields = set([fld.name for fld in arcpy.ListFields(crate.destination)]) & set(
-        [fld.name for fld in arcpy.ListFields(crate.source)]
+        [fld.name for fld in crate.source_describe["fields"]]
     )
     fields = _filter_fields(fields)
 
@@ -193,8 +309,78 @@ def _hash(crate):
         fields.append(shape_token)
     fields.append(hash_field)
 
+    return fields
+
+
+def _get_row_hash(row, is_table):
+    """row: tuple - a row from the source with the WKT of the shape as the last value for feature classes
+    is_table: boolean
+
+    returns the xxh64 hash of the row
+    """
+    if is_table:
+        return xxh64(str(row))
+
+    #: do this in two parts to prevent creating an unnecessary copy of the WKT
+    row_hash = xxh64(str(row[:-1]))
+    row_hash.update(row[-1])
+
+    return row_hash
+
+
+def get_hash_diff(crate):
+    """crate: Crate
+
+    Compares the hashes of the source rows with the hashes in the destination the same way as `_hash` without
+    writing to the scratch geodatabase or the destination. Used to plan a lift.
+
+    returns a Changes model with the adds, deletes, and total rows of the source
+    """
+    fields = _get_hash_fields(crate)
+    changes = Changes(list(fields))
+    attribute_hashes = _get_hash_lookups(crate.destination)
+    is_table = crate.is_table()
+
+    with arcpy.da.SearchCursor(crate.source, [field for field in fields if field != hash_field]) as cursor:
+        for row in cursor:
+            if not is_table and row[-1] is None:
+                continue
+
+            changes.total_rows += 1
+
+            row_hash = _get_row_hash(row, is_table)
+            digest = row_hash.hexdigest()
+
+            while digest in changes.adds or digest in changes.unchanged:
+                changes.has_dups = True
+                row_hash.update(digest)
+                digest = row_hash.hexdigest()
+
+            if digest not in attribute_hashes:
+                changes.adds[digest] = None
+            else:
+                attribute_hashes.pop(digest)
+                changes.unchanged[digest] = None
+
+    changes.determine_deletes(attribute_hashes)
+
+    return changes
+
+
+def _hash(crate):
+    """crate: Crate
+
+    returns a Changes model with deltas for the source
+    """
+    log.info("checking for changes...")
+    fields = _get_hash_fields(crate)
+
     changes = Changes(list(fields))
 
+    capture = None
+    if crate.capture is not None:
+        capture = RowCapture(list(fields), config.get_config_prop("captureMaxBytes", default_capture_max_bytes))
+
     attribute_hashes = _get_hash_lookups(crate.destination)
     total_rows = 0
 
@@ -214,7 +400,7 @@ def _hash(crate):
         )[0]
     else:
         changes.table = arcpy.CreateTable_management(scratch_gdb_path, crate.name)[0]
-        _mirror_fields(crate.source, changes.table)
+        _mirror_fields(crate.source_describe["fields"], changes.table)
 
     #: there's a possibility that source has a hash field already, e.g. harvesting ogm data from AGOL
     if hash_field not in [field.name for field in crate.source_describe["fields"]]:
@@ -227,6 +413,9 @@ def _hash(crate):
         for row in cursor:
             total_rows += 1
 
+            if total_rows % progress.row_interval == 0:
+                progress.tracker.set_rows(crate, "hash", total_rows)
+
             if not crate.is_table():
                 #: skip features with empty geometry
                 if row[-1] is None:
@@ -234,12 +423,7 @@ def _hash(crate):
                     total_rows -= 1
                     continue
 
-                #: do this in two parts to prevent creating an unnecessary copy of the WKT
-                row_hash = xxh64(str(row[:-1]))
-                row_hash.update(row[-1])
-            else:
-                row_hash = xxh64(str(row))
-
+            row_hash = _get_row_hash(row, crate.is_table())
             digest = row_hash.hexdigest()
 
             #: check for duplicate hashes
@@ -255,15 +439,30 @@ def _hash(crate):
                 insert_cursor.insertRow(row + (digest,))
                 #: add to adds
                 changes.adds[digest] = None
+
+                if capture is not None:
+                    capture.add(row + (digest,), True)
             else:
                 #: remove not modified hash from hashes
                 attribute_hashes.pop(digest)
 
                 changes.unchanged[digest] = None
 
+                if capture is not None and crate.capture == Crate.CAPTURE_ALL:
+                    capture.add(row + (digest,), False)
+
     changes.determine_deletes(attribute_hashes)
     changes.total_rows = total_rows
 
+    if capture is not None:
+        if capture.overflowed:
+            log.warning("captured rows for %s are larger than captureMaxBytes and were dropped", crate.destination_name)
+            capture = None
+        else:
+            capture.deletes = list(changes._deletes)
+
+    crate.captured = capture
+
     if has_dups:
         log.warning("duplicate features detected!")
         changes.has_dups = True
@@ -294,7 +493,7 @@ def _create_destination_data(crate, skip_hash_field=False):
     if crate.is_table():
         log.warning("creating new table: %s", crate.destination)
         arcpy.CreateTable_management(crate.destination_workspace, crate.destination_name)
-        _mirror_fields(crate.source, crate.destination)
+        _mirror_fields(crate.source_describe["fields"], crate.destination)
     else:
         log.warning("creating new feature class: %s", crate.destination)
         arcpy.CreateFeatureclass_management(
@@ -337,10 +536,10 @@ def check_schema(crate):
     returns: Boolean - True if the schemas match, raises ValidationException if no match
     """
 
-    def get_fields(dataset, describe):
+    def get_fields(fields, describe):
         field_dict = {}
 
-        for field in arcpy.ListFields(dataset):
+        for field in fields:
             #: don't worry about comparing managed fields
             if not _is_nonhashable_field(field.name, describe):
                 field_dict[field.name] = field
@@ -356,8 +555,10 @@ def check_schema(crate):
     log.info("checking schema...")
     missing_fields = []
     mismatching_fields = []
-    source_fields = get_fields(crate.source, crate.source_describe)
-    destination_fields = get_fields(crate.destination, arcpy.da.Describe(crate.destination))
+    #: the source fields come from the cached describe of the source
+    source_fields = get_fields(crate.source_describe["fields"], crate.source_describe)
+    destination_describe = arcpy.da.Describe(crate.destination)
+    destination_fields = get_fields(destination_describe["fields"], destination_describe)
 
     for field_key in list(destination_fields.keys()):
         if field_key == hash_field:
@@ -468,12 +669,12 @@ def _check_counts(crate, changes):
     return None
 
 
-def _mirror_fields(source, destination):
+def _mirror_fields(fields, destination):
     """
-    source: string - path to table
+    fields: arcpy.Field[] - the fields of the source table from its describe
     destination: string - path to table
 
-    adds all of the fields in source to destination
+    adds all of the fields to destination
     """
     TYPES = {
         "BigInteger": "BIGINTEGER",
@@ -492,7 +693,7 @@ def _mirror_fields(source, destination):
     }
 
     add_fields = []
-    for field in arcpy.da.Describe(source)["fields"]:
+    for field in fields:
         if field.type == "OID":
             continue
 
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+describes.py
+
+A module that caches the describes of crate sources and the listings of workspaces in memory and optionally in the
+garage between lifts
+"""
+
+import logging
+from collections import OrderedDict
+from os import stat
+from os.path import dirname, exists
+from threading import Lock, RLock
+
+from . import config, seat
+from .cache import PalletCache
+
+arcpy = seat.lazy_import("arcpy")
+log = logging.getLogger("forklift")
+#: the number of values that are kept in memory by each cache
+default_max_entries = 4096
+#: the properties of the fields in a describe that are kept in the garage
+field_properties = [
+    "name",
+    "aliasName",
+    "baseName",
+    "type",
+    "length",
+    "precision",
+    "scale",
+    "isNullable",
+    "required",
+    "editable",
+    "domain",
+    "defaultValue",
+]
+#: crates are resolved on multiple threads but only one of them should change arcpy.env.workspace at a time
+arcpy_env_lock = RLock()
+
+
+def get_signal(location):
+    """location: string - a path to a dataset or workspace
+
+    returns the modified time of the first part of the path that exists or None. A cached value is not used when this
+    changes. Datasets in geodatabases and .sde workspaces don't have a modified time of their own so they are not kept
+    in the garage. See `has_own_signal`.
+    """
+    while location:
+        try:
+            return stat(location).st_mtime_ns
+        except (OSError, ValueError):
+            if dirname(location) == location:
+                return None
+
+            location = dirname(location)
+
+    return None
+
+
+def has_own_signal(location):
+    """location: string - a path to a dataset or workspace
+
+    returns True if the location is a file or folder so that its modified time changes when it changes. Datasets in
+    geodatabases and .sde workspaces are not
+    """
+    try:
+        return exists(location)
+    except ValueError:
+        return False
+
+
+def serialize_describe(describe):
+    """describe: dictionary - the result of arcpy.da.Describe
+
+    returns a picklable copy of the describe with the spatial reference as a string and the fields as dictionaries.
+    Values that are other arcpy objects (e.g. extent or children) are not kept.
+    """
+    record = {key: value for key, value in describe.items() if isinstance(value, (str, int, float, bool, type(None)))}
+
+    if describe.get("spatialReference") is not None:
+        record["spatialReference"] = describe["spatialReference"].exportToString()
+
+    if "fields" in describe:
+        record["fields"] = [
+            {name: getattr(field, name) for name in field_properties if hasattr(field, name)}
+            for field in describe["fields"]
+        ]
+
+    return record
+
+
+def deserialize_describe(record):
+    """record: dictionary - the result of serialize_describe
+
+    returns a describe dictionary with arcpy spatial reference and field objects
+    """
+    describe = dict(record)
+
+    if record.get("spatialReference") is not None:
+        spatial_reference = arcpy.SpatialReference()
+        spatial_reference.loadFromString(record["spatialReference"])
+        describe["spatialReference"] = spatial_reference
+
+    if "fields" in record:
+        describe["fields"] = [_to_field(properties) for properties in record["fields"]]
+
+    return describe
+
+
+def _to_field(properties):
+    """properties: dictionary
+
+    returns an arcpy field with the properties
+    """
+    field = arcpy.Field()
+
+    for name, value in properties.items():
+        setattr(field, name, value)
+
+    return field
+
+
+class DescribeCache(object):
+    """A least recently used cache of describes or workspace listings keyed by lower case path.
+
+    When the `describeCacheSeconds` config value is set, values are also kept in the pallet cache in the garage for that
+    many seconds so that the next lift (or a crate worker process) doesn't need to describe or list the source again.
+    A value from the garage is not used if the modified time of its source changed. Values of locations without a
+    modified time of their own are only kept in memory which is cleared at the start of each lift.
+    """
+
+    def __init__(self, namespace, serialize=None, deserialize=None, max_entries=default_max_entries):
+        #: the namespace of the values in the garage cache
+        self.namespace = namespace
+        self.max_entries = max_entries
+        #: optional functions that are called with a value before it is kept in the garage and after it is read from
+        #: the garage
+        self._serialize = serialize
+        self._deserialize = deserialize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._store = None
+
+    def get(self, location):
+        """location: string - the path to the dataset or workspace
+
+        returns the cached value or None
+        """
+        key = location.lower()
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+                return self._entries[key]
+
+        store = self._get_store()
+        if store is None or not has_own_signal(location):
+            return None
+
+        stored = store.get(key)
+        if stored is None:
+            return None
+
+        signal, record = stored
+        if signal != get_signal(location):
+            log.debug("%s changed since it was cached", location)
+
+            return None
+
+        value = self._deserialize(record) if self._deserialize else record
+        self._remember(key, value)
+
+        return value
+
+    def set(self, location, value):
+        """location: string - the path to the dataset or workspace
+        value: any
+
+        caches the value in memory and in the garage if `describeCacheSeconds` is set and the location has its own
+        modified time
+        """
+        key = location.lower()
+        self._remember(key, value)
+
+        store = self._get_store()
+        if store is None or not has_own_signal(location):
+            return
+
+        try:
+            record = self._serialize(value) if self._serialize else value
+            store.set(key, (get_signal(location), record), config.get_config_prop("describeCacheSeconds"))
+        except Exception as e:
+            log.warning("could not cache %s in the garage: %s", location, e)
+
+    def clear(self):
+        """removes the values from memory"""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, location):
+        with self._lock:
+            return location.lower() in self._entries
+
+    def _remember(self, key, value):
+        """key: string
+        value: any
+
+        keeps the value in memory and removes the least recently used values over `max_entries`
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_store(self):
+        """returns the pallet cache in the garage or None if `describeCacheSeconds` is not set"""
+        if not config.get_config_prop("describeCacheSeconds", None):
+            return None
+
+        if self._store is None:
+            self._store = PalletCache(self.namespace)
+
+        return self._store
+
+
+#: the describes of crate sources
+describes_cache = DescribeCache("forklift.describes", serialize_describe, deserialize_describe)
+#: the feature class and table names of .sde workspaces
+names_cache = DescribeCache("forklift.names")
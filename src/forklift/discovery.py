@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+discovery.py
+
+A module that finds the pallet files in the warehouse and keeps an index of them in the garage so that pallet modules
+don't need to be imported to find out which classes they contain
+"""
+
+import ast
+import builtins
+import json
+import logging
+from os import replace, sep, stat, walk
+from os.path import dirname, exists, isdir, join
+from re import compile
+
+from . import config
+
+log = logging.getLogger("forklift")
+index_file_name = "pallet-index.json"
+pallet_file_regex = compile(r"pallet.*\.py$")
+#: folders that are never searched for pallets in addition to the `ignoredFolders` config value
+ignored_folders = [".git", ".github", ".vscode", ".env", ".pytest_cache", "__pycache__", "node_modules"]
+#: folders with these extensions contain data rather than code
+ignored_extensions = (".gdb",)
+
+
+def get_index_location():
+    """returns the path to the pallet index in the garage"""
+    return join(dirname(config.config_location), index_file_name)
+
+
+def find_pallet_classes(file_path):
+    """file_path: string - the path to a python file
+
+    Parses the file without importing it and finds the classes that could be pallets. A class could be a pallet if it
+    inherits from a class that is imported or a class in the same file that could be a pallet. Classes that only
+    inherit from builtins like `object` are not pallets.
+
+    returns a sorted list of class names or None if the file could not be parsed
+    """
+    try:
+        with open(file_path, "rb") as source:
+            tree = ast.parse(source.read(), file_path)
+    except (SyntaxError, ValueError, OSError) as e:
+        log.debug("could not parse %s: %s", file_path, e)
+
+        return None
+
+    local_classes = set()
+    pallets = set()
+
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        for base in node.bases:
+            if isinstance(base, ast.Attribute):
+                pallets.add(node.name)
+            elif isinstance(base, ast.Name) and (
+                base.id.endswith("Pallet")
+                or base.id in pallets
+                or (base.id not in local_classes and not hasattr(builtins, base.id))
+            ):
+                pallets.add(node.name)
+
+        local_classes.add(node.name)
+
+    return sorted(pallets)
+
+
+class PalletIndex(object):
+    """An index of the pallet files in a folder and the classes that could be pallets in each file. A file is parsed
+    again when its modified time or size changes or when the `HEAD` of the git repository that contains it moves.
+    """
+
+    def __init__(self, location=None):
+        self.location = location or get_index_location()
+        #: the git HEAD of each repository keyed by the repository folder
+        self.heads = {}
+        #: the modified time, size, and class names of each pallet file keyed by the file path
+        self.files = {}
+        self._changed = False
+
+        self._load()
+
+    def find(self, folder):
+        """folder: string - the folder to search
+
+        walks the folder for pallet files skipping folders that can't contain pallets
+
+        returns a list of (file path, class names) tuples. The class names are None if the file could not be parsed
+        """
+        found = []
+        ignored = set(ignored_folders + config.get_config_prop("ignoredFolders", []))
+
+        for root, folders, files in walk(folder):
+            if ".git" in folders:
+                self._check_head(root)
+
+            folders[:] = sorted(
+                name for name in folders if name not in ignored and not name.lower().endswith(ignored_extensions)
+            )
+
+            for file_name in sorted(files):
+                if pallet_file_regex.search(file_name.lower()):
+                    file_path = join(root, file_name)
+                    found.append((file_path, self._get_classes(file_path)))
+
+        self._remove_missing(folder, set(file_path for file_path, _ in found))
+        self.save()
+
+        return found
+
+    def save(self):
+        """writes the index to the garage if it changed"""
+        if not self._changed:
+            return
+
+        temp = self.location + ".tmp"
+        with open(temp, "w", encoding="utf-8") as index_file:
+            json.dump({"heads": self.heads, "files": self.files}, index_file)
+
+        replace(temp, self.location)
+        self._changed = False
+
+    def _get_classes(self, file_path):
+        """file_path: string
+
+        returns the class names of the file from the index or parses the file if it changed
+        """
+        stats = stat(file_path)
+        entry = self.files.get(file_path)
+
+        if entry is not None and entry["mtime"] == stats.st_mtime_ns and entry["size"] == stats.st_size:
+            return entry["classes"]
+
+        classes = find_pallet_classes(file_path)
+        self.files[file_path] = {"mtime": stats.st_mtime_ns, "size": stats.st_size, "classes": classes}
+        self._changed = True
+
+        return classes
+
+    def _check_head(self, repository):
+        """repository: string - a folder containing a .git folder
+
+        removes the files in the repository from the index if its HEAD moved
+        """
+        head = _get_head(repository)
+
+        if self.heads.get(repository) == head:
+            return
+
+        log.debug("%s has a new HEAD, reindexing its pallets", repository)
+
+        self._remove_missing(repository, set())
+        self.heads[repository] = head
+        self._changed = True
+
+    def _remove_missing(self, folder, file_paths):
+        """folder: string
+        file_paths: set - the files to keep
+
+        removes the files in the folder that are not in `file_paths` from the index
+        """
+        prefix = folder.rstrip(sep) + sep
+
+        for file_path in [path for path in self.files if path.startswith(prefix) and path not in file_paths]:
+            del self.files[file_path]
+            self._changed = True
+
+    def _load(self):
+        """reads the index from the garage"""
+        if not exists(self.location):
+            return
+
+        try:
+            with open(self.location, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+
+            self.heads = index["heads"]
+            self.files = index["files"]
+        except (ValueError, KeyError) as e:
+            log.warning("the pallet index is invalid and will be rebuilt: %s", e)
+
+
+def _get_head(repository):
+    """repository: string - a folder containing a .git folder
+
+    returns the commit that HEAD points to or the contents of the HEAD file if the ref could not be read
+    """
+    git_folder = join(repository, ".git")
+    if not isdir(git_folder):
+        return None
+
+    try:
+        with open(join(git_folder, "HEAD"), encoding="utf-8") as head_file:
+            head = head_file.read().strip()
+    except OSError:
+        return None
+
+    if not head.startswith("ref: "):
+        return head
+
+    ref = head[len("ref: ") :]
+
+    try:
+        with open(join(git_folder, *ref.split("/")), encoding="utf-8") as ref_file:
+            return ref_file.read().strip()
+    except OSError:
+        pass
+
+    try:
+        with open(join(git_folder, "packed-refs"), encoding="utf-8") as packed_refs:
+            for line in packed_refs:
+                if line.rstrip().endswith(" " + ref):
+                    return line.split(" ")[0]
+    except OSError:
+        pass
+
+    return head
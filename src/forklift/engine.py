@@ -9,26 +9,30 @@ A module that contains the implementation of the cli commands
 import logging
 import socket
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from imp import load_source
 from json import dump, load
-from os import linesep, listdir, walk
+from os import environ, linesep, listdir
 from os.path import abspath, basename, dirname, exists, join, normpath, realpath, splitext
-from re import compile
 from shutil import copytree, rmtree
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired, run
 from time import perf_counter, sleep
 
 import pystache
 from colorama import Fore
 from colorama import init as colorama_init
-from git import Repo
 from requests import get
 
-from . import config, core, lift, seat
+from . import anomalies, config, core, discovery, history, lift, plan, progress, seat, supervisor
 from .arcgis import LightSwitch
 from .change_detection import ChangeDetection
 from .config import config_location, get_config_prop
+from .describes import describes_cache, names_cache
+from .journal import Journal
 from .messaging import send_email, send_to_slack
-from .models import Pallet
+from .models import Pallet, resolve_crates
 from .slack import lift_report_to_blocks, ship_report_to_blocks
 
 log = logging.getLogger("forklift")
@@ -36,10 +40,14 @@ lift_template = join(abspath(dirname(__file__)), "templates", "lift.html")
 ship_template = join(abspath(dirname(__file__)), "templates", "ship.html")
 speedtest_destination = join(dirname(realpath(__file__)), "..", "..", "speedtest", "data")
 packing_slip_file = "packing-slip.json"
+#: the number of repositories that are cloned or pulled at the same time
+default_git_workers = 4
+#: the seconds that a clone or pull is allowed to go without receiving any data
+default_git_timeout_seconds = 300
+#: the seconds that a repository is allowed to take to clone or pull
+default_git_repository_timeout_seconds = 900
 colorama_init()
 
-pallet_file_regex = compile(r"pallet.*\.py$")
-
 
 def init():
     """Creates the default config in the forklift-garage if it does not exists
@@ -92,11 +100,23 @@ def remove_repo(repo):
 
 
 def list_pallets():
-    """Finds all of the pallets in the warehouse
+    """Finds all of the pallets in the warehouse from the pallet index without importing the pallet files
 
-    returns an array of tuples where the tuple is a file path and a pallet instance
+    returns a tuple with the first value being an array of tuples consisting of the file path and the name of a class
+    that could be a pallet and the second value being the files that could not be parsed
     """
-    return _get_pallets_in_folder(config.get_config_prop("warehouse"))
+    pallets = []
+    parse_errors = []
+
+    for file_path, class_names in discovery.PalletIndex().find(config.get_config_prop("warehouse")):
+        if class_names is None:
+            parse_errors.append("pallet could not be parsed: {}".format(file_path))
+
+            continue
+
+        pallets.extend((file_path, class_name) for class_name in class_names)
+
+    return pallets, parse_errors
 
 
 def list_repos():
@@ -110,11 +130,15 @@ def list_repos():
     return validate_results
 
 
-def lift_pallets(file_path=None, pallet_arg=None, skip_git=False):
+def lift_pallets(file_path=None, pallet_arg=None, skip_git=False, resume=False, selectors=None):
     """
     file_path: string - an optional path to a pallet.py file
     pallet_arg: string - an optional argument to send to a pallet
     skip_git: boolean - an optional argument to skip git pulling all of the repositories
+    resume: boolean - an optional argument to continue the last lift if it did not finish
+    selectors: dictionary - optional `crate_pattern`, `destination_workspace`, and `only_failed` arguments for
+        `lift.select_crates`. Only the selected crates are updated and only their pallets are processed, dropped off,
+        and reported
 
     The first part of the forklift process. This method updates all of the github repositories, builds all of the pallets,
     prepares them for packaging,processes the crates, processes the pallets, drops off the data in the drop off location,
@@ -125,26 +149,75 @@ def lift_pallets(file_path=None, pallet_arg=None, skip_git=False):
     forklift hashes and the data is compressed and ready for production use.
 
     The drop off location data is deleted every time lift_pallets is run.
+
+    The progress of the lift is recorded in a journal in the garage. When resuming, git is skipped, the crates and
+    phases that finished are skipped, and the lift continues with the arguments of the previous run.
     """
     log.info("starting forklift")
 
+    #: a long running process (e.g. `forklift serve`) lifts many times and the sources may have changed in between
+    describes_cache.clear()
+    names_cache.clear()
+
+    journal = Journal()
+    if resume and journal.load():
+        log.info("resuming the last lift with %d finished crates", len(journal.crates))
+        file_path = journal.file_path
+        pallet_arg = journal.pallet_arg
+        selectors = journal.selectors
+        skip_git = True
+    else:
+        if resume:
+            log.info("there is not an unfinished lift to resume")
+
+        journal.start(file_path, pallet_arg, selectors)
+
+    _start_history_run("lift")
+    progress.tracker.start("lift")
+
     if not skip_git:
+        progress.tracker.set_phase("git_update")
+        start_process = perf_counter()
         git_errors = git_update()
+        _record_phase("git_update", perf_counter() - start_process)
     else:
         git_errors = []
 
     start_seconds = perf_counter()
 
     log.debug("building pallets")
+    progress.tracker.set_phase("build_pallets")
     pallets_to_lift, import_errors = build_pallets(file_path, pallet_arg)
 
-    log.debug("processing checklist")
-    lift.process_checklist(config)
+    destinations = None
+    if selectors:
+        pallets_to_lift, destinations = lift.select_crates(pallets_to_lift, **selectors)
+
+    progress.tracker.set_phase("resolve_crates")
+    start_process = perf_counter()
+    resolve_crates(
+        [
+            crate
+            for pallet in pallets_to_lift
+            for crate in pallet.get_crates()
+            if destinations is None or crate.destination in destinations
+        ],
+        config.get_config_prop("buildWorkers", 1),
+    )
+    log.info("resolve_crates time: %s", seat.format_time(perf_counter() - start_process))
+    _record_phase("resolve_crates", perf_counter() - start_process)
+
+    if "dropoff_data" not in journal.phases:
+        log.debug("processing checklist")
+        lift.process_checklist(config)
 
+    progress.tracker.set_phase("prepare_packaging_for_pallets")
     start_process = perf_counter()
     lift.prepare_packaging_for_pallets(pallets_to_lift)
     log.info("prepare_packaging_for_pallets time: %s", seat.format_time(perf_counter() - start_process))
+    _record_phase("prepare_packaging_for_pallets", perf_counter() - start_process)
 
+    progress.tracker.set_phase("process_crates")
     start_process = perf_counter()
     core.init(log)
 
@@ -153,33 +226,83 @@ def lift_pallets(file_path=None, pallet_arg=None, skip_git=False):
     except KeyError:
         change_tables = []
     change_detection = ChangeDetection(change_tables, dirname(config_location))
-    lift.process_crates_for(pallets_to_lift, core.update, change_detection)
-    log.info("process_crates time: %s", seat.format_time(perf_counter() - start_process))
+    on_processed = partial(journal.record_pallet_phase, phase="process")
+    ready_pallets = []
+    #: pallets are only processed while the remaining crates are updated when it is opted into because pallets may
+    #: read the destinations of other pallets
+    pipeline = None
+    if config.get_config_prop("pipelinePallets", False):
+        pipeline = lift.PalletPipeline(pallet_arg, on_processed)
+
+    def on_pallet_ready(pallet):
+        if (pallet.name, "process") in journal.pallet_phases:
+            log.info("skipping pallet that was processed before the resume: %r", pallet)
+            pallet.success = journal.pallet_phases[(pallet.name, "process")]
+
+            return
+
+        if pipeline is not None:
+            pipeline.put(pallet)
+        else:
+            ready_pallets.append(pallet)
 
-    start_process = perf_counter()
-    lift.process_pallets(pallets_to_lift)
+    with pipeline if pipeline is not None else nullcontext():
+        lift.process_crates_for(
+            pallets_to_lift, partial(_update_with_journal, journal), change_detection, on_pallet_ready, destinations
+        )
+        log.info("process_crates time: %s", seat.format_time(perf_counter() - start_process))
+        _record_phase("process_crates", perf_counter() - start_process)
+        progress.tracker.set_phase("process_pallets")
+        #: pallets that the pipeline processed while the crates were updated are part of the process_crates time
+        start_process = perf_counter()
+
+        if pipeline is None:
+            lift.process_pallets(
+                [pallet for pallet in pallets_to_lift if pallet in ready_pallets], pallet_arg, on_processed
+            )
     log.info("process_pallets time: %s", seat.format_time(perf_counter() - start_process))
+    _record_phase("process_pallets", perf_counter() - start_process)
+
+    if "dropoff_data" not in journal.phases:
+        progress.tracker.set_phase("dropoff_data")
+        start_process = perf_counter()
+        lift.dropoff_data(pallets_to_lift, config.get_config_prop("dropoffLocation"))
+        journal.record_phase("dropoff_data")
+        log.info("dropoff_data time: %s", seat.format_time(perf_counter() - start_process))
+        _record_phase(
+            "dropoff_data",
+            perf_counter() - start_process,
+            size=lift.get_size([config.get_config_prop("dropoffLocation")]),
+        )
 
-    start_process = perf_counter()
-    lift.dropoff_data(pallets_to_lift, config.get_config_prop("dropoffLocation"))
-    log.info("dropoff_data time: %s", seat.format_time(perf_counter() - start_process))
-
-    start_process = perf_counter()
-    lift.gift_wrap(config.get_config_prop("dropoffLocation"))
-    log.info("gift wrapping data time: %s", seat.format_time(perf_counter() - start_process))
+    if "gift_wrap" not in journal.phases:
+        progress.tracker.set_phase("gift_wrap")
+        start_process = perf_counter()
+        lift.gift_wrap(config.get_config_prop("dropoffLocation"))
+        journal.record_phase("gift_wrap")
+        log.info("gift wrapping data time: %s", seat.format_time(perf_counter() - start_process))
+        _record_phase("gift_wrap", perf_counter() - start_process)
 
     #: log process times for each pallet
     for pallet in pallets_to_lift:
         log.debug("processing times (in seconds) for %r: %s", pallet, pallet.processing_times)
+        _record_pallet_phases(pallet)
 
-    elapsed_time = seat.format_time(perf_counter() - start_seconds)
+    progress.tracker.set_phase("report")
+    seconds = perf_counter() - start_seconds
+    elapsed_time = seat.format_time(seconds)
     status = lift.get_lift_status(pallets_to_lift, elapsed_time, git_errors, import_errors)
+    status["anomalies"] = _find_anomalies()
 
     _generate_packing_slip(status, config.get_config_prop("dropoffLocation"))
 
     _send_report_email(lift_template, status, "Lifting", include_packing_slip=True)
     _send_report_to_slack(status, "Lifting")
 
+    journal.finish()
+    _finish_history_run(seconds, status["num_success_pallets"] == status["total_pallets"])
+    progress.tracker.finish()
+
     report = _generate_console_report(status)
     log.info("finished in {}.".format(elapsed_time))
 
@@ -188,6 +311,76 @@ def lift_pallets(file_path=None, pallet_arg=None, skip_git=False):
     return report
 
 
+def plan_lift(file_path=None, pallet_arg=None, selectors=None):
+    """
+    file_path: string - an optional path to a pallet.py file
+    pallet_arg: string - an optional argument to send to a pallet
+    selectors: dictionary - optional crate selectors for `lift.select_crates`
+
+    Builds the pallets and checks each crate for changes without updating git, preparing packaging, or writing to any
+    destination, drop off, or scratch data. The plan is written to the garage as json.
+
+    returns the plan dictionary
+    """
+    log.info("planning a lift")
+
+    pallets, import_errors = build_pallets(file_path, pallet_arg)
+
+    destinations = None
+    if selectors:
+        pallets, destinations = lift.select_crates(pallets, **selectors)
+
+    resolve_crates(
+        [
+            crate
+            for pallet in pallets
+            for crate in pallet.get_crates()
+            if destinations is None or crate.destination in destinations
+        ],
+        config.get_config_prop("buildWorkers", 1),
+    )
+
+    change_detection = ChangeDetection(
+        config.get_config_prop("changeDetectionTables", []), dirname(config_location), read_only=True
+    )
+    crate_plans = plan.plan_crates(pallets, change_detection, destinations)
+
+    lift_plan = {
+        "pallets": [pallet.name for pallet in pallets],
+        "crates": crate_plans,
+        "import_errors": import_errors,
+        "estimated_seconds": sum(crate_plan["estimated_seconds"] or 0 for crate_plan in crate_plans),
+    }
+
+    plan.save(lift_plan)
+
+    log.info("%s%s", linesep, plan.format_plan(lift_plan))
+    log.info("the plan was saved to %s", plan.get_plan_location())
+
+    return lift_plan
+
+
+def _update_with_journal(journal, crate, validate_crate, change_detection):
+    """journal: Journal
+    crate: Crate
+    validate_crate: Pallet.validate_crate
+    change_detection: ChangeDetection
+
+    Returns the result of the crate from the journal if it finished before the lift was resumed. Otherwise it updates
+    the crate (in a supervised worker process if it has a timeout) and records the result in the journal.
+    """
+    if crate.destination in journal.crates:
+        log.info("using the result from before the resume for crate: %s", crate.destination_name)
+        crate.resumed = True
+
+        return journal.crates[crate.destination]
+
+    result = supervisor.update(crate, validate_crate, change_detection, journal.pallet_arg)
+    journal.record_crate(crate, result)
+
+    return result
+
+
 def ship_data(pallet_arg=None, by_service=False):
     """pallet_arg: string - an optional value to pass to a pallet when it is being built
 
@@ -214,6 +407,8 @@ def ship_data(pallet_arg=None, by_service=False):
 
         return False
 
+    _start_history_run("ship")
+
     missing_packing_slip = False
     if packing_slip_file not in files_and_folders:
         missing_packing_slip = True
@@ -226,6 +421,7 @@ def ship_data(pallet_arg=None, by_service=False):
 
     server_reports = []
     all_failed_copies = {}
+    all_pallets = None
     start_process = perf_counter()
 
     if not ship_only:
@@ -261,6 +457,7 @@ def ship_data(pallet_arg=None, by_service=False):
             log.info(
                 "stopping %s time: %s", item_being_acted_upon, seat.format_time(perf_counter() - start_sub_process)
             )
+            _record_phase("stop", perf_counter() - start_sub_process, history.SERVER, switch.server_label)
 
             if status is False:
                 error_msg = "{} did not stop, skipping copy. {}".format(item_being_acted_upon, messages)
@@ -289,6 +486,13 @@ def ship_data(pallet_arg=None, by_service=False):
             all_failed_copies.update(failed_copies)
 
             log.info("copy data time: %s", seat.format_time(perf_counter() - start_sub_process))
+            _record_phase(
+                "copy",
+                perf_counter() - start_sub_process,
+                history.SERVER,
+                switch.server_label,
+                lift.get_size([join(pickup_location, item) for item in successful_copies]),
+            )
 
             log.info("starting (%s)", item_being_acted_upon)
             start_sub_process = perf_counter()
@@ -302,6 +506,7 @@ def ship_data(pallet_arg=None, by_service=False):
             log.info(
                 "starting %s time: %s", item_being_acted_upon, seat.format_time(perf_counter() - start_sub_process)
             )
+            _record_phase("start", perf_counter() - start_sub_process, history.SERVER, switch.server_label)
 
             if status is False:
                 error_msg = "{} did not restart. {}".format(item_being_acted_upon, messages)
@@ -319,17 +524,21 @@ def ship_data(pallet_arg=None, by_service=False):
 
             server_report["problem_services"] = switch.validate_service_state()
             log.info("validate service time: %s", seat.format_time(perf_counter() - start_sub_process))
+            _record_phase("validate", perf_counter() - start_sub_process, history.SERVER, switch.server_label)
             if len(server_report["problem_services"]) > 0:
                 server_report["success"] = False
                 server_report["has_service_issues"] = True
 
             server_reports.append(server_report)
         log.info("total copy time: %s", seat.format_time(perf_counter() - start_process))
+        #: the copy time of each server is recorded above so the total is the time of stopping, copying to, starting,
+        #: and validating all of the servers
+        _record_phase("update_servers", perf_counter() - start_process)
 
     pallet_reports = []
     if not missing_packing_slip:
         #: get affected pallets
-        pallets_to_ship = _process_packing_slip(None, pallet_arg)
+        pallets_to_ship = _process_packing_slip(None, pallet_arg, all_pallets)
 
         for pallet in pallets_to_ship:
             slip = pallet.slip
@@ -372,8 +581,10 @@ def ship_data(pallet_arg=None, by_service=False):
 
             slip["total_processing_time"] = seat.format_time(pallet.total_processing_time)
             pallet_reports.append(slip)
+            _record_pallet_phases(pallet)
 
-    elapsed_time = seat.format_time(perf_counter() - start_seconds)
+    seconds = perf_counter() - start_seconds
+    elapsed_time = seat.format_time(seconds)
     status = {
         "hostname": socket.gethostname(),
         "total_pallets": len(pallet_reports),
@@ -381,10 +592,16 @@ def ship_data(pallet_arg=None, by_service=False):
         "num_success_pallets": len([p for p in pallet_reports if p["success"]]),
         "server_reports": server_reports,
         "total_time": elapsed_time,
+        "anomalies": _find_anomalies(),
     }
 
     _send_report_email(ship_template, status, "Shipping")
     _send_report_to_slack(status, "Shipping")
+    _finish_history_run(
+        seconds,
+        status["num_success_pallets"] == status["total_pallets"]
+        and all(server_report["success"] for server_report in server_reports),
+    )
 
     report = _generate_ship_console_report(status)
 
@@ -490,6 +707,15 @@ def speedtest(pallet_location):
     )
 
 
+def stats(crate_pattern=None, days=None):
+    """crate_pattern: string - an optional glob pattern of crate names to show every run of
+    days: string - an optional number of days of history to include
+
+    returns the trends, percentiles, and slowest crates from the lift and ship history as a console report
+    """
+    return history.format_stats(history.get_stats(crate_pattern, days))
+
+
 def scorched_earth():
     """removes all of the hashed data sets from the config hashLocation property folder
 
@@ -515,10 +741,20 @@ def git_update():
         log.info("no repositories to update")
         return []
 
-    errors = []
-    for repo in repositories:
-        error, info = _clone_or_pull_repo(repo)
+    workers = min(config.get_config_prop("gitWorkers", default_git_workers), len(repositories))
+    clone_or_pull = partial(
+        _clone_or_pull_repo,
+        timeout=config.get_config_prop("gitTimeoutSeconds", default_git_timeout_seconds),
+        repository_timeout=config.get_config_prop(
+            "gitRepositoryTimeoutSeconds", default_git_repository_timeout_seconds
+        ),
+    )
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="git") as executor:
+        results = list(executor.map(clone_or_pull, repositories))
 
+    errors = []
+    for error, info in results:
         if info is not None:
             log.info(info)
         if error is not None:
@@ -589,32 +825,51 @@ def build_pallets(file_path, pallet_arg=None):
         if import_error is not None:
             import_errors.append(import_error)
     else:
-        pallet_infos, import_errors = list_pallets()
-
-    pallets = []
-    for _, PalletClass in pallet_infos:
-        try:
-            if pallet_arg is not None:
-                pallet = PalletClass(pallet_arg)
-            else:
-                pallet = PalletClass()
+        pallet_infos, import_errors = _get_pallets_in_folder(config.get_config_prop("warehouse"))
 
-            try:
-                log.debug("building pallet: %r", pallet)
-                pallet.build(config.get_config_prop("configuration"))
-            except Exception as e:
-                pallet.success = (False, str(e))
-                log.error("error building pallet: %s for pallet: %r", e, pallet, exc_info=True)
+    configuration = config.get_config_prop("configuration")
+    build = partial(_build_pallet, pallet_arg=pallet_arg, configuration=configuration)
+    workers = config.get_config_prop("buildWorkers", 1)
 
-            pallets.append(pallet)
-        except Exception as e:
-            log.error("error creating pallet class: %s. %s", PalletClass.__name__, e, exc_info=True)
+    if workers > 1 and len(pallet_infos) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="build") as executor:
+            built = list(executor.map(build, [PalletClass for _, PalletClass in pallet_infos]))
+    else:
+        built = [build(PalletClass) for _, PalletClass in pallet_infos]
 
+    pallets = [pallet for pallet in built if pallet is not None]
     pallets.sort(key=lambda p: p.__class__.__name__)
 
     return pallets, import_errors
 
 
+def _build_pallet(PalletClass, pallet_arg, configuration):
+    """PalletClass: class - a class that inherits from Pallet
+    pallet_arg: string - an optional string to send to the constructor of the pallet
+    configuration: string - the configuration that is passed to build
+
+    returns the built pallet or None if the pallet could not be created
+    """
+    try:
+        if pallet_arg is not None:
+            pallet = PalletClass(pallet_arg)
+        else:
+            pallet = PalletClass()
+
+        try:
+            log.debug("building pallet: %r", pallet)
+            pallet.build(configuration)
+        except Exception as e:
+            pallet.success = (False, str(e))
+            log.error("error building pallet: %s for pallet: %r", e, pallet, exc_info=True)
+
+        return pallet
+    except Exception as e:
+        log.error("error creating pallet class: %s. %s", PalletClass.__name__, e, exc_info=True)
+
+        return None
+
+
 def _generate_packing_slip(status, location):
     """
     status: report object
@@ -632,9 +887,13 @@ def _generate_packing_slip(status, location):
         dump(status, slip, indent=2)
 
 
-def _process_packing_slip(packing_slip=None, pallet_arg=None):
+def _process_packing_slip(packing_slip=None, pallet_arg=None, built_pallets=None):
     """packing_slip: string - an optional packing slip to process otherwise the default location will be used
     pallet_arg: string - an optional string to send to the constructor of a pallet
+    built_pallets: Pallet[] - optional pallets that have already been built e.g. by `ship --by-service`
+
+    Each pallet file is imported once and only the pallet classes in the packing slip are built. The crate results
+    are restored from the packing slip so the sources of the crates are not described.
 
     returns all of the pallets referenced by the packing slip
     """
@@ -646,19 +905,103 @@ def _process_packing_slip(packing_slip=None, pallet_arg=None):
 
     log.info("packing slip contents: %s", packing_slip)
 
+    items = [item for item in packing_slip if item["success"] or item["ship_on_fail"]]
+    pallets_by_name = {pallet.name: pallet for pallet in built_pallets or []}
+
+    class_names_by_file = {}
+    for item in items:
+        if item["name"] not in pallets_by_name:
+            file_path, _, class_name = item["name"].rpartition(":")
+            class_names_by_file.setdefault(file_path, set()).add(class_name)
+
+    configuration = config.get_config_prop("configuration")
+    for file_path, class_names in class_names_by_file.items():
+        pallet_infos, _ = _get_pallets_in_file(file_path)
+
+        for _, PalletClass in pallet_infos:
+            if PalletClass.__name__ not in class_names:
+                continue
+
+            pallet = _build_pallet(PalletClass, pallet_arg, configuration)
+            if pallet is not None:
+                pallets_by_name["{}:{}".format(file_path, PalletClass.__name__)] = pallet
+
     pallets = []
-    for item in packing_slip:
-        if not item["success"] and not item["ship_on_fail"]:
+    for item in items:
+        pallet = pallets_by_name.get(item["name"])
+        if pallet is None:
+            log.error("could not build the pallet in the packing slip: %s", item["name"])
+
             continue
 
-        pallet = build_pallets(item["name"], pallet_arg)[0][0]
         pallet.add_packing_slip(item)
-
         pallets.append(pallet)
 
     return pallets
 
 
+def _start_history_run(operation):
+    """operation: string - lift or ship
+
+    starts recording the lift or ship in the history. A problem with the history database does not stop the run
+    """
+    try:
+        history.start_run(operation)
+    except Exception as e:
+        log.warning("could not record the %s in the history: %s", operation, e)
+
+
+def _finish_history_run(seconds, success):
+    """seconds: number - the total time of the run
+    success: boolean - whether all of the pallets and servers succeeded
+
+    finishes recording the current run in the history
+    """
+    try:
+        history.finish_run(seconds, success)
+    except Exception as e:
+        log.warning("could not record the end of the run in the history: %s", e)
+
+
+def _record_phase(name, seconds, kind=history.RUN, target=None, size=None):
+    """name: string - the name of the phase
+    seconds: number - the time that the phase took
+    kind: string - one of the history phase kinds. Defaults to a phase of the whole run
+    target: string - the optional server or pallet that the phase acted on
+    size: number - the optional number of bytes that the phase wrote
+
+    records the timing of a phase of the current run in the history
+    """
+    try:
+        history.record_phase(kind, name, seconds, target, size)
+    except Exception as e:
+        log.warning("could not record the %s phase in the history: %s", name, e)
+
+
+def _find_anomalies():
+    """returns the messages about the unusually slow crates and phases of the current run or an empty list if they
+    could not be found
+    """
+    try:
+        return anomalies.find_anomalies()
+    except Exception as e:
+        log.warning("could not compare the run with the history: %s", e)
+
+        return []
+
+
+def _record_pallet_phases(pallet):
+    """pallet: Pallet
+
+    records the processing times of the pallet's lifecycle methods in the history
+    """
+    try:
+        for name, seconds in pallet.processing_times.items():
+            history.record_phase(history.PALLET, name, seconds, pallet.name)
+    except Exception as e:
+        log.warning("could not record the processing times of %r in the history: %s", pallet, e)
+
+
 def _send_report_email(template, report_object, subject, include_packing_slip=False):
     """Create and sends the report email
     template: string - the file path to a pystache template
@@ -714,7 +1057,7 @@ def _send_report_to_slack(status, operation):
         log.error(f"Error posting report to slack: {exc}")
 
 
-def _clone_or_pull_repo(repo_name):
+def _clone_or_pull_repo(repo_name, timeout=None, repository_timeout=None):
     """repo_name: string - a github repository username/reponame format
                   or an object with host, repo, and access token with the username/reponame syntax
 
@@ -723,8 +1066,11 @@ def _clone_or_pull_repo(repo_name):
                     "repo": "name/repo",
                     "token": "personal access token with `read_repository` access only"
                   }]
+    timeout: number - the seconds that a clone or pull is allowed to stall
+    repository_timeout: number - the seconds that a clone or pull is allowed to take
 
-    clones or pull's the repo passed in
+    clones or pull's the repo passed in. New clones are blobless so that the history of file contents is only
+    downloaded when it is needed.
 
     returns a status tuple with None being successful or a string with the error
     """
@@ -732,10 +1078,7 @@ def _clone_or_pull_repo(repo_name):
     log_message = None
     shorthand = True
     safe_repo_name = None
-
-    FAST_FORWARD = 64
-    FORCED_UPDATE = 32
-    HEAD_UPTODATE = 4
+    start_seconds = perf_counter()
 
     try:
         if isinstance(repo_name, str):
@@ -749,30 +1092,112 @@ def _clone_or_pull_repo(repo_name):
         else:
             safe_repo_name = repo_name["repo"]
 
-        if not exists(folder):
-            repo = Repo.clone_from(_repo_to_url(repo_name, shorthand), join(warehouse, folder))
+        env = _get_git_environment(timeout)
 
+        if not exists(folder):
             log_message = "git cloning: {}".format(safe_repo_name)
-            repo.close()
+            _run_git(
+                ["clone", "--filter=blob:none", _repo_to_url(repo_name, shorthand), join(warehouse, folder)],
+                env=env,
+                timeout=repository_timeout,
+            )
         else:
             log_message = "git updating: {}".format(safe_repo_name)
-            repo = _get_repo(folder)
-            origin = repo.remotes[0]
-            fetch_infos = origin.pull()
 
-            if len(fetch_infos) > 0:
-                if fetch_infos[0].flags == HEAD_UPTODATE:
+            with _get_repo(folder) as repo:
+                head = repo.head.commit
+                _run_git(["pull"], folder, env, repository_timeout)
+
+                if repo.head.commit == head:
                     log_message = log_message + "\nno updates to pallet"
-                elif fetch_infos[0].flags in [FORCED_UPDATE, FAST_FORWARD]:
-                    log_message = log_message + "\nupdated to %s", fetch_infos[0].commit.name_rev
+                else:
+                    log_message = log_message + "\nupdated to {}".format(repo.head.commit.name_rev)
+
+        log_message = "{}\n{} time: {}".format(
+            log_message, safe_repo_name, seat.format_time(perf_counter() - start_seconds)
+        )
 
         return (None, log_message)
     except Exception as e:
-        return ("Git update error for {}: {}".format(safe_repo_name, e), log_message)
+        return (
+            "Git update error for {} after {}: {}".format(
+                safe_repo_name, seat.format_time(perf_counter() - start_seconds), e
+            ),
+            log_message,
+        )
+
+
+def _get_git_environment(timeout):
+    """timeout: number - the seconds that a transfer is allowed to stall
+
+    git fails instead of prompting for credentials and stops http transfers that stall for longer than the timeout
+
+    returns the environment variables for a git clone or pull
+    """
+    env = dict(environ, GIT_TERMINAL_PROMPT="0")
+
+    if timeout:
+        env.update({"GIT_HTTP_LOW_SPEED_LIMIT": "1", "GIT_HTTP_LOW_SPEED_TIME": str(int(timeout))})
+
+    return env
+
+
+def _run_git(arguments, folder=None, env=None, timeout=None):
+    """arguments: string[] - the git command and its options
+    folder: string - the optional working directory
+    env: dictionary - the optional environment variables
+    timeout: number - the optional seconds that the command is allowed to take
+
+    runs git without a terminal or input. git and the processes that it started (e.g. ssh or git-remote-https) are
+    killed when the command takes longer than the timeout
+
+    returns the output of the command
+    """
+    process = Popen(
+        ["git"] + arguments,
+        cwd=folder,
+        env=env,
+        stdin=DEVNULL,
+        stdout=PIPE,
+        stderr=PIPE,
+        universal_newlines=True,
+        start_new_session=sys.platform != "win32",
+    )
+
+    try:
+        output, error = process.communicate(timeout=timeout)
+    except TimeoutExpired:
+        _kill_process_tree(process)
+        process.communicate()
+
+        raise TimeoutError("git {} did not finish in {}".format(arguments[0], seat.format_time(timeout)))
+
+    if process.returncode != 0:
+        raise Exception("git {} exited with code {}: {}".format(arguments[0], process.returncode, error.strip()))
+
+    return output
+
+
+def _kill_process_tree(process):
+    """process: Popen - a process that was started in a new session on posix
+
+    kills the process and all of its child processes
+    """
+    if sys.platform == "win32":
+        run(["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=DEVNULL, stderr=DEVNULL)
+
+        return
+
+    from os import killpg
+    from signal import SIGKILL
+
+    killpg(process.pid, SIGKILL)
 
 
 def _get_repo(folder):
     #: abstraction to enable mocking in tests
+    from git import Repo
+
     return Repo(folder)
 
 
@@ -812,21 +1237,23 @@ def _validate_repo(repo, raises=False):
 def _get_pallets_in_folder(folder):
     """folder: string - a path to a folder
 
-    finds all pallet classes in `folder` looking only in `pallet_file_regex` matching files
+    finds all pallet classes in `folder` looking only in `discovery.pallet_file_regex` matching files. Files that the
+    pallet index shows don't contain any classes that could be pallets are not imported.
 
     returns an array of tuples consisting of the file path and the pallet class object
     """
     pallets = []
     import_errors = []
 
-    for root, _, files in walk(folder):
-        for file_name in files:
-            if pallet_file_regex.search(file_name.lower()):
-                new_pallets, import_error = _get_pallets_in_file(join(root, file_name))
-                pallets.extend(new_pallets)
+    for file_path, class_names in discovery.PalletIndex().find(folder):
+        if class_names is not None and len(class_names) == 0:
+            continue
+
+        new_pallets, import_error = _get_pallets_in_file(file_path)
+        pallets.extend(new_pallets)
 
-                if import_error is not None:
-                    import_errors.append(import_error)
+        if import_error is not None:
+            import_errors.append(import_error)
 
     return pallets, import_errors
 
@@ -904,6 +1331,9 @@ def _generate_console_report(pallet_reports):
         for import_error in pallet_reports["import_errors"]:
             report_str += "{}{}{}".format(Fore.RED, import_error, linesep)
 
+    for anomaly in pallet_reports.get("anomalies", []):
+        report_str += "{}{}{}{}".format(Fore.YELLOW, anomaly, Fore.RESET, linesep)
+
     for report in pallet_reports["pallets"]:
         color = Fore.GREEN
         if not report["success"]:
@@ -916,6 +1346,9 @@ def _generate_console_report(pallet_reports):
         if report["message"]:
             report_str += "pallet message: {}{}{}{}".format(Fore.RED, report["message"], Fore.RESET, linesep)
 
+        if report.get("cache"):
+            report_str += "cache hits: {hits} misses: {misses}{0}".format(linesep, **report["cache"])
+
         for crate in report["crates"]:
             report_str += "{0:>40} - {1}{3}{2}".format(crate["name"], crate["result"], linesep, Fore.RESET)
 
@@ -949,6 +1382,9 @@ def _generate_ship_console_report(pallet_reports):
         pallet_reports["total_time"],
     )
 
+    for anomaly in pallet_reports.get("anomalies", []):
+        report_str += f"{Fore.YELLOW}{anomaly}{Fore.RESET}{linesep}"
+
     for report in pallet_reports["server_reports"]:
         color = Fore.GREEN
         if not report["success"]:
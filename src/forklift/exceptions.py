@@ -9,3 +9,15 @@ Custom exceptions that are used in forklift
 
 class ValidationException(Exception):
     pass
+
+
+class ParallelMapException(Exception):
+    def __init__(self, name, errors, results):
+        #: a list of tuples of the items that failed and the exceptions that they raised
+        self.errors = errors
+        #: the return values of the items that succeeded
+        self.results = results
+
+        super(ParallelMapException, self).__init__(
+            "{} of the items in {} failed: {}".format(len(errors), name, "; ".join(str(e) for _, e in errors))
+        )
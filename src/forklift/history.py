@@ -0,0 +1,545 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+history.py
+
+A module that records the results and timings of lifts, ships, and crates in the garage so that future lifts can be
+scheduled better and slow downs can be found with `forklift stats`
+"""
+
+import logging
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+from os import linesep
+from os.path import dirname, join
+from statistics import median
+
+from . import config, seat
+from .models import Crate
+
+log = logging.getLogger("forklift")
+history_file_name = "history.db"
+#: the number of recent runs of a crate that are used to estimate its duration
+recent_runs = 5
+#: the kinds of phases that are recorded
+RUN = "run"
+SERVER = "server"
+PALLET = "pallet"
+CRATE = "crate"
+#: the statements that create the history tables
+tables = [
+    (
+        "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, operation TEXT NOT NULL, started TEXT NOT NULL, "
+        "finished TEXT, seconds REAL, success INTEGER)"
+    ),
+    "CREATE TABLE IF NOT EXISTS crates (name TEXT NOT NULL, finished TEXT NOT NULL, seconds REAL, rows INTEGER, result TEXT)",
+    "CREATE INDEX IF NOT EXISTS crates_name ON crates (name, finished)",
+    (
+        "CREATE TABLE IF NOT EXISTS phases "
+        "(run INTEGER, kind TEXT NOT NULL, target TEXT, name TEXT NOT NULL, seconds REAL, bytes INTEGER)"
+    ),
+    "CREATE INDEX IF NOT EXISTS phases_run ON phases (run)",
+]
+#: the columns that were added to the crates table after it was first created
+crate_columns = {"run": "INTEGER", "adds": "INTEGER", "deletes": "INTEGER"}
+#: the id of the lift or ship that is being recorded. See `start_run`
+current_run = None
+
+
+def get_history_location():
+    """returns the path to the history database in the garage"""
+    return join(dirname(config.config_location), history_file_name)
+
+
+def connect(location=None):
+    """location: string - an optional path to the database. Defaults to the garage
+
+    returns a sqlite3 connection to the history database, creating the tables if needed
+    """
+    connection = sqlite3.connect(location or get_history_location())
+
+    for statement in tables:
+        connection.execute(statement)
+
+    #: databases from older versions of forklift only have the crate results
+    existing = set(row[1] for row in connection.execute("PRAGMA table_info(crates)"))
+    for column, column_type in crate_columns.items():
+        if column not in existing:
+            connection.execute("ALTER TABLE crates ADD COLUMN {} {}".format(column, column_type))
+
+    return connection
+
+
+def start_run(operation, location=None):
+    """operation: string - lift or ship
+    location: string - an optional path to the database
+
+    Records the start of a lift or ship. The crates and phases that are recorded until `finish_run` belong to it.
+
+    returns the id of the run
+    """
+    global current_run
+
+    with closing(connect(location)) as connection, connection:
+        current_run = connection.execute(
+            "INSERT INTO runs (operation, started) VALUES (?, ?)", (operation, datetime.now().isoformat())
+        ).lastrowid
+
+    return current_run
+
+
+def finish_run(seconds, success, location=None):
+    """seconds: number - the total time of the run
+    success: boolean - whether everything in the run succeeded
+    location: string - an optional path to the database
+
+    Records the end of the current run
+    """
+    global current_run
+
+    if current_run is None:
+        return
+
+    with closing(connect(location)) as connection, connection:
+        connection.execute(
+            "UPDATE runs SET finished = ?, seconds = ?, success = ? WHERE id = ?",
+            (datetime.now().isoformat(), seconds, int(bool(success)), current_run),
+        )
+
+    current_run = None
+
+
+def record_phase(kind, name, seconds, target=None, size=None, location=None):
+    """kind: string - one of RUN, SERVER, PALLET, or CRATE
+    name: string - the name of the phase e.g. dropoff_data or copy
+    seconds: number - the time that the phase took
+    target: string - the optional server, pallet, or crate that the phase acted on
+    size: number - the optional number of bytes that the phase wrote
+    location: string - an optional path to the database
+
+    Saves the timing of a phase of the current run
+    """
+    with closing(connect(location)) as connection, connection:
+        connection.execute(
+            "INSERT INTO phases VALUES (?, ?, ?, ?, ?, ?)", (current_run, kind, target, name, seconds, size)
+        )
+
+
+def record_crates(crates, location=None):
+    """crates: Crate[]
+    location: string - an optional path to the database
+
+    Saves the processing time, row count, adds, deletes, result, and phase times of each crate that was processed
+    keyed by `Crate.name`. Crates that were skipped because of invalid data are saved without a time so that their
+    result is still the latest one for `get_latest_results`
+    """
+    finished = datetime.now().isoformat()
+    processed = [
+        crate for crate in crates if crate.processing_time is not None or crate.result[0] == Crate.INVALID_DATA
+    ]
+    rows = [
+        (
+            crate.name,
+            finished,
+            crate.processing_time,
+            crate.total_rows,
+            crate.result[0],
+            current_run,
+            crate.adds,
+            crate.deletes,
+        )
+        for crate in processed
+    ]
+    phases = [
+        (current_run, CRATE, crate.name, phase, seconds, None)
+        for crate in processed
+        for phase, seconds in crate.phase_times.items()
+    ]
+
+    with closing(connect(location)) as connection, connection:
+        connection.executemany(
+            "INSERT INTO crates (name, finished, seconds, rows, result, run, adds, deletes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        connection.executemany("INSERT INTO phases VALUES (?, ?, ?, ?, ?, ?)", phases)
+
+
+def get_crate_history(names, location=None):
+    """names: string[] - crate names
+    location: string - an optional path to the database
+
+    returns a dictionary of crate name to a tuple of the median seconds and the latest row count from recent runs
+    """
+    history = {}
+
+    with closing(connect(location)) as connection:
+        for name in names:
+            runs = connection.execute(
+                "SELECT seconds, rows FROM crates WHERE name = ? AND seconds IS NOT NULL ORDER BY finished DESC LIMIT ?",
+                (name, recent_runs),
+            ).fetchall()
+
+            if len(runs) == 0:
+                continue
+
+            history[name] = (median([seconds for seconds, _ in runs]), runs[0][1])
+
+    return history
+
+
+def get_latest_results(names, location=None):
+    """names: string[] - crate names
+    location: string - an optional path to the database
+
+    returns a dictionary of crate name to the result of its most recent run
+    """
+    results = {}
+
+    with closing(connect(location)) as connection:
+        for name in names:
+            run = connection.execute(
+                "SELECT result FROM crates WHERE name = ? ORDER BY finished DESC LIMIT 1", (name,)
+            ).fetchone()
+
+            if run is not None:
+                results[name] = run[0]
+
+    return results
+
+
+def get_rows_per_second(location=None):
+    """location: string - an optional path to the database
+
+    returns the overall rows per second of all recorded crates or None if there is no history
+    """
+    with closing(connect(location)) as connection:
+        rows, seconds = connection.execute(
+            "SELECT SUM(rows), SUM(seconds) FROM crates WHERE rows IS NOT NULL AND seconds > 0"
+        ).fetchone()
+
+    if not rows or not seconds:
+        return None
+
+    return rows / seconds
+
+
+def estimate_durations(crates, count_rows=None, location=None):
+    """crates: Crate[]
+    count_rows: Function - an optional function that returns the number of rows in a crate's source
+    location: string - an optional path to the database
+
+    Estimates how long each crate will take to process from its recent history. Crates without any history
+    are estimated from their source row count and the overall rows per second of all recorded crates or None
+    if `count_rows` is not passed.
+
+    returns a dictionary of crate name to estimated seconds
+    """
+    history = get_crate_history([crate.name for crate in crates], location)
+    rows_per_second = get_rows_per_second(location) if count_rows is not None else None
+    estimates = {}
+
+    for crate in crates:
+        if crate.name in history:
+            estimates[crate.name] = history[crate.name][0]
+        elif count_rows is None:
+            estimates[crate.name] = None
+        elif rows_per_second is not None:
+            try:
+                estimates[crate.name] = count_rows(crate) / rows_per_second
+            except Exception as e:
+                log.debug("could not count the rows for %s: %s", crate.name, e)
+                estimates[crate.name] = 0
+        else:
+            estimates[crate.name] = 0
+
+    return estimates
+
+
+def get_phase_medians(operation, location=None):
+    """operation: string - lift or ship
+    location: string - an optional path to the database
+
+    returns a dictionary of the names of the phases of the operation to the median seconds of their recent runs
+    """
+    seconds = {}
+
+    with closing(connect(location)) as connection:
+        for name, phase_seconds in connection.execute(
+            "SELECT phases.name, phases.seconds FROM phases JOIN runs ON phases.run = runs.id "
+            "WHERE runs.operation = ? AND phases.kind = ? AND phases.seconds IS NOT NULL ORDER BY phases.run DESC",
+            (operation, RUN),
+        ):
+            recent = seconds.setdefault(name, [])
+            if len(recent) < recent_runs:
+                recent.append(phase_seconds)
+
+    return {name: median(recent) for name, recent in seconds.items()}
+
+
+def get_run_durations(run, limit=20, location=None):
+    """run: number - the id of a run from `start_run`
+    limit: number - the number of earlier runs of each crate and phase to include
+    location: string - an optional path to the database
+
+    Finds the crates and the phases (other than the phases of crates) of the run and their durations in earlier runs.
+    Phases are compared to the earlier runs of the same operation.
+
+    returns a list of dictionaries with the kind, target, name, seconds, rows, and a list of the earlier
+    (seconds, rows) tuples from newest to oldest
+    """
+    durations = []
+
+    with closing(connect(location)) as connection:
+        operation = connection.execute("SELECT operation FROM runs WHERE id = ?", (run,)).fetchone()
+
+        for name, seconds, rows in connection.execute(
+            "SELECT name, seconds, rows FROM crates WHERE run = ? AND seconds IS NOT NULL", (run,)
+        ).fetchall():
+            earlier = connection.execute(
+                "SELECT seconds, rows FROM crates WHERE name = ? AND seconds IS NOT NULL AND (run IS NULL OR run < ?) "
+                "ORDER BY finished DESC LIMIT ?",
+                (name, run, limit),
+            ).fetchall()
+            durations.append(
+                {"kind": CRATE, "target": name, "name": name, "seconds": seconds, "rows": rows, "earlier": earlier}
+            )
+
+        if operation is None:
+            return durations
+
+        for kind, target, name, seconds in connection.execute(
+            "SELECT kind, target, name, seconds FROM phases WHERE run = ? AND kind != ?", (run, CRATE)
+        ).fetchall():
+            earlier = connection.execute(
+                "SELECT phases.seconds, NULL FROM phases JOIN runs ON phases.run = runs.id "
+                "WHERE runs.operation = ? AND phases.run < ? AND phases.kind = ? AND phases.target IS ? "
+                "AND phases.name = ? ORDER BY phases.run DESC LIMIT ?",
+                (operation[0], run, kind, target, name, limit),
+            ).fetchall()
+            durations.append(
+                {"kind": kind, "target": target, "name": name, "seconds": seconds, "rows": None, "earlier": earlier}
+            )
+
+    return durations
+
+
+def get_stats(crate_pattern=None, days=None, limit=10, location=None):
+    """crate_pattern: string - an optional glob pattern of crate names to show every run of
+    days: number - an optional number of days of history to include. Defaults to all of it
+    limit: number - the number of recent runs and slowest crates to include
+    location: string - an optional path to the database
+
+    Summarizes the history for `forklift stats`. The phases of lifts and ships and the times of each server are
+    summarized by operation and the crates are summarized by name and sorted by their median seconds.
+
+    returns a dictionary with the recent runs, phase summaries, slowest crate summaries, and the runs of the crates that
+    match `crate_pattern`
+    """
+    since = (datetime.now() - timedelta(days=float(days))).isoformat() if days else ""
+
+    with closing(connect(location)) as connection:
+        runs = connection.execute(
+            "SELECT operation, started, seconds, success FROM runs WHERE started >= ? ORDER BY started DESC LIMIT ?",
+            (since, limit),
+        ).fetchall()
+        phase_rows = connection.execute(
+            "SELECT runs.operation, phases.kind, phases.target, phases.name, phases.seconds, phases.bytes "
+            "FROM phases JOIN runs ON phases.run = runs.id "
+            "WHERE phases.kind IN (?, ?) AND runs.started >= ? ORDER BY runs.started",
+            (RUN, SERVER, since),
+        ).fetchall()
+        crate_rows = connection.execute(
+            "SELECT name, finished, seconds, rows, adds, deletes, result, run FROM crates "
+            "WHERE finished >= ? AND seconds IS NOT NULL ORDER BY finished",
+            (since,),
+        ).fetchall()
+
+        phases = {}
+        for operation, kind, target, name, seconds, size in phase_rows:
+            phase = phases.setdefault((operation, kind, target or "", name), {"seconds": [], "bytes": []})
+            phase["seconds"].append(seconds)
+            if size is not None:
+                phase["bytes"].append(size)
+
+        crates = {}
+        for name, _, seconds, *_ in crate_rows:
+            crates.setdefault(name, []).append(seconds)
+
+        crate_runs = []
+        if crate_pattern:
+            pattern = crate_pattern.lower()
+
+            for name, finished, seconds, rows, adds, deletes, result, run in crate_rows:
+                if not (fnmatchcase(name.lower(), pattern) or fnmatchcase(name.rsplit("_", 1)[0].lower(), pattern)):
+                    continue
+
+                crate_phases = dict(
+                    connection.execute(
+                        "SELECT name, seconds FROM phases WHERE run IS ? AND kind = ? AND target = ?",
+                        (run, CRATE, name),
+                    ).fetchall()
+                )
+                crate_runs.append(
+                    {
+                        "name": name,
+                        "finished": finished,
+                        "seconds": seconds,
+                        "rows": rows,
+                        "adds": adds,
+                        "deletes": deletes,
+                        "result": result,
+                        "phases": crate_phases,
+                    }
+                )
+
+    slowest = sorted(
+        [dict(name=name, **summarize(seconds)) for name, seconds in crates.items()],
+        key=lambda crate: crate["median"],
+        reverse=True,
+    )
+
+    return {
+        "runs": [
+            {"operation": operation, "started": started, "seconds": seconds, "success": success}
+            for operation, started, seconds, success in runs
+        ],
+        "phases": [
+            dict(
+                operation=operation,
+                kind=kind,
+                target=target,
+                name=name,
+                bytes=median(values["bytes"]) if values["bytes"] else None,
+                **summarize(values["seconds"]),
+            )
+            for (operation, kind, target, name), values in phases.items()
+        ],
+        "crates": slowest[:limit],
+        "crate_runs": crate_runs,
+    }
+
+
+def summarize(seconds):
+    """seconds: number[] - the times of a phase or crate in the order that they ran
+
+    returns a dictionary of the count, median, 90th percentile, max, and latest seconds and the trend which is the
+    latest seconds divided by the median of the earlier seconds or None if there is only one
+    """
+    earlier = median(seconds[:-1]) if len(seconds) > 1 else None
+
+    return {
+        "count": len(seconds),
+        "median": median(seconds),
+        "p90": percentile(seconds, 90),
+        "max": max(seconds),
+        "latest": seconds[-1],
+        "trend": seconds[-1] / earlier if earlier else None,
+    }
+
+
+def percentile(values, percent):
+    """values: number[]
+    percent: number - 0 to 100
+
+    returns the linearly interpolated percentile of the values
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def format_stats(stats):
+    """stats: dictionary - the result of `get_stats`
+
+    returns the stats as tables for the console
+    """
+    if not stats["runs"] and not stats["crates"]:
+        return "there is no history yet. It is recorded by `forklift lift` and `forklift ship`."
+
+    summary_format = "{:<40} {:>6} {:>10} {:>10} {:>10} {:>10} {:>7}"
+
+    def format_summary(name, summary):
+        return summary_format.format(
+            name[:40],
+            summary["count"],
+            seat.format_time(summary["median"]),
+            seat.format_time(summary["p90"]),
+            seat.format_time(summary["max"]),
+            seat.format_time(summary["latest"]),
+            "x{:.1f}".format(summary["trend"]) if summary["trend"] is not None else "",
+        )
+
+    header = summary_format.format("", "runs", "median", "p90", "max", "latest", "trend")
+    lines = ["recent runs", "{:<10} {:<20} {:>12} {:>8}".format("operation", "started", "time", "success")]
+
+    for run in stats["runs"]:
+        lines.append(
+            "{:<10} {:<20} {:>12} {:>8}".format(
+                run["operation"],
+                run["started"][:19],
+                seat.format_time(run["seconds"]) if run["seconds"] is not None else "unfinished",
+                {None: "", 0: "no", 1: "yes"}[run["success"]],
+            )
+        )
+
+    lines.extend(["", "phases", header])
+    for phase in stats["phases"]:
+        name = " ".join(part for part in [phase["operation"], phase["target"], phase["name"]] if part)
+        line = format_summary(name, phase)
+
+        if phase["bytes"] is not None:
+            line += " {:.1f} MB".format(phase["bytes"] / 1024 / 1024)
+
+        lines.append(line)
+
+    lines.extend(["", "slowest crates", header])
+    lines.extend(format_summary(crate["name"], crate) for crate in stats["crates"])
+
+    if stats["crate_runs"]:
+        lines.extend(
+            [
+                "",
+                "crate runs",
+                "{:<40} {:<20} {:>10} {:>10} {:>10} {:>10}  {}".format(
+                    "", "finished", "time", "rows", "adds", "deletes", "result"
+                ),
+            ]
+        )
+
+        for crate_run in stats["crate_runs"]:
+            lines.append(
+                "{:<40} {:<20} {:>10} {:>10} {:>10} {:>10}  {}".format(
+                    crate_run["name"][:40],
+                    crate_run["finished"][:19],
+                    seat.format_time(crate_run["seconds"]),
+                    _or_blank(crate_run["rows"]),
+                    _or_blank(crate_run["adds"]),
+                    _or_blank(crate_run["deletes"]),
+                    crate_run["result"],
+                )
+            )
+
+            if crate_run["phases"]:
+                lines.append(
+                    "    "
+                    + ", ".join(
+                        "{}: {}".format(phase, seat.format_time(seconds))
+                        for phase, seconds in crate_run["phases"].items()
+                    )
+                )
+
+    return linesep.join(lines)
+
+
+def _or_blank(value):
+    """value: any
+
+    returns the value or an empty string if it is None
+    """
+    return "" if value is None else value
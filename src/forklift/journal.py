@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+journal.py
+
+A module that records the progress of a lift in the garage so that it can be resumed after a crash
+"""
+
+import json
+import logging
+from os import fsync
+from os.path import dirname, exists, join
+from threading import Lock
+
+from . import config
+
+log = logging.getLogger("forklift")
+journal_file_name = "journal.jsonl"
+
+
+def get_journal_location():
+    """returns the path to the run journal in the garage"""
+    return join(dirname(config.config_location), journal_file_name)
+
+
+class Journal(object):
+    """A journal of the crate results and completed phases of a lift. Each entry is written as a line of json and
+    flushed to disk as soon as it is recorded so that the journal survives a crash or reboot.
+    """
+
+    def __init__(self, location=None):
+        self.location = location or get_journal_location()
+        #: the arguments that the lift was started with
+        self.file_path = None
+        self.pallet_arg = None
+        self.selectors = None
+        #: the result of each finished crate keyed by the crate destination
+        self.crates = {}
+        #: the success of each pallet that finished a phase keyed by (pallet name, phase)
+        self.pallet_phases = {}
+        #: the names of the lift phases that finished
+        self.phases = set()
+        self._lock = Lock()
+
+    def start(self, file_path, pallet_arg, selectors=None):
+        """file_path: string - the file path that the lift was started with
+        pallet_arg: string
+        selectors: dictionary - the optional crate selectors of a selective lift
+
+        starts a new journal, discarding any previous run
+        """
+        self.file_path = file_path
+        self.pallet_arg = pallet_arg
+        self.selectors = selectors
+        self.crates = {}
+        self.pallet_phases = {}
+        self.phases = set()
+
+        with open(self.location, "w", encoding="utf-8"):
+            pass
+
+        self._write({"type": "start", "file_path": file_path, "pallet_arg": pallet_arg, "selectors": selectors})
+
+    def load(self):
+        """reads the entries from a previous run
+
+        returns True if there is an unfinished run to resume
+        """
+        if not exists(self.location):
+            return False
+
+        finished = False
+
+        with open(self.location, encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    #: the last line may have been cut off by the crash
+                    log.warning("skipping a partial journal entry: %s", line)
+                    continue
+
+                if entry["type"] == "start":
+                    self.file_path = entry["file_path"]
+                    self.pallet_arg = entry["pallet_arg"]
+                    self.selectors = entry.get("selectors")
+                elif entry["type"] == "crate":
+                    self.crates[entry["destination"]] = tuple(entry["result"])
+                elif entry["type"] == "pallet":
+                    self.pallet_phases[(entry["name"], entry["phase"])] = tuple(entry["success"])
+                elif entry["type"] == "phase":
+                    self.phases.add(entry["phase"])
+                elif entry["type"] == "finish":
+                    finished = True
+
+        return not finished
+
+    def record_crate(self, crate, result):
+        """crate: Crate
+        result: (string, string)
+
+        records the final result of a crate
+        """
+        self.crates[crate.destination] = tuple(result)
+        self._write({"type": "crate", "destination": crate.destination, "result": result})
+
+    def record_pallet_phase(self, pallet, phase):
+        """pallet: Pallet
+        phase: string - e.g. process
+
+        records that a pallet finished a phase and its success
+        """
+        self.pallet_phases[(pallet.name, phase)] = tuple(pallet.success)
+        self._write({"type": "pallet", "name": pallet.name, "phase": phase, "success": pallet.success})
+
+    def record_phase(self, phase):
+        """phase: string - e.g. dropoff_data
+
+        records that a phase of the lift finished for all pallets
+        """
+        self.phases.add(phase)
+        self._write({"type": "phase", "phase": phase})
+
+    def finish(self):
+        """marks the run as finished so that it is not resumed"""
+        self._write({"type": "finish"})
+
+    def _write(self, entry):
+        """entry: dictionary
+
+        appends the entry to the journal and flushes it to disk
+        """
+        with self._lock, open(self.location, "a", encoding="utf-8") as journal_file:
+            journal_file.write(json.dumps(entry) + "\n")
+            journal_file.flush()
+            fsync(journal_file.fileno())
@@ -9,17 +9,25 @@ A module that contains methods to handle pallets
 import logging
 import shutil
 import socket
+from concurrent.futures import Future, ProcessPoolExecutor
+from fnmatch import fnmatchcase
+from functools import partial
 from os import listdir, makedirs, path, remove, walk
+from queue import Queue
+from threading import Lock, Thread
 from time import perf_counter
 from subprocess import run, PIPE, STDOUT
 
-import arcpy
-
-from . import change_detection, seat
+from . import change_detection, config, history, progress, seat, supervisor
+from .connections import ConnectionManager, get_source_host, is_schema_lock
 from .core import hash_field
 from .models import Crate
+from .scheduler import CrateScheduler, WorkerController
 
+arcpy = seat.lazy_import("arcpy")
 log = logging.getLogger("forklift")
+#: the results of the crates that are selected by `forklift lift --only-failed`
+failed_results = [Crate.INVALID_DATA, Crate.UNHANDLED_EXCEPTION, Crate.ERROR]
 
 
 def process_checklist(config):
@@ -75,73 +83,521 @@ def prepare_packaging_for_pallets(pallets):
             log.error("error preparing packaging: %s for pallet: %r", e, pallet, exc_info=True)
 
 
-def process_crates_for(pallets, update_def, change_detection=None):
+def select_crates(pallets, crate_pattern=None, destination_workspace=None, only_failed=False):
+    """pallets: Pallet[]
+    crate_pattern: string - an optional glob that the crate destination names must match e.g. `Roads*`
+    destination_workspace: string - an optional path or glob that the crate destination workspaces must match
+    only_failed: boolean - only select the crates whose most recent result in the history is one of `failed_results`.
+        All of the crates are selected if the history cannot be read
+
+    Selects the crates for a selective lift. The crates that are not selected are given a `NO_CHANGES` result so
+    that they are not updated or shown in the report.
+
+    returns a tuple of the pallets that have at least one selected crate and a set of the selected crate destinations
+    """
+    failed_names = None
+    if only_failed:
+        try:
+            results = history.get_latest_results(set(crate.name for pallet in pallets for crate in pallet.get_crates()))
+            failed_names = set(name for name, result in results.items() if result in failed_results)
+        except Exception as e:
+            log.warning("could not read the crate history. selecting all crates: %s", e)
+
+    def is_selected(crate):
+        if crate_pattern and not fnmatchcase(crate.destination_name.lower(), crate_pattern.lower()):
+            return False
+
+        if destination_workspace and not fnmatchcase(
+            path.normpath(crate.destination_workspace.lower()), path.normpath(destination_workspace.lower())
+        ):
+            return False
+
+        return failed_names is None or crate.name in failed_names
+
+    selected_pallets = []
+    destinations = set()
+
+    for pallet in pallets:
+        selected = False
+
+        for crate in pallet.get_crates():
+            if is_selected(crate):
+                selected = True
+                destinations.add(crate.destination)
+            else:
+                crate.result = (Crate.NO_CHANGES, None)
+
+        if selected:
+            selected_pallets.append(pallet)
+
+    log.info("selected %d crates in %d pallets", len(destinations), len(selected_pallets))
+
+    return selected_pallets, destinations
+
+
+def process_crates_for(pallets, update_def, change_detection=None, on_pallet_ready=None, destinations=None):
     """
     pallets: Pallet[]
     update_def: Function - core.update by default
     change_detection: Dictionary containing table names and current hashes
+    on_pallet_ready: Function - an optional function that is called with each pallet as soon as all of its crates
+        (including duplicates shared with other pallets) have results
+    destinations: set - the optional destinations of the crates that were selected by `select_crates`. Other crates
+        are not updated
 
-    Calls update_def on all crates (excluding duplicates) in pallets
-    """
-    processed_crates = {}
+    Calls update_def on all crates (excluding duplicates) in pallets. Crates are processed on `crateWorkers`
+    threads with no more than the `hostConcurrency` limit reading from the same source host at once and one crate at a
+    time writing to each destination workspace.
 
+    returns the ConnectionManager that was used to keep the source workspace connections warm
+    """
     log.info("processing crates for %d pallets.", len(pallets))
 
+    crates_to_process = _get_crates_to_process(pallets, destinations)
+    estimates = _sort_longest_first(crates_to_process)
+    progress.tracker.add_crates([crate for crate, _ in crates_to_process], estimates)
+
+    processed_crates = {crate.destination: crate for crate, _ in crates_to_process}
+    unfinished_crates = {pallet: set(_get_valid_destinations(pallet, destinations)) for pallet in pallets}
+    lock = Lock()
+
+    #: concurrent crates are updated in worker processes so there are no connections in this process to keep warm
+    connections = ConnectionManager([] if supervisor.is_concurrent() else [crate for crate, _ in crates_to_process])
+    scheduler = CrateScheduler(
+        config.get_config_prop("crateWorkers", 1),
+        config.get_config_prop("hostConcurrency", {}),
+        _get_worker_controller(),
+    )
+
+    def finish_pallet(pallet):
+        for crate in pallet.get_crates():
+            if crate.result[0] == Crate.INVALID_DATA:
+                log.warning("crate: %s result: %s", crate.destination_name, crate.result)
+                continue
+
+            if crate.destination not in processed_crates:
+                continue
+
+            if processed_crates[crate.destination] is not crate:
+                log.debug("skipping duplicate crate: %s", crate.destination_name)
+
+                crate.set_result(processed_crates[crate.destination].result)
+                crate.captured = processed_crates[crate.destination].captured
+
+        if on_pallet_ready is not None:
+            on_pallet_ready(pallet)
+
+    def process_crate(crate, pallet):
+        log.info("crate: %s", crate.destination_name)
+        log.debug("%r", crate)
+        start_seconds = perf_counter()
+        progress.tracker.start_crate(crate)
+
+        try:
+            connections.open(crate.source_workspace)
+            try:
+                crate.set_result(update_def(crate, pallet.validate_crate, change_detection))
+            finally:
+                connections.release(crate.source_workspace, crate.result)
+        except Exception as e:
+            log.error("unhandled exception updating crate: %s", crate.destination_name, exc_info=e)
+            crate.set_result((Crate.UNHANDLED_EXCEPTION, str(e)))
+
+        progress.tracker.finish_crate(crate)
+        log.info("result: %s", crate.result)
+
+        #: crates restored from the journal were not updated so their time is not recorded in the history
+        if not crate.resumed:
+            crate.processing_time = perf_counter() - start_seconds
+            log.debug("finished crate %s", seat.format_time(crate.processing_time))
+
+        with lock:
+            if not crate.resumed:
+                pallet.add_processing_time("process_crates", crate.processing_time)
+
+            ready_pallets = []
+            for waiting_pallet, destinations in unfinished_crates.items():
+                if crate.destination in destinations:
+                    destinations.remove(crate.destination)
+
+                    if len(destinations) == 0:
+                        ready_pallets.append(waiting_pallet)
+
+        for ready_pallet in ready_pallets:
+            finish_pallet(ready_pallet)
+
+        return crate
+
+    #: pallets without any valid crates do not need to wait
+    for pallet, unfinished in unfinished_crates.items():
+        if len(unfinished) == 0:
+            finish_pallet(pallet)
+
+    jobs = [
+        (
+            get_source_host(crate),
+            path.normcase(path.normpath(crate.destination_workspace)),
+            partial(process_crate, crate, pallet),
+        )
+        for crate, pallet in crates_to_process
+    ]
+    scheduler.run(jobs)
+
+    for workspace, connect_time in connections.get_report().items():
+        log.info("connect time for %s: %s", workspace, connect_time)
+
+    try:
+        history.record_crates([crate for crate, _ in crates_to_process] + _get_invalid_crates(pallets, destinations))
+    except Exception as e:
+        log.warning("could not record the crate history: %s", e)
+
+    return connections
+
+
+def _get_valid_destinations(pallet, destinations=None):
+    """pallet: Pallet
+    destinations: set - the optional destinations of the selected crates
+
+    returns the destinations of all of the selected crates in the pallet that are not invalid
+    """
+    return [
+        crate.destination
+        for crate in pallet.get_crates()
+        if (destinations is None or crate.destination in destinations) and crate.result[0] != Crate.INVALID_DATA
+    ]
+
+
+def _get_worker_controller():
+    """returns a WorkerController if `adaptiveCrateWorkers` is configured otherwise None"""
+    settings = config.get_config_prop("adaptiveCrateWorkers", None)
+
+    if not settings:
+        return None
+
+    return WorkerController(
+        minimum=settings.get("min", 1),
+        maximum=settings.get("max", 8),
+        initial=settings.get("initial", None),
+        interval=settings.get("intervalSeconds", 30),
+        cpu_threshold=settings.get("cpuThreshold", 0.9),
+        cpu_seconds=supervisor.get_cpu_seconds,
+    )
+
+
+def _sort_longest_first(crates_to_process):
+    """crates_to_process: [(Crate, Pallet)]
+
+    Sorts the crates in place so that the crates that are expected to take the longest are started first
+    and the shorter crates are packed in around them. Only the crates without any history have their source rows
+    counted and none are counted when the history is empty so this stays cheap after the first lift.
+
+    returns the estimated seconds of each crate keyed by `Crate.name` or None if they could not be estimated
+    """
+    try:
+        estimates = history.estimate_durations([crate for crate, _ in crates_to_process], _count_source_rows)
+    except Exception as e:
+        log.warning("could not estimate crate durations from history: %s", e)
+
+        return None
+
+    crates_to_process.sort(key=lambda item: estimates[item[0].name], reverse=True)
+
+    return estimates
+
+
+def _count_source_rows(crate):
+    """crate: Crate
+
+    returns the number of rows in the source of the crate
+    """
+    return int(arcpy.GetCount_management(crate.source).getOutput(0))
+
+
+def _get_crates_to_process(pallets, destinations=None):
+    """pallets: Pallet[]
+    destinations: set - the optional destinations of the selected crates
+
+    returns a list of tuples of the crates that will be passed to update_def in process_crates_for
+    and the pallet that they belong to skipping invalid, unselected, and duplicate crates
+    """
+    crates = {}
+
     for pallet in pallets:
-        with seat.timed_pallet_process(pallet, "process_crates"):
-            log.info("processing crates for pallet: %r", pallet)
+        for crate in pallet.get_crates():
+            if destinations is not None and crate.destination not in destinations:
+                continue
 
-            for crate in pallet.get_crates():
-                log.info("crate: %s", crate.destination_name)
-                if crate.result[0] == Crate.INVALID_DATA:
-                    log.warning("result: %s", crate.result)
-                    continue
+            if crate.result[0] == Crate.INVALID_DATA:
+                continue
 
-                if crate.destination not in processed_crates:
-                    log.debug("%r", crate)
-                    start_seconds = perf_counter()
+            processed, _ = crates.setdefault(crate.destination, (crate, pallet))
 
-                    processed_crates[crate.destination] = crate.set_result(
-                        update_def(crate, pallet.validate_crate, change_detection)
-                    )
+            #: the crate that is processed captures rows for all of its duplicates
+            if crate.capture is not None and processed.capture != Crate.CAPTURE_ALL:
+                processed.capture = crate.capture
+
+    return list(crates.values())
 
-                    log.debug("finished crate %s", seat.format_time(perf_counter() - start_seconds))
-                    log.info("result: %s", crate.result)
-                else:
-                    log.info("skipping crate")
 
-                    crate.set_result(processed_crates[crate.destination])
+def _get_invalid_crates(pallets, destinations=None):
+    """pallets: Pallet[]
+    destinations: set - the optional destinations of the selected crates
 
+    returns a list of the selected crates that were skipped by `_get_crates_to_process` because of invalid data
+    excluding duplicates
+    """
+    crates = {}
 
-def process_pallets(pallets):
+    for pallet in pallets:
+        for crate in pallet.get_crates():
+            if destinations is not None and crate.destination not in destinations:
+                continue
+
+            if crate.result[0] == Crate.INVALID_DATA:
+                crates.setdefault(crate.destination, crate)
+
+    return list(crates.values())
+
+
+def process_pallets(pallets, pallet_arg=None, on_processed=None):
     """pallets: Pallet[]
+    pallet_arg: string - the argument that the pallets were built with
+    on_processed: Function - an optional function that is called with each pallet after it has been processed or skipped
 
-    Loop over all pallets, check if data has changed, and determine whether to process.
+    Loop over all pallets, check if data has changed, and determine whether to process. Pallets are processed in
+    `palletWorkers` worker processes when it is greater than one.
     """
+    log.info("processing pallets...")
 
-    verb = "processing"
+    if max(int(config.get_config_prop("palletWorkers", 1)), 1) > 1:
+        with PalletPipeline(pallet_arg, on_processed) as pipeline:
+            for pallet in pallets:
+                pipeline.put(pallet)
+
+        return
 
-    log.info("%s pallets...", verb)
+    #: release any connections left over from processing crates once rather than before every pallet
+    arcpy.ClearWorkspaceCache_management()
 
     for pallet in pallets:
-        try:
-            if pallet.is_ready_to_ship():  #: checks for schema changes or errors
-                if pallet.requires_processing():  #: checks for data that was updated
-                    log.info("%s pallet: %r", verb, pallet)
-                    start_seconds = perf_counter()
+        _process_pallet(pallet)
+
+        if on_processed is not None:
+            on_processed(pallet)
+
+
+def _process_pallet(pallet):
+    """pallet: Pallet
+
+    Checks if the pallet's data has changed and calls process if it has.
+    """
+    verb = "processing"
+
+    if not _requires_processing(pallet):
+        return
+
+    try:
+        log.info("%s pallet: %r", verb, pallet)
+        start_seconds = perf_counter()
 
-                    arcpy.ResetEnvironments()
-                    arcpy.ClearWorkspaceCache_management()
+        arcpy.ResetEnvironments()
 
-                    with seat.timed_pallet_process(pallet, "process"):
-                        pallet.process()
+        with seat.timed_pallet_process(pallet, "process"):
+            pallet.process()
 
-                    log.debug(
-                        "%s pallet %s", verb.replace("ing", "ed"), seat.format_time(perf_counter() - start_seconds)
+        log.debug("%s pallet %s", verb.replace("ing", "ed"), seat.format_time(perf_counter() - start_seconds))
+    except Exception as e:
+        pallet.success = (False, str(e))
+        log.error("error %s pallet: %s for pallet: %r", verb, e, pallet, exc_info=True)
+
+        if is_schema_lock(e):
+            arcpy.ClearWorkspaceCache_management()
+
+
+def _requires_processing(pallet):
+    """pallet: Pallet
+
+    returns True if the pallet is ready to ship and has data that was updated
+    """
+    try:
+        #: checks for schema changes or errors and then for data that was updated
+        return pallet.is_ready_to_ship() and pallet.requires_processing()
+    except Exception as e:
+        pallet.success = (False, str(e))
+        log.error("error processing pallet: %s for pallet: %r", e, pallet, exc_info=True)
+
+        return False
+
+
+class PalletPipeline(object):
+    """Processes pallets in `palletWorkers` worker processes as they are put into the pipeline so that
+    `Pallet.process` can run as soon as a pallet's crates are finished rather than waiting for the crates of every
+    other pallet. For use in with statements.
+
+    `Pallet.process` never runs on a thread of the forklift process because the arcpy environment is shared by
+    every thread. Pallets that share workspaces are processed one at a time in the order that they were put.
+    """
+
+    def __init__(self, pallet_arg=None, on_processed=None):
+        self.queue = Queue()
+        self.thread = Thread(target=self._work, name="pallet-pipeline", daemon=True)
+        #: the number of worker processes that pallets are processed in
+        self.workers = max(int(config.get_config_prop("palletWorkers", 1)), 1)
+        #: the argument that the pallets were built with so that they can be rebuilt in the worker processes
+        self.pallet_arg = pallet_arg
+        #: an optional function that is called with each pallet after it has been processed or skipped
+        self.on_processed = on_processed
+
+    def put(self, pallet):
+        """pallet: Pallet
+
+        queues the pallet to be processed
+        """
+        log.debug("pallet ready for processing: %r", pallet)
+        self.queue.put(pallet)
+
+    def _work(self):
+        pending = []
+        running = {}
+        closing = False
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while not closing or len(pending) > 0 or len(running) > 0:
+                item = self.queue.get()
+
+                if item is None:
+                    closing = True
+                elif isinstance(item, Future):
+                    pallet = running.pop(item)
+
+                    self._finish(pallet, item)
+                    self._processed(pallet)
+                elif _requires_processing(item):
+                    pending.append(item)
+                else:
+                    self._processed(item)
+
+                for pallet in self._get_startable(pending, list(running.values())):
+                    pending.remove(pallet)
+
+                    log.info("processing pallet in a worker process: %r", pallet)
+                    crate_results = {crate.destination: crate.result for crate in pallet.get_crates()}
+                    future = executor.submit(
+                        process_pallet_in_worker, pallet.name, self.pallet_arg, crate_results, config.config_location
                     )
+
+                    running[future] = pallet
+                    future.add_done_callback(self.queue.put)
+
+    def _get_startable(self, pending, running):
+        """pending: Pallet[] - pallets waiting to be processed in the order that they were put
+        running: Pallet[] - pallets that are being processed
+
+        returns the pending pallets that do not share any workspaces with a running pallet or with a pallet that was
+        put before them
+        """
+        startable = []
+        blocking = [pallet.get_workspaces() for pallet in running]
+
+        for pallet in pending:
+            if len(running) + len(startable) >= self.workers:
+                break
+
+            workspaces = pallet.get_workspaces()
+            if not any(workspaces_overlap(workspaces, other) for other in blocking):
+                startable.append(pallet)
+
+            blocking.append(workspaces)
+
+        return startable
+
+    def _finish(self, pallet, future):
+        """pallet: Pallet
+        future: Future - the result of `process_pallet_in_worker`
+
+        copies the success and processing time from the worker process to the pallet
+        """
+        try:
+            success, seconds = future.result()
         except Exception as e:
-            pallet.success = (False, str(e))
-            log.error("error %s pallet: %s for pallet: %r", verb, e, pallet, exc_info=True)
+            success, seconds = (False, str(e)), 0
+
+        pallet.success = success
+        pallet.add_processing_time("process", seconds)
+
+        if success[0]:
+            log.debug("processed pallet %r %s", pallet, seat.format_time(seconds))
+        else:
+            log.error("error processing pallet: %s for pallet: %r", success[1], pallet)
+
+    def _processed(self, pallet):
+        """pallet: Pallet
+
+        calls on_processed if it was set
+        """
+        if self.on_processed is not None:
+            self.on_processed(pallet)
+
+    def __enter__(self):
+        log.info("processing pallets in %d worker processes...", self.workers)
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def workspaces_overlap(workspaces, other_workspaces):
+    """workspaces: set - normalized workspace paths from `Pallet.get_workspaces`
+    other_workspaces: set
+
+    returns True if any of the workspaces are the same as or are inside of any of the other workspaces
+    """
+    for workspace in workspaces:
+        for other in other_workspaces:
+            if workspace == other or workspace.startswith(other + path.sep) or other.startswith(workspace + path.sep):
+                return True
+
+    return False
+
+
+def process_pallet_in_worker(pallet_name, pallet_arg, crate_results, config_location):
+    """pallet_name: string - the name of the pallet in the `file_path:ClassName` format
+    pallet_arg: string - the argument that the pallet was built with
+    crate_results: dictionary - the result of each crate keyed by the crate destination
+    config_location: string - the path to the config file of the parent process
+
+    Rebuilds the pallet in a worker process, restores the results of its crates, and calls `process`.
+
+    returns a tuple of the pallet success and the number of seconds that `process` took
+    """
+    from . import engine
+
+    config.config_location = config_location
+
+    pallets, import_errors = engine.build_pallets(pallet_name, pallet_arg)
+    if len(pallets) == 0:
+        return (False, "could not rebuild the pallet: {}".format(", ".join(import_errors))), 0
+
+    pallet = pallets[0]
+    if not pallet.success[0]:
+        return pallet.success, 0
+
+    for crate in pallet.get_crates():
+        crate.result = crate_results.get(crate.destination, crate.result)
+
+    arcpy.ResetEnvironments()
+
+    try:
+        with seat.timed_pallet_process(pallet, "process"):
+            pallet.process()
+    except Exception as e:
+        pallet.success = (False, str(e))
+        log.error("error processing pallet: %s for pallet: %r", e, pallet, exc_info=True)
+
+    return pallet.success, pallet.processing_times.get("process", 0)
 
 
 def dropoff_data(pallets, dropoff_location):
@@ -319,6 +775,23 @@ def copy_data(from_location, to_template, packing_slip_file, machine_name=None):
     return successful, failed
 
 
+def get_size(locations):
+    """locations: string[] - paths to files or folders
+
+    returns the total number of bytes in the files and the files in the folders
+    """
+    size = 0
+
+    for location in locations:
+        if path.isfile(location):
+            size += path.getsize(location)
+
+        for root, _, files in walk(location):
+            size += sum(path.getsize(path.join(root, file_name)) for file_name in files)
+
+    return size
+
+
 def _remove_hash_from_workspace(workspace):
     """workspace: String
 
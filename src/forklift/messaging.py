@@ -14,11 +14,8 @@ from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Attachment, Disposition, FileContent, FileName, FileType
 from smtplib import SMTP
 
-import pkg_resources
 import requests
 
 from .config import get_config_prop
@@ -87,6 +84,10 @@ def _send_email_with_sendgrid(email_server, to, subject, body, attachments=[]):
 
     Send an email.
     """
+    #: sendgrid is imported here because it is slow to import and only used by this function
+    from sendgrid import SendGridAPIClient
+    from sendgrid.helpers.mail import Mail, Attachment, Disposition, FileContent, FileName, FileType
+
     from_address = email_server["fromAddress"]
     api_key = email_server["apiKey"]
 
@@ -155,6 +156,8 @@ def _send_email_with_smtp(email_server, to, subject, body, attachments=[]):
     else:
         message = body
 
+    import pkg_resources
+
     version = MIMEText(f'<p>Forklift version: {pkg_resources.require("forklift")[0].version}</p>', "html")
     message.attach(version)
 
@@ -7,20 +7,71 @@ A module that contains the model classes for forklift
 """
 
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from inspect import getsourcefile
-from os.path import dirname, join
+from os import cpu_count, sep
+from os.path import dirname, join, normpath
+from sys import getsizeof
 from time import perf_counter
 
 from xxhash import xxh64
 
-import arcgis
-import arcpy
-
 from . import config, seat
+from .cache import PalletCache
+from .describes import arcpy_env_lock, describes_cache, names_cache
+from .exceptions import ParallelMapException
 from .messaging import send_email
 
-names_cache = {}
-describes_cache = {}
+arcgis = seat.lazy_import("arcgis")
+arcpy = seat.lazy_import("arcpy")
+
+
+def get_executor_workers():
+    """returns the number of workers for the pallet executors from the `palletExecutorWorkers` config value or the
+    number of cpus that are not used by the crate and pallet workers
+    """
+    workers = config.get_config_prop("palletExecutorWorkers", None)
+
+    if workers is None:
+        used = config.get_config_prop("crateWorkers", 1) + config.get_config_prop("palletWorkers", 1)
+        workers = (cpu_count() or 1) - used
+
+    return max(int(workers), 1)
+
+
+def resolve_crates(crates, workers=1):
+    """crates: Crate[]
+    workers: number - the number of source workspaces that are resolved at the same time
+
+    Resolves the crates that have not been used yet one source workspace at a time so that each workspace is listed
+    once by a single thread and the crates of different workspaces are described at the same time
+    """
+    workspaces = {}
+    for crate in crates:
+        if not crate._resolved:
+            workspaces.setdefault(crate.source_workspace, []).append(crate)
+
+    def resolve_workspace(workspace_crates):
+        for crate in workspace_crates:
+            crate.resolve()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="resolve") as executor:
+        list(executor.map(resolve_workspace, workspaces.values()))
+
+
+def _validate_table_name(name, workspace):
+    """name: string
+    workspace: string
+
+    returns the name as it would be created in the workspace using env.workspace for the rules
+    """
+    with arcpy_env_lock:
+        temp = arcpy.env.workspace
+        arcpy.env.workspace = workspace
+        valid_name = arcpy.ValidateTableName(name, workspace)
+        arcpy.env.workspace = temp
+
+    return valid_name
 
 
 class Pallet(object):
@@ -59,6 +110,9 @@ class Pallet(object):
         #: the format of the tuple is two strings: `('<Folder>/<ServiceName>', '<ServiceType>')`
         #: for example: `[('PoliticalDistricts', 'MapServer'), ('DEQEnviro/Toolbox', 'GPServer')]`
         self.arcgis_services = []
+        #: a list of additional workspaces or folders that `process` reads from or writes to
+        #: pallets that share workspaces are never processed at the same time
+        self.resources = []
         #: default output coordinate system and transformation
         self.destination_coordinate_system = arcpy.SpatialReference(3857)
         self.geographic_transformation = "NAD_1983_To_WGS_1984_5"
@@ -72,6 +126,7 @@ class Pallet(object):
         self.total_processing_time = 0
         self.processing_times = {}
         self.timers = {}
+        self._cache = None
 
     def build(self, configuration="Production"):
         """configuration: string `Production`, `Staging`, or `Dev`
@@ -162,6 +217,15 @@ class Pallet(object):
         """
         return NotImplemented
 
+    def get_workspaces(self):
+        """Returns a set of the normalized paths to all of the workspaces that this pallet touches when it is
+        processed. This includes the `copy_data` items, the crate destination workspaces, and the `resources`.
+        """
+        workspaces = set(self.copy_data) | set(self.resources)
+        workspaces.update(crate.destination_workspace for crate in self._crates)
+
+        return {normpath(workspace).lower().rstrip(sep) for workspace in workspaces if workspace}
+
     def is_ready_to_ship(self):
         """Returns True if there are not any schema changes or errors within the crates
         associated with the pallet. Returns True if there are no crates defined.
@@ -205,16 +269,94 @@ class Pallet(object):
         """
         self.timers[name] = perf_counter()
 
-    def stop_timer(self, name):
+    def stop_timer(self, name, add_to_total=True):
         """name: string
+        add_to_total: boolean - False for timers that run inside of another timer
 
         Records a processing time and adds it to the total processing time for the pallet.
         """
-        processing_time = self.processing_times.setdefault(name, 0)
-        processing_time += perf_counter() - self.timers[name]
+        self.add_processing_time(name, perf_counter() - self.timers[name], add_to_total)
+
+    def add_processing_time(self, name, seconds, add_to_total=True):
+        """name: string
+        seconds: number
+        add_to_total: boolean - False for times that are already a part of another processing time
+
+        Adds seconds to the processing time for name and to the total processing time for the pallet.
+        """
+        self.processing_times[name] = self.processing_times.get(name, 0) + seconds
+
+        if add_to_total:
+            self.total_processing_time += seconds
+
+    def get_cache(self):
+        """Returns a `PalletCache` that is stored in the garage for values that are expensive to download or compute
+        and can be reused between lifts. For example:
+
+            domains = self.get_cache().get_or_set(make_key(url), lambda: requests.get(url).json(), ttl=24 * 60 * 60)
+        """
+        if self._cache is None:
+            self._cache = PalletCache(self.name)
 
-        self.processing_times[name] = processing_time
-        self.total_processing_time += processing_time
+        return self._cache
+
+    def get_executor(self, processes=False):
+        """processes: boolean - True to use worker processes instead of threads
+
+        Returns an executor for running the heavy steps of `process` or `ship` concurrently. The number of workers is
+        the `palletExecutorWorkers` config value or the cpus that are left over after forklift's own crate and pallet
+        workers. Functions that are run in worker processes must be importable (e.g. defined at the module level).
+
+        Use in a with statement so that the workers are shut down:
+
+            with self.get_executor() as executor:
+                futures = [executor.submit(self.clip, name) for name in names]
+        """
+        workers = get_executor_workers()
+
+        if processes:
+            return ProcessPoolExecutor(max_workers=workers)
+
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__)
+
+    def map(self, function, items, name="map", processes=False):
+        """function: Function - called with each item
+        items: iterable
+        name: string - the name of the processing time that is recorded for the report
+        processes: boolean - True to call the function in worker processes instead of threads
+
+        Calls the function with every item using the executor from `get_executor`. Every item is attempted even if
+        another item fails.
+
+        returns a list of the return values in the same order as `items` or raises a `ParallelMapException` containing
+        the items that failed if any of the calls raised an exception
+        """
+        items = list(items)
+        results = [None] * len(items)
+        errors = []
+
+        self.start_timer(name)
+
+        try:
+            with self.get_executor(processes) as executor:
+                futures = {executor.submit(function, item): index for index, item in enumerate(items)}
+
+                for future in as_completed(futures):
+                    index = futures[future]
+
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        self.log.error("error calling %s with %s for pallet: %r", name, items[index], self, exc_info=e)
+                        errors.append((items[index], e))
+        finally:
+            #: map is called from within process or ship which are already timed
+            self.stop_timer(name, add_to_total=False)
+
+        if len(errors) > 0:
+            raise ParallelMapException(name, errors, results)
+
+        return results
 
     def get_report(self):
         """Returns an object with data about the results of the pallet for use in the report."""
@@ -227,22 +369,24 @@ class Pallet(object):
             "message": self.success[1] or "",
             "crates": [crate.get_report() for crate in self._crates if crate.get_report() is not None],
             "total_processing_time": seat.format_time(self.total_processing_time),
+            "cache": self._cache.get_report() if self._cache is not None else None,
         }
 
     def add_packing_slip(self, slip):
         """slip: object
 
-        Adds the slip to the pallet
+        Adds the slip to the pallet and restores the crate results from it without describing the crate sources
         """
         self.slip = slip
 
-        crate_objects_by_name = {crate.destination_name: crate for crate in self.get_crates()}
-        for slip_crate in slip["crates"]:
+        slip_crates_by_name = {slip_crate["name"]: slip_crate for slip_crate in slip["crates"]}
+        for crate in self.get_crates():
             try:
-                crate_objects_by_name[slip_crate["name"]].result = [slip_crate["result"]]
+                slip_crate = slip_crates_by_name[crate.destination_name]
+                crate.result = (slip_crate["result"], slip_crate.get("crate_message") or None)
             except KeyError:
-                #: if the crate is not in the packing list, leave it uninitialized
-                pass
+                #: crates with no changes are not in the packing slip
+                crate.result = (Crate.NO_CHANGES, None)
 
     def configure_standalone_logging(self, level=logging.INFO):
         """set up logger for running the pallet as a standalone script outside of the forklift process"""
@@ -268,6 +412,10 @@ class Crate(object):
     UNINITIALIZED = "This crate was never processed."
     ERROR = "There was an error."  #: This can be used to manually set an error on a crate from within a pallet.
 
+    #: the rows that can be captured during core.update for use in `Pallet.process` (see `capture_rows`)
+    CAPTURE_ADDS = "adds"
+    CAPTURE_ALL = "all"
+
     def __init__(
         self,
         source_name,
@@ -276,35 +424,38 @@ class Crate(object):
         destination_name=None,
         destination_coordinate_system=None,
         geographic_transformation=None,
-        describer=arcpy.da.Describe,
+        describer=None,
     ):
         #: the logging module to keep track of the crate
         self.log = logging.getLogger("forklift")
-        #: the name of the source data table
-        self.source_name = source_name
+        #: the name of the source data table. See the `source_name` property
+        self._source_name = source_name
         #: the name of the source database
         self.source_workspace = source_workspace.lower()
         #: the name of the destination database
         self.destination_workspace = destination_workspace.lower()
-        #: the result of the core.update method being called on this crate
-        self.result = (self.UNINITIALIZED, None)
+        #: the result of the core.update method being called on this crate. See the `result` property
+        self._result = (self.UNINITIALIZED, None)
+        #: the number of source rows that were read during the last update
+        self.total_rows = None
+        #: the seconds that the last update took
+        self.processing_time = None
+        #: the number of rows that the last update added and deleted or None if they were not counted
+        self.adds = None
+        self.deletes = None
+        #: the seconds that each part of the last update took keyed by the name of the part e.g. hash or edit
+        self.phase_times = {}
+        #: True if the result was restored from the journal of a lift that was resumed rather than updated
+        self.resumed = False
+        #: the rows to capture during the next update. One of the CAPTURE_* constants or None
+        self.capture = None
+        #: the RowCapture from the last update
+        self.captured = None
+        #: the seconds that an update is allowed to take before it is stopped. Overrides `crateTimeoutSeconds`
+        self.timeout = None
         #: the name of the output data table
         self.destination_name = destination_name or source_name
 
-        #: crate_valid_table_name using env.workspace for the rules
-        temp = arcpy.env.workspace
-        arcpy.env.workspace = destination_workspace
-        valid_destination_name = arcpy.ValidateTableName(self.destination_name, self.destination_workspace)
-        arcpy.env.workspace = temp
-
-        if valid_destination_name != self.destination_name:
-            self.result = (
-                Crate.INVALID_DATA,
-                "Validation error with destination_name: {} != {}".format(
-                    self.destination_name, valid_destination_name
-                ),
-            )
-
         #: optional definition of destination coordinate system to support reprojecting
         if destination_coordinate_system is not None and isinstance(destination_coordinate_system, int):
             destination_coordinate_system = arcpy.SpatialReference(destination_coordinate_system)
@@ -317,24 +468,50 @@ class Crate(object):
         #: the hash table name of a crate
         self.name = "{1}_{0}".format(xxh64(self.destination).hexdigest(), self.destination_name).replace(".", "_")
 
-        #: the full path to the source data
-        self.source = join(source_workspace, source_name)
+        #: the full path to the source data. See the `source` property
+        self._source = join(source_workspace, source_name)
+        #: the describe of the source data. See the `source_describe` property
+        self._source_describe = None
+        self._describer = describer
+        #: the source name, destination name, and source describe are checked the first time that they are used
+        #: (or by `resolve_crates`) rather than when the crate is built
+        self._name_resolved = False
+        self._resolved = False
+
+    @property
+    def source_name(self):
+        """the name of the source data table. Names in .sde workspaces without a "." are replaced with the
+        fully-qualified name from the workspace the first time that this is used
+        """
+        self._resolve_name()
 
-        #: try to find the full-qualified source name if it doesn't have any "."s in it
-        if ".sde" in self.source.lower() and "." not in self.source_name:
-            self._try_to_find_data_source_by_name()
+        return self._source_name
 
-        try:
-            if self.source.lower() in describes_cache:
-                self.log.debug("describes cache hit")
-                self.source_describe = describes_cache[self.source.lower()]
-            else:
-                self.source_describe = describer(self.source)
-                describes_cache[self.source.lower()] = self.source_describe
-        except Exception as e:
-            self.result = (Crate.INVALID_DATA, str(e))
+    @property
+    def source(self):
+        """the full path to the source data"""
+        self._resolve_name()
 
-            return
+        return self._source
+
+    @property
+    def source_describe(self):
+        """the `arcpy.da.Describe` dictionary of the source data or None if it could not be described"""
+        self.resolve()
+
+        return self._source_describe
+
+    @property
+    def result(self):
+        """the result of the core.update method being called on this crate"""
+        if self._result[0] == Crate.UNINITIALIZED:
+            self.resolve()
+
+        return self._result
+
+    @result.setter
+    def result(self, value):
+        self._result = value
 
     def set_source_name(self, value):
         """value: string
@@ -344,8 +521,67 @@ class Crate(object):
         if value is None:
             return
 
-        self.source_name = value
-        self.source = join(self.source_workspace, value)
+        self._name_resolved = True
+        self._source_name = value
+        self._source = join(self.source_workspace, value)
+
+    def resolve(self):
+        """Validates the destination name, finds the fully-qualified source name, and describes the source. Problems
+        are set as an `INVALID_DATA` result. This happens once, the first time that the result or source describe is
+        used.
+        """
+        if self._resolved:
+            return
+
+        valid_destination_name = _validate_table_name(self.destination_name, self.destination_workspace)
+        if valid_destination_name != self.destination_name:
+            self._set_invalid(
+                "Validation error with destination_name: {} != {}".format(self.destination_name, valid_destination_name)
+            )
+
+        source = self.source
+
+        try:
+            self._source_describe = describes_cache.get(source)
+
+            if self._source_describe is not None:
+                self.log.debug("describes cache hit")
+            else:
+                self._source_describe = (self._describer or arcpy.da.Describe)(source)
+                describes_cache.set(source, self._source_describe)
+        except Exception as e:
+            self._set_invalid(str(e))
+
+        self._resolved = True
+
+    def capture_rows(self, rows=CAPTURE_ADDS):
+        """rows: string - `Crate.CAPTURE_ADDS` for the rows that were added or updated or `Crate.CAPTURE_ALL` for all
+        of the current rows
+
+        Opts in to keeping the rows that are read from the source while this crate is updated so that `Pallet.process`
+        can use them from `get_captured_rows` rather than opening new cursors on the destination. Call this in
+        `Pallet.build`. Rows are only captured for crates that are hashed (not change detection tables) and are
+        dropped if they are larger than the `captureMaxBytes` config value.
+        """
+        self.capture = rows
+
+    def get_captured_rows(self):
+        """Returns a NumPy structured array of the rows that were captured during the last update or None if the rows
+        were not captured. Geometries are WKT in the source coordinate system in the `SHAPE@WKT` column.
+        """
+        if self.captured is None:
+            return None
+
+        return self.captured.to_array(adds_only=self.capture != Crate.CAPTURE_ALL)
+
+    def get_deleted_hashes(self):
+        """Returns a list of the hashes of the rows that were deleted from the destination during the last update or
+        None if the rows were not captured.
+        """
+        if self.captured is None:
+            return None
+
+        return self.captured.deletes
 
     def set_result(self, value):
         """value: (String, String)
@@ -423,6 +659,24 @@ class Crate(object):
         """returns True if the crate was created or updated"""
         return self.result[0] in [Crate.CREATED, Crate.UPDATED, Crate.UPDATED_OR_CREATED_WITH_WARNINGS]
 
+    def _resolve_name(self):
+        """try to find the full-qualified source name if it doesn't have any "."s in it"""
+        if self._name_resolved:
+            return
+
+        self._name_resolved = True
+
+        if ".sde" in self._source.lower() and "." not in self._source_name:
+            self._try_to_find_data_source_by_name()
+
+    def _set_invalid(self, message):
+        """message: string
+
+        sets the result to `INVALID_DATA` unless the crate already has a result
+        """
+        if self._result[0] == Crate.UNINITIALIZED:
+            self._result = (Crate.INVALID_DATA, message)
+
     def _try_to_find_data_source_by_name(self):
         """try to find the source name in the source workspace.
         if it is found, update the crate name so subsequent uses do not fail.
@@ -431,30 +685,32 @@ class Crate(object):
         """
 
         def filter_filenames(workspace, name):
-            if workspace in names_cache:
+            names = names_cache.get(workspace)
+
+            if names is not None:
                 self.log.debug("cache hit for workspace: %s", workspace)
-                names = names_cache[workspace]
             else:
                 self.log.debug("cache miss for workspace: %s", workspace)
-                arcpy.env.workspace = workspace
 
                 def default_to_empty(list):
                     if list is None:
                         return []
                     return list
 
-                names = default_to_empty(arcpy.ListFeatureClasses()) + default_to_empty(arcpy.ListTables())
-                arcpy.env.workspace = None
+                with arcpy_env_lock:
+                    arcpy.env.workspace = workspace
+                    names = default_to_empty(arcpy.ListFeatureClasses()) + default_to_empty(arcpy.ListTables())
+                    arcpy.env.workspace = None
 
-                names_cache[workspace] = names
+                names_cache.set(workspace, names)
 
             #: could get a value like db.owner.***name and db.owner.name so filter on name
-            return [fc for fc in names if fc.split(".")[-1] == self.source_name]
+            return [fc for fc in names if fc.split(".")[-1] == self._source_name]
 
-        names = filter_filenames(self.source_workspace, self.source_name)
+        names = filter_filenames(self.source_workspace, self._source_name)
 
         if names is None or len(names) < 1:
-            not_found_message = "No source data found for {}".format(self.source)
+            not_found_message = "No source data found for {}".format(self._source)
 
             return (False, not_found_message)
 
@@ -477,6 +733,59 @@ class Crate(object):
         )
 
 
+class RowCapture(object):
+    """A class that holds the rows of a crate that were read while hashing it as long as they fit within a memory
+    budget."""
+
+    def __init__(self, fields, max_bytes):
+        #: the names of the values in each row
+        self.fields = fields
+        #: the estimated size of the rows before they are dropped
+        self.max_bytes = max_bytes
+        self.rows = []
+        #: True for each row that was added or updated
+        self.added = []
+        #: the hashes of the rows that were deleted
+        self.deletes = []
+        self.size = 0
+        self.overflowed = False
+
+    def add(self, row, added):
+        """row: tuple
+        added: boolean - True if the row is new or updated
+
+        keeps the row unless the capture has gone over max_bytes in which case all of the rows are dropped
+        """
+        if self.overflowed:
+            return
+
+        self.size += getsizeof(row) + sum(getsizeof(value) for value in row)
+
+        if self.size > self.max_bytes:
+            self.overflowed = True
+            self.rows = []
+            self.added = []
+
+            return
+
+        self.rows.append(row)
+        self.added.append(added)
+
+    def to_array(self, adds_only=False):
+        """adds_only: boolean - True to only return the rows that were added or updated
+
+        returns the rows as a NumPy structured array
+        """
+        import numpy
+
+        rows = [row for row, added in zip(self.rows, self.added) if added or not adds_only]
+
+        if len(rows) == 0:
+            return numpy.array([], dtype=[(field, object) for field in self.fields])
+
+        return numpy.rec.fromrecords(rows, names=self.fields)
+
+
 class Changes(object):
     """A module that contains the adds and deletes for when checking for changes."""
 
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+plan.py
+
+A module that plans a lift by checking each crate for changes without writing to any destination, drop off, or
+scratch data
+"""
+
+import json
+import logging
+from os import linesep
+from os.path import dirname, join
+
+from . import config, core, history, seat
+from .models import Crate
+
+arcpy = seat.lazy_import("arcpy")
+log = logging.getLogger("forklift")
+plan_file_name = "plan.json"
+
+#: the ways that a crate can be updated
+CREATE = "create"
+HASH = "hash"
+TRUNCATE_AND_LOAD = "truncate and load"
+PRESERVE_GLOBAL_IDS = "preserve global ids"
+SKIP = "skip"
+INVALID = "invalid"
+
+
+def get_plan_location():
+    """returns the path to the last lift plan in the garage"""
+    return join(dirname(config.config_location), plan_file_name)
+
+
+def plan_crates(pallets, change_detection, destinations=None):
+    """pallets: Pallet[]
+    change_detection: ChangeDetection - created with `read_only=True`
+    destinations: set - the optional destinations of the crates that were selected by `lift.select_crates`
+
+    Plans each crate once even if it is in multiple pallets and estimates how long it will take from its history
+
+    returns a list of crate plan dictionaries from `plan_crate` with `estimated_seconds`
+    """
+    if core.log is None:
+        core.log = log
+
+    crates = {}
+    for pallet in pallets:
+        for crate in pallet.get_crates():
+            if destinations is None or crate.destination in destinations:
+                crates.setdefault(crate.destination, (crate, pallet))
+
+    plans = {}
+    for crate, pallet in crates.values():
+        log.info("planning crate: %s", crate.destination_name)
+        plans[crate.name] = plan_crate(crate, pallet.validate_crate, change_detection)
+
+    try:
+        estimates = history.estimate_durations(
+            [crate for crate, _ in crates.values()], lambda crate: plans[crate.name]["source_rows"]
+        )
+    except Exception as e:
+        log.warning("could not estimate crate durations from history: %s", e)
+        estimates = {}
+
+    for name, crate_plan in plans.items():
+        crate_plan["estimated_seconds"] = estimates.get(name)
+
+    return list(plans.values())
+
+
+def plan_crate(crate, validate_crate, change_detection):
+    """crate: Crate
+    validate_crate: Pallet.validate_crate
+    change_detection: ChangeDetection
+
+    Finds how `core.update` would update the crate and how many rows it would add and delete
+
+    returns a dictionary with the crate name, destination, strategy, adds, deletes, source rows, and a message
+    """
+    crate_plan = {
+        "name": crate.destination_name,
+        "destination": crate.destination,
+        "strategy": None,
+        "adds": 0,
+        "deletes": 0,
+        "source_rows": None,
+        "message": None,
+    }
+
+    if crate.result[0] == Crate.INVALID_DATA:
+        crate_plan.update(strategy=INVALID, message=crate.result[1])
+
+        return crate_plan
+
+    try:
+        exists = arcpy.Exists(crate.destination)
+
+        if exists:
+            try:
+                if validate_crate(crate) == NotImplemented:
+                    core.check_schema(crate)
+            except Exception as e:
+                crate_plan.update(strategy=INVALID, message=str(e))
+
+                return crate_plan
+
+        preserve_global_ids = bool(crate.source_describe.get("hasGlobalID"))
+
+        if change_detection.has_table(crate.source_name):
+            if exists and not change_detection.has_changed(crate.source_name):
+                crate_plan["strategy"] = SKIP
+
+                return crate_plan
+
+            crate_plan["strategy"] = PRESERVE_GLOBAL_IDS if preserve_global_ids else TRUNCATE_AND_LOAD
+            crate_plan["source_rows"] = crate_plan["adds"] = _count(crate.source)
+            crate_plan["deletes"] = _count(crate.destination) if exists else 0
+        elif not exists:
+            crate_plan["strategy"] = CREATE
+            crate_plan["source_rows"] = crate_plan["adds"] = _count(crate.source)
+        else:
+            changes = core.get_hash_diff(crate)
+
+            crate_plan["source_rows"] = changes.total_rows
+            crate_plan["adds"] = len(changes.adds)
+            crate_plan["deletes"] = len(changes._deletes)
+
+            if not changes.has_changes():
+                crate_plan["strategy"] = SKIP
+            else:
+                crate_plan["strategy"] = PRESERVE_GLOBAL_IDS if preserve_global_ids else HASH
+
+            if changes.has_dups:
+                crate_plan["message"] = "duplicate features detected!"
+    except Exception as e:
+        log.warning("could not plan crate %r: %s", crate, e, exc_info=True)
+        crate_plan["message"] = str(e)
+
+    return crate_plan
+
+
+def save(lift_plan, location=None):
+    """lift_plan: dictionary
+    location: string - an optional path to the file. Defaults to the garage
+
+    writes the plan as json
+    """
+    with open(location or get_plan_location(), "w", encoding="utf-8") as plan_file:
+        json.dump(lift_plan, plan_file, indent=2)
+
+
+def format_plan(lift_plan):
+    """lift_plan: dictionary - the plan from `engine.plan_lift`
+
+    returns the plan as a table for the console
+    """
+    lines = [
+        "{:<40} {:<20} {:>10} {:>10} {:>12}".format("crate", "strategy", "adds", "deletes", "estimate"),
+    ]
+
+    for crate_plan in lift_plan["crates"]:
+        estimate = crate_plan["estimated_seconds"]
+
+        lines.append(
+            "{:<40} {:<20} {:>10} {:>10} {:>12}".format(
+                crate_plan["name"][:40],
+                crate_plan["strategy"] or "unknown",
+                crate_plan["adds"],
+                crate_plan["deletes"],
+                seat.format_time(estimate) if estimate is not None else "",
+            )
+        )
+
+        if crate_plan["message"]:
+            lines.append("    {}".format(crate_plan["message"]))
+
+    lines.append(
+        "{} crates in {} pallets. estimated time: {}".format(
+            len(lift_plan["crates"]), len(lift_plan["pallets"]), seat.format_time(lift_plan["estimated_seconds"])
+        )
+    )
+
+    return linesep.join(lines)
+
+
+def _count(table):
+    """table: string
+
+    returns the number of rows in the table
+    """
+    return int(arcpy.GetCount_management(table).getOutput(0))
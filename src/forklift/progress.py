@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+progress.py
+
+A module that tracks the live progress of a lift and publishes it to a json file in the garage and an optional
+localhost http endpoint so that a long lift can be monitored without reading the log
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import replace
+from os.path import dirname, join
+from threading import RLock, Thread
+from time import perf_counter
+
+from . import config, history
+
+log = logging.getLogger("forklift")
+progress_file_name = "progress.json"
+#: the seconds between writes of the progress file when only the row counts change
+default_interval_seconds = 5
+#: the number of rows that the hash and insert loops process between progress updates
+row_interval = 10000
+#: the phases of a lift in the order that they run
+lift_phases = [
+    "git_update",
+    "build_pallets",
+    "resolve_crates",
+    "prepare_packaging_for_pallets",
+    "process_crates",
+    "process_pallets",
+    "dropoff_data",
+    "gift_wrap",
+    "report",
+]
+#: the phases of a lift whose recent median time is added to the estimate. The crates are estimated separately
+estimated_phases = [
+    "git_update",
+    "resolve_crates",
+    "prepare_packaging_for_pallets",
+    "process_pallets",
+    "dropoff_data",
+    "gift_wrap",
+]
+
+
+def get_progress_location():
+    """returns the path to the progress file in the garage"""
+    return join(dirname(config.config_location), progress_file_name)
+
+
+class Progress(object):
+    """The progress of the current lift. Every change is published to the progress file at most every
+    `progressIntervalSeconds` and the latest state is served as json when `progressPort` is set.
+
+    The estimated time remaining is made from the estimated seconds of the crates that are not finished divided by
+    `crateWorkers` and the median seconds of the remaining phases in the garage history.
+    """
+
+    def __init__(self, location=None):
+        self.location = location
+        self._lock = RLock()
+        self._server = None
+        self._reset()
+
+    def start(self, operation="lift"):
+        """operation: string
+
+        starts tracking a new run and starts the http endpoint if `progressPort` is set
+        """
+        with self._lock:
+            self._reset()
+            self.operation = operation
+            self.state = "running"
+            self.started = datetime.now()
+            self._started_seconds = perf_counter()
+
+            try:
+                self._phase_medians = history.get_phase_medians(operation)
+            except Exception as e:
+                log.debug("could not read the phase history: %s", e)
+
+        self._start_server()
+        self._write(force=True)
+
+    def set_phase(self, phase):
+        """phase: string - one of `lift_phases`
+
+        records that the run moved on to the phase
+        """
+        with self._lock:
+            if self.state != "running":
+                return
+
+            self.phase = phase
+            self._phase_started_seconds = perf_counter()
+
+        self._write(force=True)
+
+    def add_crates(self, crates, estimates=None):
+        """crates: Crate[] - the crates that will be processed
+        estimates: dictionary - the optional estimated seconds of each crate keyed by `Crate.name`
+
+        adds the crates to the pending crates
+        """
+        estimates = estimates or {}
+
+        with self._lock:
+            if self.state != "running":
+                return
+
+            for crate in crates:
+                self._pending[crate.name] = {
+                    "name": crate.destination_name,
+                    "estimated_seconds": estimates.get(crate.name),
+                }
+
+        self._write(force=True)
+
+    def start_crate(self, crate):
+        """crate: Crate
+
+        moves the crate from the pending crates to the current crates
+        """
+        with self._lock:
+            if self.state != "running":
+                return
+
+            pending = self._pending.pop(crate.name, {"name": crate.destination_name, "estimated_seconds": None})
+            now = perf_counter()
+            self._current[crate.name] = dict(pending, phase=None, rows=0, started=now, phase_started=now)
+
+        self._write(force=True)
+
+    def set_rows(self, crate, phase, rows):
+        """crate: Crate
+        phase: string - the part of the update e.g. hash or insert
+        rows: number - the rows that the phase has processed so far
+
+        records the rows that a current crate has processed
+        """
+        with self._lock:
+            current = self._current.get(crate.name)
+            if current is None:
+                return
+
+            if current["phase"] != phase:
+                current["phase"] = phase
+                current["phase_started"] = perf_counter()
+
+            current["rows"] = rows
+
+        self._write()
+
+    def finish_crate(self, crate):
+        """crate: Crate
+
+        moves the crate from the current crates to the finished crates
+        """
+        with self._lock:
+            if self.state != "running":
+                return
+
+            self._current.pop(crate.name, None)
+            self._finished += 1
+
+        self._write(force=True)
+
+    def finish(self):
+        """records that the run finished and stops the http endpoint"""
+        with self._lock:
+            self.state = "finished"
+            self.phase = None
+
+        self._write(force=True)
+        self._stop_server()
+
+    def get_status(self):
+        """returns a json serializable dictionary of the progress"""
+        with self._lock:
+            now = perf_counter()
+            current = [
+                {
+                    "name": crate["name"],
+                    "phase": crate["phase"],
+                    "rows": crate["rows"],
+                    "rows_per_second": _get_rate(crate["rows"], now - crate["phase_started"]),
+                    "seconds": now - crate["started"],
+                    "estimated_seconds": crate["estimated_seconds"],
+                }
+                for crate in self._current.values()
+            ]
+            remaining = self._get_remaining_seconds(current, now) if self.state == "running" else 0
+
+            return {
+                "operation": self.operation,
+                "state": self.state,
+                "started": self.started.isoformat(timespec="seconds") if self.started else None,
+                "updated": datetime.now().isoformat(timespec="seconds"),
+                "phase": self.phase,
+                "elapsed_seconds": now - self._started_seconds if self.started else 0,
+                "crates": {
+                    "total": self._finished + len(self._current) + len(self._pending),
+                    "finished": self._finished,
+                    "current": current,
+                    "pending": [crate["name"] for crate in self._pending.values()],
+                },
+                "estimated_remaining_seconds": remaining,
+                "eta": (datetime.now() + timedelta(seconds=remaining)).isoformat(timespec="seconds"),
+            }
+
+    def _get_remaining_seconds(self, current, now):
+        """current: dictionary[] - the current crates from `get_status`
+        now: number - the perf_counter value
+
+        returns the estimated seconds until the run finishes
+        """
+        crate_seconds = sum(crate["estimated_seconds"] or 0 for crate in self._pending.values())
+        crate_seconds += sum(max((crate["estimated_seconds"] or 0) - crate["seconds"], 0) for crate in current)
+        remaining = crate_seconds / max(config.get_config_prop("crateWorkers", 1), 1)
+
+        position = lift_phases.index(self.phase) if self.phase in lift_phases else -1
+        for phase in lift_phases[position:] if position >= 0 else []:
+            if phase not in estimated_phases:
+                continue
+
+            median = self._phase_medians.get(phase, 0)
+            if phase == self.phase:
+                median = max(median - (now - self._phase_started_seconds), 0)
+
+            remaining += median
+
+        return remaining
+
+    def _write(self, force=False):
+        """force: boolean - write even if the interval has not passed
+
+        writes the status to the progress file
+        """
+        now = perf_counter()
+
+        with self._lock:
+            if self.state is None:
+                return
+
+            interval = config.get_config_prop("progressIntervalSeconds", default_interval_seconds)
+            if not force and now - self._written_seconds < interval:
+                return
+
+            self._written_seconds = now
+            status = self.get_status()
+
+        location = self.location or get_progress_location()
+
+        try:
+            with open(location + ".tmp", "w", encoding="utf-8") as progress_file:
+                json.dump(status, progress_file, indent=2)
+
+            replace(location + ".tmp", location)
+        except OSError as e:
+            log.debug("could not write the progress file: %s", e)
+
+    def _start_server(self):
+        """serves the status on localhost if `progressPort` is set"""
+        self._stop_server()
+
+        port = config.get_config_prop("progressPort", None)
+        if not port:
+            return
+
+        try:
+            self._server = ThreadingHTTPServer(("localhost", port), _ProgressHandler)
+        except OSError as e:
+            log.warning("could not serve the progress on port %s: %s", port, e)
+
+            return
+
+        self._server.progress = self
+        Thread(target=self._server.serve_forever, name="forklift-progress", daemon=True).start()
+
+        log.info("serving the lift progress on http://localhost:%s", port)
+
+    def _stop_server(self):
+        """stops the http endpoint if it is running"""
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+
+    def _reset(self):
+        """clears the progress of the last run"""
+        self.operation = None
+        #: running or finished. None before the first run
+        self.state = None
+        self.started = None
+        self.phase = None
+        self._started_seconds = 0
+        self._phase_started_seconds = 0
+        self._written_seconds = 0
+        self._phase_medians = {}
+        #: the crates keyed by `Crate.name`
+        self._pending = {}
+        self._current = {}
+        self._finished = 0
+
+
+class _ProgressHandler(BaseHTTPRequestHandler):
+    """Responds to any GET request with the status of the server's progress"""
+
+    def do_GET(self):
+        body = json.dumps(self.server.progress.get_status()).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("progress request: " + format, *args)
+
+
+def _get_rate(rows, seconds):
+    """rows: number
+    seconds: number
+
+    returns the rows per second or None if there are no rows yet
+    """
+    if not rows or seconds <= 0:
+        return None
+
+    return rows / seconds
+
+
+#: the progress of the lift in this process
+tracker = Progress()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+scheduler.py
+
+A module that contains a class for running crate updates concurrently
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os import cpu_count
+from time import perf_counter, process_time
+
+log = logging.getLogger("forklift")
+
+#: the number of concurrent jobs allowed for a host that is not listed in the `hostConcurrency` config
+default_host_limit = 2
+
+
+class CrateScheduler(object):
+    """Runs jobs on a pool of worker threads while limiting the number of jobs that are reading from
+    the same source host at any one time. Only one job at a time writes to each destination workspace because
+    file geodatabases do not allow more than one edit session.
+
+    Jobs for data that is not on a remote host (e.g. file geodatabases) are only limited by the number of workers.
+    """
+
+    def __init__(self, workers=1, host_limits=None, controller=None):
+        #: an optional WorkerController that adjusts the number of workers while jobs are running
+        self.controller = controller
+        if controller is not None:
+            workers = controller.workers
+
+        #: the maximum number of jobs that can run at the same time
+        self.workers = max(int(workers), 1)
+        #: the maximum number of concurrent jobs for a host keyed by host name with an optional `default` key
+        self.host_limits = {key.lower(): value for key, value in (host_limits or {}).items()}
+        #: the number of jobs that are currently running for each host
+        self.running = {}
+        #: the destination workspaces that running jobs are writing to
+        self.writing = set()
+
+    def get_host_limit(self, host):
+        """host: string
+
+        returns the maximum number of concurrent jobs for the host
+        """
+        if host is None:
+            return self.workers
+
+        limit = self.host_limits.get(host.lower(), self.host_limits.get("default", default_host_limit))
+
+        return max(int(limit), 1)
+
+    def run(self, jobs):
+        """jobs: [(string, string, Function)] - a list of tuples containing the source host, the destination workspace,
+            and a function to call
+
+        Calls every job, starting the first queued job whose host has capacity whenever a worker is free. A job that
+        raises does not stop the other jobs.
+
+        returns a list of the return values of the jobs in the same order as `jobs`. The result of a job that raised
+        is the exception
+        """
+        pending = list(enumerate(jobs))
+        results = [None] * len(jobs)
+        futures = {}
+        queued_seconds = perf_counter()
+        pool_size = self.controller.maximum if self.controller is not None else self.workers
+
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            while len(pending) > 0 or len(futures) > 0:
+                for item in self._get_startable(pending, self.workers - len(futures)):
+                    index, (host, workspace, job) = item
+                    pending.remove(item)
+
+                    if self.controller is not None:
+                        self.controller.record_wait(perf_counter() - queued_seconds)
+
+                    self.running[host] = self.running.get(host, 0) + 1
+                    if workspace is not None:
+                        self.writing.add(workspace)
+                    futures[executor.submit(job)] = (index, host, workspace)
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    index, host, workspace = futures.pop(future)
+                    self.running[host] -= 1
+                    self.writing.discard(workspace)
+
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        log.error("crate job failed: %s", e, exc_info=e)
+                        results[index] = e
+
+                    if self.controller is not None:
+                        self.controller.record_rows(getattr(results[index], "total_rows", None))
+                        self.workers = self.controller.adjust(len(pending) > 0)
+
+        return results
+
+    def _get_startable(self, pending, slots):
+        """pending: [(int, (string, string, Function))]
+        slots: int - the number of free workers
+
+        returns the pending jobs that can be started without going over any of the limits
+        """
+        startable = []
+        starting = {}
+        workspaces = set(self.writing)
+
+        for item in pending:
+            if len(startable) >= slots:
+                break
+
+            host, workspace, _ = item[1]
+            if workspace is not None and workspace in workspaces:
+                continue
+
+            if self.running.get(host, 0) + starting.get(host, 0) < self.get_host_limit(host):
+                starting[host] = starting.get(host, 0) + 1
+                if workspace is not None:
+                    workspaces.add(workspace)
+                startable.append(item)
+
+        return startable
+
+
+class WorkerController(object):
+    """Adjusts the number of crate workers at runtime by additively increasing the count while jobs are
+    waiting and there is cpu to spare and multiplicatively decreasing it when the cpu is saturated or the
+    throughput dropped after the last increase.
+
+    Decisions are made at most once every `interval` seconds and are logged so that the defaults can be tuned.
+    """
+
+    def __init__(
+        self,
+        minimum=1,
+        maximum=8,
+        initial=None,
+        interval=30,
+        cpu_threshold=0.9,
+        decrease_factor=0.5,
+        cpu_seconds=process_time,
+    ):
+        #: the bounds of the worker count
+        self.minimum = max(int(minimum), 1)
+        self.maximum = max(int(maximum), self.minimum)
+        #: the current number of workers
+        self.workers = min(max(int(initial or self.minimum), self.minimum), self.maximum)
+        #: the minimum number of seconds between decisions
+        self.interval = interval
+        #: the fraction of all cpus that the crates can use before the worker count is decreased
+        self.cpu_threshold = cpu_threshold
+        #: the factor that the worker count is multiplied by when decreasing
+        self.decrease_factor = decrease_factor
+        #: a function that returns the cpu seconds used by the crates. Crates that are updated in worker processes
+        #: are not included in the process_time of this process
+        self.get_cpu_seconds = cpu_seconds
+        #: the rows per second of the last interval
+        self.throughput = None
+        #: the direction of the last change in worker count (1, 0, or -1)
+        self.last_change = 0
+        #: a record of all of the decisions made as tuples of (from workers, to workers, reason)
+        self.decisions = []
+
+        self._start_interval()
+
+    def record_rows(self, rows):
+        """rows: int
+
+        records the number of rows processed by a finished job
+        """
+        self.rows += rows or 0
+
+    def record_wait(self, seconds):
+        """seconds: number
+
+        records the number of seconds that a job waited in the queue before it started
+        """
+        self.waits.append(seconds)
+
+    def get_cpu_utilization(self, elapsed):
+        """elapsed: number - seconds since the start of the interval
+
+        returns the fraction of the total cpu capacity of the machine that the crates used during the interval
+        """
+        return (self.get_cpu_seconds() - self.cpu_seconds) / elapsed / (cpu_count() or 1)
+
+    def adjust(self, has_pending):
+        """has_pending: boolean - True if there are jobs that have not been started
+
+        returns the number of workers that should be used
+        """
+        elapsed = perf_counter() - self.interval_seconds
+        if elapsed < self.interval:
+            return self.workers
+
+        throughput = self.rows / elapsed
+        cpu = self.get_cpu_utilization(elapsed)
+        wait = sum(self.waits) / len(self.waits) if len(self.waits) > 0 else 0
+        workers = self.workers
+
+        if cpu > self.cpu_threshold:
+            workers = int(self.workers * self.decrease_factor)
+            reason = "cpu is saturated"
+        elif self.last_change > 0 and self.throughput is not None and throughput < self.throughput * 0.9:
+            workers = int(self.workers * self.decrease_factor)
+            reason = "throughput dropped after the last increase"
+        elif has_pending:
+            workers = self.workers + 1
+            reason = "crates are waiting in the queue"
+        else:
+            reason = "no crates are waiting in the queue"
+
+        workers = min(max(workers, self.minimum), self.maximum)
+
+        log.info(
+            "crate workers: %d -> %d because %s (%d rows/second, %d%% cpu, %.1f seconds average queue wait)",
+            self.workers,
+            workers,
+            reason,
+            throughput,
+            cpu * 100,
+            wait,
+        )
+
+        self.decisions.append((self.workers, workers, reason))
+        self.last_change = (workers > self.workers) - (workers < self.workers)
+        self.throughput = throughput
+        self.workers = workers
+
+        self._start_interval()
+
+        return self.workers
+
+    def _start_interval(self):
+        """resets the measurements for a new interval"""
+        self.interval_seconds = perf_counter()
+        self.cpu_seconds = self.get_cpu_seconds()
+        self.rows = 0
+        self.waits = []
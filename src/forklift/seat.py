@@ -6,6 +6,12 @@ seat.py
 A module that contains helpful methods for other modules
 """
 
+import importlib.util
+import sys
+
+#: the names of the modules that were imported with `lazy_import`
+_lazy_modules = set()
+
 
 def format_time(seconds):
     """seconds: number
@@ -27,6 +33,65 @@ def format_time(seconds):
     return "{} hours".format(round(seconds / hour, 2))
 
 
+def lazy_import(name):
+    """name: string - the name of a module e.g. arcpy
+
+    Defers the import of a module that is slow to import until one of its attributes is first used. This keeps the
+    cli commands that don't use arcpy or arcgis from paying for their import.
+
+    returns the module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named '{}'".format(name), name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    _lazy_modules.add(name)
+
+    return module
+
+
+def finish_lazy_imports():
+    """Finishes the imports that were deferred by `lazy_import`. LazyLoader is not thread safe before python 3.12 so
+    this is called on the main thread before any worker threads or pools are started.
+    """
+    for name in sorted(_lazy_modules):
+        module = sys.modules.get(name)
+
+        if module is not None:
+            #: accessing any attribute runs the deferred import
+            getattr(module, "__name__")
+
+
+def get_import_times(output):
+    """output: string - the stderr of a python process that was started with `-X importtime`
+
+    returns a list of (module, self microseconds, cumulative microseconds) tuples sorted by the cumulative time
+    """
+    times = []
+
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        self_time, cumulative, module = line[len("import time:") :].split("|")
+
+        try:
+            times.append((module.strip(), int(self_time), int(cumulative)))
+        except ValueError:
+            #: the header row
+            continue
+
+    return sorted(times, key=lambda import_time: import_time[2], reverse=True)
+
+
 class timed_pallet_process(object):
     """A class used to time pallet processes. For use in with statements."""
 
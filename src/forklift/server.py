@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+server.py
+
+A module that contains a long running forklift server that keeps a warm worker process with arcpy loaded and runs
+lifts on a schedule, when change detection tables change, or when a command is sent from the cli
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing.connection import Client, Listener
+from os import remove
+from os.path import dirname, exists, join
+from threading import RLock, Thread
+from time import sleep
+
+from . import config
+
+log = logging.getLogger("forklift")
+key_file_name = "serve.key"
+default_port = 6543
+#: the seconds between checks of the schedule and the change detection tables
+tick_seconds = 30
+
+
+def get_address():
+    """returns the local address that the server listens on"""
+    return ("localhost", config.get_config_prop("servePort", default_port))
+
+
+def get_key_location():
+    """returns the path to the file containing the key that clients use to authenticate with the server"""
+    return join(dirname(config.config_location), key_file_name)
+
+
+def is_running():
+    """returns True if a server is listening for commands"""
+    if not exists(get_key_location()):
+        return False
+
+    try:
+        with Client(get_address(), authkey=_read_key()) as connection:
+            connection.send({"command": "status"})
+            connection.recv()
+
+        return True
+    except (OSError, EOFError, multiprocessing.AuthenticationError):
+        return False
+
+
+def send(command):
+    """command: dictionary - e.g. {"command": "lift", "file_path": None, "pallet_arg": None}
+
+    sends a command to the server and waits for the response
+
+    returns the response from the server
+    """
+    with Client(get_address(), authkey=_read_key()) as connection:
+        connection.send(command)
+
+        return connection.recv()
+
+
+def _write_key():
+    """writes a new key to the garage that only the current user can read so that other users can't send commands.
+    On Windows the file keeps the permissions of the garage folder
+    """
+    location = get_key_location()
+    if exists(location):
+        remove(location)
+
+    descriptor = os.open(location, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+    with os.fdopen(descriptor, "wb") as key_file:
+        key_file.write(secrets.token_bytes(32))
+
+
+def _read_key():
+    """returns the key from the garage"""
+    with open(get_key_location(), "rb") as key_file:
+        return key_file.read()
+
+
+class Server(object):
+    """Runs lifts in a warm worker process. Lifts run one at a time because they share the drop off location and
+    the hash geodatabases. The worker is replaced after a lift that updated the git repositories so that the new
+    pallet code is imported.
+    """
+
+    def __init__(self, schedule=None, trigger_seconds=None):
+        #: times of the day in the `HH:MM` format to run a full lift
+        self.schedule = schedule if schedule is not None else config.get_config_prop("serveSchedule", [])
+        #: the seconds between checks of the change detection tables for new hashes. None disables the checks
+        self.trigger_seconds = (
+            trigger_seconds if trigger_seconds is not None else config.get_config_prop("serveTriggerSeconds", None)
+        )
+        self.log_queue = multiprocessing.get_context("spawn").Queue()
+        self.log_listener = logging.handlers.QueueListener(self.log_queue, *log.handlers, respect_handler_level=True)
+        self.executor = None
+        self.running = False
+        self.last_scheduled = None
+        self.last_trigger_check = datetime.now()
+        self._lift_lock = RLock()
+
+    def serve_forever(self):
+        """warms up a worker, listens for commands, and runs scheduled and triggered lifts until stopped"""
+        _write_key()
+
+        self.log_listener.start()
+        self.executor = self._start_worker()
+        self.running = True
+
+        listener = Listener(get_address(), authkey=_read_key())
+        Thread(target=self._accept, args=(listener,), name="forklift-serve", daemon=True).start()
+
+        log.info("forklift is serving on %s:%s", *get_address())
+
+        try:
+            while self.running:
+                try:
+                    self._tick(datetime.now())
+                except Exception as e:
+                    log.error("error running a scheduled or triggered lift: %s", e, exc_info=True)
+
+                sleep(tick_seconds)
+        finally:
+            listener.close()
+            self.executor.shutdown()
+            self.log_listener.stop()
+            remove(get_key_location())
+
+    def lift(self, file_path=None, pallet_arg=None, skip_git=False, selectors=None, send_emails=None):
+        """file_path: string
+        pallet_arg: string
+        skip_git: boolean
+        selectors: dictionary - the crate selectors of a selective lift
+        send_emails: boolean - overrides the `sendEmails` config value for this lift when it is not None
+
+        runs a lift in the warm worker after any running lift has finished
+
+        returns the report from the lift
+        """
+        with self._lift_lock:
+            log.info("starting a lift in the warm worker: %s", file_path or "all pallets")
+            report = self._run_in_worker(_lift, file_path, pallet_arg, skip_git, selectors, send_emails)
+
+            if not skip_git:
+                #: replace the worker so that the pallets that were pulled are imported again
+                self._replace_worker()
+
+        return report
+
+    def handle(self, command):
+        """command: dictionary
+
+        returns the response to a command from a client
+        """
+        if command["command"] == "status":
+            return {"running": self.running}
+
+        if command["command"] == "stop":
+            self.running = False
+
+            return {"running": False}
+
+        if command["command"] == "lift":
+            return self.lift(
+                command.get("file_path"),
+                command.get("pallet_arg"),
+                command.get("skip_git", False),
+                command.get("selectors"),
+                command.get("send_emails"),
+            )
+
+        raise ValueError("unknown command: {}".format(command["command"]))
+
+    def _tick(self, now):
+        """now: datetime
+
+        starts a lift if a scheduled time has passed or a change detection table has new hashes
+        """
+        scheduled = now.strftime("%H:%M")
+        if scheduled in self.schedule and self.last_scheduled != (now.date(), scheduled):
+            self.last_scheduled = (now.date(), scheduled)
+            log.info("starting the lift scheduled for %s", scheduled)
+            self.lift()
+
+            return
+
+        if self.trigger_seconds and (now - self.last_trigger_check).total_seconds() >= self.trigger_seconds:
+            self.last_trigger_check = now
+
+            with self._lift_lock:
+                if self._run_in_worker(_has_changed_tables):
+                    log.info("starting a lift because a change detection table has new hashes")
+                    self.lift(skip_git=True)
+
+    def _accept(self, listener):
+        """listener: Listener
+
+        handles each client connection on its own thread so that a status or stop command is answered while a lift
+        is running
+        """
+        while self.running:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                log.warning("could not accept a connection: %s", e)
+
+                continue
+
+            Thread(target=self._handle_connection, args=(connection,), name="forklift-client", daemon=True).start()
+
+    def _handle_connection(self, connection):
+        """connection: Connection
+
+        sends the response to the command from a client
+        """
+        with connection:
+            try:
+                connection.send(self.handle(connection.recv()))
+            except Exception as e:
+                log.error("error handling command: %s", e, exc_info=True)
+
+                try:
+                    connection.send({"error": str(e)})
+                except OSError:
+                    pass
+
+    def _run_in_worker(self, function, *args):
+        """function: Function - a module level function that can be sent to the worker
+        args: any - the arguments for the function
+
+        calls the function in the warm worker. The worker is replaced if the function raised or the worker died
+        so that the next lift starts with a clean worker
+
+        returns the return value of the function
+        """
+        try:
+            return self.executor.submit(function, *args).result()
+        except BrokenProcessPool as e:
+            log.error("the warm worker stopped unexpectedly: %s", e)
+            self._replace_worker()
+
+            raise
+        except Exception as e:
+            log.error("error in the warm worker: %s", e)
+            self._replace_worker()
+
+            raise
+
+    def _replace_worker(self):
+        """starts a new warm worker and shuts down the old one"""
+        old_executor = self.executor
+        self.executor = self._start_worker()
+        old_executor.shutdown(wait=False)
+
+    def _start_worker(self):
+        """returns an executor with a single worker process that has already imported arcpy"""
+        executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+            initargs=(self.log_queue, config.config_location),
+        )
+        executor.submit(_noop).result()
+
+        return executor
+
+
+def _warm_up(log_queue, config_location):
+    """log_queue: Queue - the queue that log records are sent to the server on
+    config_location: string
+
+    imports the slow modules in the worker process and sends its logs to the server
+    """
+    config.config_location = config_location
+
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.setLevel(logging.DEBUG)
+
+    import arcgis  # noqa: F401
+    import arcpy  # noqa: F401
+
+    from . import engine  # noqa: F401
+
+
+def _noop():
+    """waits for the worker to warm up"""
+    return None
+
+
+def _lift(file_path, pallet_arg, skip_git, selectors, send_emails=None):
+    """runs a lift in the worker process and returns the report"""
+    from . import engine, messaging
+
+    #: the worker is reused so the override of the last lift is replaced
+    messaging.send_emails_override = send_emails
+
+    return engine.lift_pallets(file_path, pallet_arg, skip_git, selectors=selectors)
+
+
+def _has_changed_tables():
+    """returns True if any of the change detection tables have a hash that is different from the last lift"""
+    from .change_detection import ChangeDetection
+
+    change_detection = ChangeDetection(
+        config.get_config_prop("changeDetectionTables", []), dirname(config.config_location)
+    )
+
+    return any(change_detection.has_changed(table) for table in change_detection.current_hashes)
@@ -86,6 +86,8 @@ def lift_report_to_blocks(report):
 
         message.add(import_block)
 
+    _add_anomalies(message, report)
+
     for pallet in _safely_access(report, "pallets"):
         success = ":fire:"
 
@@ -157,6 +159,8 @@ def ship_report_to_blocks(report):
 
     message.add(DividerBlock())
 
+    _add_anomalies(message, report)
+
     if _safely_access(report, "server_reports") and len(_safely_access(report, "server_reports")) > 0:
         for server_status in _safely_access(report, "server_reports"):
             success = ":fire:"
@@ -220,6 +224,17 @@ def ship_report_to_blocks(report):
     return message.get_messages()
 
 
+def _add_anomalies(message, report):
+    """adds the unusually slow crates and phases of the report to the message"""
+    if not _safely_access(report, "anomalies"):
+        return
+
+    message.add(SectionBlock(":hourglass: *duration anomalies*"))
+
+    for items in split(_safely_access(report, "anomalies"), MAX_CONTEXT_ELEMENTS):
+        message.add(ContextBlock(items))
+
+
 class BlockType(Enum):
     """available block type enums"""
 
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+supervisor.py
+
+A module that updates crates in supervised worker processes so that a hung or crashed crate does not stop the lift
+"""
+
+import faulthandler
+import logging
+import multiprocessing
+from os import makedirs
+from os.path import basename, dirname, exists, join, splitext
+from threading import Lock
+from time import process_time
+
+from . import config, core, seat
+from .models import Crate, Pallet
+
+arcpy = seat.lazy_import("arcpy")
+log = logging.getLogger("forklift")
+workers_folder_name = "crate-workers"
+#: the seconds to wait after the timeout for the worker to dump its traceback before it is killed
+grace_seconds = 5
+#: the seconds that a worker is allowed to take to import arcpy and rebuild its crate and pallet before the timeout of
+#: the crate starts
+startup_seconds = 600
+#: the message that a worker sends when it is ready to update its crate
+ready_message = "ready"
+#: the number of characters from the end of the worker log that are included in the crate message
+message_characters = 4000
+#: the cpu seconds used by the crate workers that have finished
+worker_cpu_seconds = 0
+_cpu_lock = Lock()
+
+
+def get_timeout(crate):
+    """crate: Crate
+
+    returns the number of seconds that the crate is allowed to take or None if there is no limit
+    """
+    if crate.timeout is not None:
+        return crate.timeout
+
+    return config.get_config_prop("crateTimeoutSeconds", None)
+
+
+def get_cpu_seconds():
+    """returns the cpu seconds used by this process and the crate workers that have finished"""
+    return process_time() + worker_cpu_seconds
+
+
+def is_concurrent():
+    """returns True if more than one crate can be updated at the same time. arcpy is not thread safe so these crates
+    are updated in worker processes
+    """
+    return config.get_config_prop("crateWorkers", 1) > 1 or bool(config.get_config_prop("adaptiveCrateWorkers", None))
+
+
+def update(crate, validate_crate, change_detection, pallet_arg=None):
+    """crate: Crate
+    validate_crate: Pallet.validate_crate
+    change_detection: ChangeDetection
+    pallet_arg: string - the argument that the pallet of the crate was built with
+
+    Calls core.update in a worker process if the crate has a timeout or crates are updated concurrently, otherwise in
+    this process. A worker that takes longer than the timeout is killed and the crate is marked as an unhandled
+    exception with the traceback of where the worker was stuck. The timeout starts once the worker is ready to update
+    the crate so that starting the process is not counted. The change detection hashes of a worker are written by this
+    process.
+
+    returns: (string, string) - the result of core.update
+    """
+    timeout = get_timeout(crate)
+
+    if not timeout and not is_concurrent():
+        return core.update(crate, validate_crate, change_detection)
+
+    log_file = join(dirname(config.config_location), workers_folder_name, crate.name + ".log")
+    if not exists(dirname(log_file)):
+        makedirs(dirname(log_file), exist_ok=True)
+
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    worker = context.Process(
+        target=_update_in_worker,
+        args=(
+            _get_crate_spec(crate),
+            getattr(getattr(validate_crate, "__self__", None), "name", None),
+            pallet_arg,
+            change_detection,
+            config.config_location,
+            log_file,
+            timeout,
+            sender,
+        ),
+        name="crate-" + crate.name,
+        daemon=True,
+    )
+
+    log.debug("updating crate in a worker process with a %s second timeout", timeout)
+    worker.start()
+    sender.close()
+
+    try:
+        if not receiver.poll(startup_seconds):
+            message = "crate worker did not start within {} seconds and was stopped".format(startup_seconds)
+        elif receiver.recv() == ready_message and receiver.poll(timeout + grace_seconds if timeout else None):
+            result, crate.total_rows, crate.captured, crate.adds, crate.deletes, crate.phase_times, tables, cpu = (
+                receiver.recv()
+            )
+            worker.join()
+            _add_worker_cpu_seconds(cpu)
+
+            for table_name in tables:
+                change_detection.write_hash(table_name)
+
+            return result
+        else:
+            message = "crate timed out after {} seconds and was stopped".format(timeout)
+    except EOFError:
+        worker.join()
+        message = "crate worker exited with code {}".format(worker.exitcode)
+    finally:
+        receiver.close()
+
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+
+    log.error("%s: %s", message, crate.destination_name)
+
+    return (Crate.UNHANDLED_EXCEPTION, "{}\n{}".format(message, _read_tail(log_file)))
+
+
+def _update_in_worker(spec, pallet_name, pallet_arg, change_detection, config_location, log_file, timeout, sender):
+    """spec: dictionary - the arguments to rebuild the crate from `_get_crate_spec`
+    pallet_name: string - the name of the pallet that the crate belongs to in the `file_path:ClassName` format
+    pallet_arg: string - the argument that the pallet was built with
+    change_detection: ChangeDetection
+    config_location: string - the config location of the lift process
+    log_file: string - the file that the worker logs and fault tracebacks are written to
+    timeout: number - the optional seconds after which the tracebacks of all threads are written to the log file
+    sender: Connection - the connection to send `ready_message` and then the result, total rows, captured rows, adds,
+        deletes, phase times, the change detection tables whose hashes need to be written back to the lift process,
+        and the cpu seconds of the worker
+
+    The entry point of the worker process
+    """
+    config.config_location = config_location
+
+    with open(log_file, "w") as log_stream:
+        handler = logging.StreamHandler(log_stream)
+        handler.setFormatter(logging.Formatter("%(levelname)-7s %(asctime)s %(module)10s:%(lineno)5s %(message)s"))
+        log.addHandler(handler)
+        log.setLevel(logging.DEBUG)
+
+        faulthandler.enable(file=log_stream)
+
+        #: other workers may be writing to the scratch geodatabase of the lift process at the same time
+        core.log = log
+        core.scratch_gdb_path = _create_scratch_gdb(dirname(log_file), splitext(basename(log_file))[0])
+
+        capture = spec.pop("capture")
+        if isinstance(spec["destination_coordinate_system"], str):
+            coordinate_system = arcpy.SpatialReference()
+            coordinate_system.loadFromString(spec["destination_coordinate_system"])
+            spec["destination_coordinate_system"] = coordinate_system
+
+        crate = Crate(**spec)
+        crate.capture = capture
+
+        #: the hash table lock does not work across processes so the lift process writes the hashes
+        if change_detection is not None:
+            change_detection.deferred_tables = []
+
+        validate_crate = _get_validate_crate(pallet_name, pallet_arg)
+
+        sender.send(ready_message)
+        if timeout:
+            faulthandler.dump_traceback_later(timeout, file=log_stream)
+
+        result = core.update(crate, validate_crate, change_detection)
+
+        faulthandler.cancel_dump_traceback_later()
+
+        sender.send(
+            (
+                result,
+                crate.total_rows,
+                crate.captured,
+                crate.adds,
+                crate.deletes,
+                crate.phase_times,
+                getattr(change_detection, "deferred_tables", None) or [],
+                process_time(),
+            )
+        )
+        sender.close()
+
+
+def _add_worker_cpu_seconds(seconds):
+    """seconds: number
+
+    adds the cpu seconds of a finished worker to `worker_cpu_seconds`
+    """
+    global worker_cpu_seconds
+
+    with _cpu_lock:
+        worker_cpu_seconds += seconds
+
+
+def _create_scratch_gdb(folder, name):
+    """folder: string
+    name: string - `Crate.name`
+
+    returns the path to an empty scratch geodatabase for the worker
+    """
+    scratch_gdb = join(folder, name + ".gdb")
+    if arcpy.Exists(scratch_gdb):
+        arcpy.management.Delete(scratch_gdb)
+
+    arcpy.management.CreateFileGDB(folder, name + ".gdb")
+
+    return scratch_gdb
+
+
+def _get_crate_spec(crate):
+    """crate: Crate
+
+    returns a dictionary of the values that are needed to rebuild the crate in a worker process
+    """
+    coordinate_system = crate.destination_coordinate_system
+    if coordinate_system is not None and not isinstance(coordinate_system, int):
+        coordinate_system = coordinate_system.factoryCode or coordinate_system.exportToString()
+
+    return {
+        "source_name": crate.source_name,
+        "source_workspace": crate.source_workspace,
+        "destination_workspace": crate.destination_workspace,
+        "destination_name": crate.destination_name,
+        "destination_coordinate_system": coordinate_system,
+        "geographic_transformation": crate.geographic_transformation,
+        "capture": crate.capture,
+    }
+
+
+def _get_validate_crate(pallet_name, pallet_arg=None):
+    """pallet_name: string - the name of a pallet in the `file_path:ClassName` format or None
+    pallet_arg: string - the argument that the pallet was built with
+
+    returns the validate_crate method of the pallet rebuilt the same way as in the lift process or the default
+    validate_crate if the pallet could not be built
+    """
+    from . import engine
+
+    pallets = engine.build_pallets(pallet_name, pallet_arg)[0] if pallet_name else []
+    if len(pallets) == 0:
+        return Pallet().validate_crate
+
+    return pallets[0].validate_crate
+
+
+def _read_tail(log_file):
+    """log_file: string
+
+    returns the end of the worker log which contains the traceback of a hung or crashed worker
+    """
+    try:
+        with open(log_file) as log_stream:
+            return log_stream.read()[-message_characters:]
+    except OSError:
+        return ""
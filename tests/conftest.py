@@ -31,6 +31,23 @@ def setup():
         remove(config.config_location)
         print("removed")
 
+    for file_name in [
+        "history.db",
+        "cache.db",
+        "journal.jsonl",
+        "serve.key",
+        "pallet-index.json",
+        "plan.json",
+        "progress.json",
+    ]:
+        location = path.join(path.dirname(config.config_location), file_name)
+        if path.exists(location):
+            remove(location)
+
+    workers_folder = path.join(path.dirname(config.config_location), "crate-workers")
+    if path.exists(workers_folder):
+        rmtree(workers_folder)
+
 
 #: hook for making test result available in fixtures
 #: ref: https://docs.pytest.org/en/latest/example/simple.html#making-test-result-information-available-in-fixtures
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_anomalies.py
+
+A module that contains tests for anomalies.py
+"""
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from forklift import anomalies, history
+from forklift.models import Crate
+
+
+def crate(name, seconds, rows):
+    mock = Mock()
+    mock.name = name
+    mock.processing_time = seconds
+    mock.total_rows = rows
+    mock.adds = mock.deletes = None
+    mock.phase_times = {}
+    mock.result = (Crate.UPDATED, None)
+
+    return mock
+
+
+def record_run(location, crate_seconds, crate_rows=1000, phase_seconds=100):
+    run = history.start_run("lift", location)
+    history.record_crates([crate("Parcels_abc", crate_seconds, crate_rows)], location)
+    history.record_phase(history.RUN, "dropoff_data", phase_seconds, location=location)
+    history.finish_run(crate_seconds, True, location)
+
+    return run
+
+
+@pytest.fixture
+def settings():
+    values = {}
+
+    with patch(
+        "forklift.anomalies.config.get_config_prop", side_effect=lambda key, default=None: values.get(key, default)
+    ):
+        yield values
+
+
+def test_find_anomalies_flags_slow_crates_and_phases(tmp_path, settings):
+    location = str(tmp_path / "history.db")
+    for seconds in [100, 110, 90, 105]:
+        record_run(location, seconds)
+
+    run = record_run(location, 1000, phase_seconds=900)
+
+    assert anomalies.find_anomalies(run, location) == [
+        "crate Parcels took 16.67 minutes which is 9.8x its median of 1.71 minutes",
+        "dropoff_data took 15.0 minutes which is 9.0x its median of 1.67 minutes",
+    ]
+
+
+def test_find_anomalies_ignores_normal_and_short_runs(tmp_path, settings):
+    location = str(tmp_path / "history.db")
+    for seconds in [1, 2, 1]:
+        record_run(location, seconds)
+
+    assert anomalies.find_anomalies(record_run(location, 50), location) == []
+    assert anomalies.find_anomalies(record_run(location, 2), location) == []
+
+
+def test_find_anomalies_flags_throughput(tmp_path, settings):
+    location = str(tmp_path / "history.db")
+    settings["anomalySensitivity"] = 100
+    for seconds in [100, 110, 90]:
+        record_run(location, seconds, 100000)
+
+    messages = anomalies.find_anomalies(record_run(location, 200, 1000), location)
+
+    assert messages == ["crate Parcels processed 5 rows per second which is below its median of 1000"]
+
+
+def test_find_anomalies_checks_budgets_without_history(tmp_path, settings):
+    location = str(tmp_path / "history.db")
+    settings["crateTimeBudgets"] = {"parcels*": 30}
+
+    assert anomalies.find_anomalies(record_run(location, 60), location) == [
+        "crate Parcels took 60.0 seconds which is over its budget of 30 seconds"
+    ]
+
+
+def test_find_anomalies_without_a_run(settings):
+    history.current_run = None
+
+    assert anomalies.find_anomalies() == []
+
+
+def test_is_outlier():
+    assert not anomalies.is_outlier(12, [10, 10, 10])
+    assert anomalies.is_outlier(14, [10, 10, 10])
+    assert not anomalies.is_outlier(40, [10, 30, 20, 10, 30])
+
+
+def test_get_budget():
+    budgets = {"Roads": 10, "Parcels*": 20}
+
+    assert anomalies.get_budget("Roads_abc", budgets) == 10
+    assert anomalies.get_budget("Parcels_2020_abc", budgets) == 20
+    assert anomalies.get_budget("Counties_abc", budgets) is None
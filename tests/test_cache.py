@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_cache.py
+
+A module that contains tests for cache.py
+"""
+
+from unittest.mock import Mock, patch
+
+from forklift import cache
+from forklift.cache import PalletCache
+
+
+def test_get_returns_default_and_counts_misses(tmp_path):
+    patient = PalletCache("pallet", str(tmp_path / "cache.db"))
+
+    assert patient.get("key", "default") == "default"
+    assert patient.get_report() == {"hits": 0, "misses": 1}
+
+
+def test_set_and_get_round_trip(tmp_path):
+    patient = PalletCache("pallet", str(tmp_path / "cache.db"))
+
+    patient.set("key", {"domains": [1, 2, 3]})
+
+    assert patient.get("key") == {"domains": [1, 2, 3]}
+    assert patient.get_report() == {"hits": 1, "misses": 0}
+
+
+def test_namespaces_are_separate(tmp_path):
+    location = str(tmp_path / "cache.db")
+    PalletCache("one", location).set("key", 1)
+
+    assert PalletCache("two", location).get("key") is None
+
+
+@patch("forklift.cache.time")
+def test_values_expire(time, tmp_path):
+    patient = PalletCache("pallet", str(tmp_path / "cache.db"))
+    time.return_value = 100
+
+    patient.set("key", "value", ttl=10)
+    assert patient.get("key") == "value"
+
+    time.return_value = 111
+    assert patient.get("key") is None
+
+
+@patch("forklift.cache.time")
+def test_least_recently_used_values_are_evicted(time, tmp_path):
+    value = "x" * 100
+    patient = PalletCache(
+        "pallet", str(tmp_path / "cache.db"), max_bytes=len(cache.pickle.dumps(value, protocol=4)) * 2
+    )
+
+    time.return_value = 1
+    patient.set("one", value)
+    time.return_value = 2
+    patient.set("two", value)
+    time.return_value = 3
+    patient.get("one")
+    time.return_value = 4
+    patient.set("three", value)
+
+    assert patient.get("one") == value
+    assert patient.get("two") is None
+    assert patient.get("three") == value
+
+
+def test_get_or_set_only_calls_function_on_miss(tmp_path):
+    patient = PalletCache("pallet", str(tmp_path / "cache.db"))
+    function = Mock(return_value=None)
+
+    assert patient.get_or_set("key", function) is None
+    assert patient.get_or_set("key", function) is None
+
+    function.assert_called_once()
+
+
+def test_make_key_is_based_on_content():
+    assert cache.make_key("url", {"f": "json"}) == cache.make_key("url", {"f": "json"})
+    assert cache.make_key("url", {"f": "json"}) != cache.make_key("url", {"f": "pjson"})
+
+
+def test_get_report_is_none_if_unused(tmp_path):
+    assert PalletCache("pallet", str(tmp_path / "cache.db")).get_report() is None
@@ -7,6 +7,7 @@ a module containing tests for the change detection module
 
 import logging
 from pathlib import Path
+from unittest.mock import Mock, patch
 
 import arcpy
 from pytest import raises
@@ -26,6 +27,34 @@ def test_has_table(test_gdb):
     assert change_detection.has_table("bad table name") is False
 
 
+@patch("forklift.change_detection._get_hashes", return_value={})
+@patch("forklift.change_detection.arcpy")
+def test_read_only_does_not_create_hash_table(arcpy, _get_hashes):
+    arcpy.Exists.return_value = False
+
+    change_detection = ChangeDetection([], "garage", hash_table="missing.gdb/TableHashes", read_only=True)
+
+    arcpy.management.CreateTable.assert_not_called()
+    _get_hashes.assert_called_once_with([])
+    assert change_detection.previous_hashes == {}
+
+
+@patch("forklift.change_detection._get_hashes", return_value={"counties": "1"})
+@patch("forklift.change_detection.arcpy")
+def test_update_defers_hash_writes(arcpy, _get_hashes):
+    change_detection = ChangeDetection([], "garage", hash_table="garage.gdb/TableHashes")
+    change_detection.deferred_tables = []
+    crate = Mock(source_name="Counties", result=(Crate.UPDATED, None), source_describe={"hasGlobalID": False})
+
+    assert change_detection.update(crate) == (Crate.UPDATED, None)
+    assert change_detection.deferred_tables == ["counties"]
+    arcpy.da.UpdateCursor.assert_not_called()
+
+    change_detection.write_hash("Counties")
+
+    arcpy.da.UpdateCursor.assert_called_once()
+
+
 def test_has_changed(test_gdb):
     hash_table = str(Path(test_gdb) / "TableHashes")
     change_detection = ChangeDetection(["ChangeDetection"], test_gdb, hash_table=hash_table)
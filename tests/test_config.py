@@ -7,6 +7,7 @@ A module that contains tests for config.py
 """
 
 import unittest
+from json import dumps, loads
 from os import remove
 from unittest.mock import patch
 
@@ -14,7 +15,7 @@ from forklift import config
 
 
 class ConfigTest(unittest.TestCase):
-    @patch("forklift.config._get_config", return_value={"warehouse": ""})
+    @patch("forklift.config._read_config", return_value={"warehouse": ""})
     def test_set_config_prop_overrides_all_values(self, mock_obj):
         folder = "blah"
         config.set_config_prop("warehouse", folder, override=True)
@@ -29,7 +30,7 @@ class ConfigTest(unittest.TestCase):
 
         mock_obj.assert_called_once()
 
-    @patch("forklift.config._get_config")
+    @patch("forklift.config._read_config")
     def test_set_config_prop_returns_message_if_not_found(self, mock_obj):
         mock_obj.return_value = {}
 
@@ -37,7 +38,7 @@ class ConfigTest(unittest.TestCase):
 
         self.assertEqual(message, "this was not found in config.")
 
-    @patch("forklift.config._get_config")
+    @patch("forklift.config._read_config")
     def test_set_config_prop_appends_items_from_list_if_not_overriding(self, mock_obj):
         mock_obj.return_value = {"test": []}
 
@@ -45,7 +46,7 @@ class ConfigTest(unittest.TestCase):
 
         self.assertEqual(message, "Added [1, 2, 3] to test")
 
-    @patch("forklift.config._get_config")
+    @patch("forklift.config._read_config")
     def test_set_config_prop_sets_value(self, mock_obj):
         mock_obj.return_value = {"test": ""}
 
@@ -87,3 +88,87 @@ class ConfigTest(unittest.TestCase):
         servers = config.get_config_prop("servers")
 
         self.assertEqual(servers, {})
+
+    @patch("forklift.config._get_config")
+    def test_get_config_prop_returns_default_for_missing_key(self, mock_obj):
+        mock_obj.return_value = {"test": "value"}
+
+        self.assertEqual(config.get_config_prop("missing", 1), 1)
+        self.assertEqual(config.get_config_prop("test", 1), "value")
+
+        with self.assertRaises(KeyError):
+            config.get_config_prop("missing")
+
+    def test_get_config_reads_the_file_once(self):
+        config.set_config_prop("warehouse", "first", override=True)
+        config._get_config()
+
+        with patch("forklift.config.loads") as loads:
+            self.assertEqual(config.get_config_prop("warehouse"), "first")
+            self.assertEqual(config.get_config_prop("warehouse"), "first")
+
+            loads.assert_not_called()
+
+    def test_get_config_reads_the_file_again_after_it_changes(self):
+        config.set_config_prop("warehouse", "first", override=True)
+        self.assertEqual(config.get_config_prop("warehouse"), "first")
+
+        with open(config.config_location) as config_file:
+            contents = config_file.read()
+
+        with open(config.config_location, "w") as config_file:
+            config_file.write(contents.replace('"first"', '"second"'))
+
+        self.assertEqual(config.get_config_prop("warehouse"), "second")
+
+    def test_get_config_prop_returns_copies(self):
+        config.set_config_prop("notify", ["one@utah.gov"], override=True)
+
+        config.get_config_prop("notify").append("two@utah.gov")
+
+        self.assertEqual(config.get_config_prop("notify"), ["one@utah.gov"])
+
+    @patch("forklift.config._get_config")
+    def test_merging_servers_does_not_change_the_config(self, mock_obj):
+        mock_obj.return_value = {"servers": {"options": {"port": 0}, "0": {"machineName": "0-host"}}}
+
+        config.get_config_prop("servers")
+
+        self.assertEqual(config.get_config_prop("servers"), {"0": {"machineName": "0-host", "port": 0}})
+
+    def test_validate(self):
+        config.validate({"crateWorkers": 2, "serverStartWaitSeconds": 0.5, "servers": None, "somethingElse": True})
+
+        with self.assertRaises(ValueError) as context:
+            config.validate({"crateWorkers": "2", "sendEmails": "false", "buildWorkers": True})
+
+        message = str(context.exception)
+        self.assertIn("crateWorkers must be an integer but is '2'", message)
+        self.assertIn("sendEmails must be a boolean", message)
+        self.assertIn("buildWorkers must be an integer", message)
+
+    def test_set_config_prop_does_not_write_invalid_values(self):
+        config.create_default_config()
+
+        with self.assertRaises(ValueError):
+            config.set_config_prop("serverStartWaitSeconds", "five", override=True)
+
+        self.assertEqual(config.get_config_prop("serverStartWaitSeconds"), 300)
+
+    def test_set_config_prop_repairs_invalid_values(self):
+        config.create_default_config()
+
+        with open(config.config_location) as config_file:
+            contents = loads(config_file.read())
+
+        contents["crateWorkers"] = "two"
+
+        with open(config.config_location, "w") as config_file:
+            config_file.write(dumps(contents))
+
+        with self.assertRaises(ValueError):
+            config.get_config_prop("crateWorkers")
+
+        config.set_config_prop("crateWorkers", 2, override=True)
+
+        self.assertEqual(config.get_config_prop("crateWorkers"), 2)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_connections.py
+
+A module that contains tests for connections.py
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+
+from forklift import connections
+from forklift.connections import ConnectionManager
+
+sde = "c:\\forklift\\garage\\sgid.sde"
+other_sde = "c:\\forklift\\garage\\other.sde"
+
+
+def crate_from(workspace):
+    crate = Mock()
+    crate.source_workspace = workspace
+
+    return crate
+
+
+class TestConnectionManager(unittest.TestCase):
+    def test_queue_only_tracks_connection_files(self):
+        patient = ConnectionManager([crate_from(sde), crate_from(sde), crate_from("c:\\data.gdb")])
+
+        self.assertEqual(patient.pending, {sde: 2})
+
+    def test_crates_are_optional(self):
+        patient = ConnectionManager()
+        other = ConnectionManager()
+        patient.queue(sde)
+
+        self.assertEqual(patient.pending, {sde: 1})
+        self.assertEqual(other.pending, {})
+
+    @patch("forklift.connections.arcpy")
+    def test_open_and_release_ignore_workspaces_that_were_not_queued(self, arcpy):
+        patient = ConnectionManager()
+
+        patient.open(sde)
+        patient.release(sde)
+
+        arcpy.Exists.assert_not_called()
+        arcpy.ClearWorkspaceCache_management.assert_not_called()
+
+    @patch("forklift.connections.arcpy")
+    def test_open_only_connects_once(self, arcpy):
+        patient = ConnectionManager([crate_from(sde)])
+
+        patient.open(sde)
+        patient.open(sde)
+
+        arcpy.Exists.assert_called_once_with(sde)
+        self.assertIn(sde, patient.connect_times)
+
+    @patch("forklift.connections.arcpy")
+    def test_release_keeps_connection_until_workspace_is_finished(self, arcpy):
+        patient = ConnectionManager([crate_from(sde), crate_from(sde), crate_from(other_sde)])
+        patient.open(sde)
+
+        patient.release(sde, ("Data updated successfully.", None))
+        arcpy.ClearWorkspaceCache_management.assert_not_called()
+
+        patient.release(sde, ("Data updated successfully.", None))
+        arcpy.ClearWorkspaceCache_management.assert_called_once_with(sde)
+        self.assertNotIn(sde, patient.connected)
+
+    @patch("forklift.connections.arcpy")
+    def test_release_clears_cache_on_schema_lock(self, arcpy):
+        patient = ConnectionManager([crate_from(sde), crate_from(sde)])
+
+        patient.release(sde, ("Unhandled exception during update.", "ERROR 000464: Cannot get exclusive schema lock."))
+
+        arcpy.ClearWorkspaceCache_management.assert_called_once_with(sde)
+        self.assertEqual(patient.pending[sde], 1)
+
+    @patch("forklift.connections.arcpy")
+    def test_release_ignores_non_connection_files(self, arcpy):
+        patient = ConnectionManager([crate_from("c:\\data.gdb")])
+
+        patient.release("c:\\data.gdb")
+
+        arcpy.ClearWorkspaceCache_management.assert_not_called()
+
+    def test_is_schema_lock(self):
+        self.assertTrue(connections.is_schema_lock("Cannot acquire a schema lock because of an existing lock."))
+        self.assertTrue(connections.is_schema_lock(Exception("ERROR 000464: Cannot get exclusive schema lock.")))
+        self.assertFalse(connections.is_schema_lock("Data is invalid."))
+        self.assertFalse(connections.is_schema_lock(None))
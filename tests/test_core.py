@@ -182,7 +182,15 @@ def test_hash_custom_source_key_float(test_gdb):
 
 def test_hash_fgdb(test_gdb):
     def run_hash(fc1, fc2):
-        return core._hash(Crate(fc1, test_gdb, test_gdb, fc2))
+        changes = core._hash(Crate(fc1, test_gdb, test_gdb, fc2))
+        diff = core.get_hash_diff(Crate(fc1, test_gdb, test_gdb, fc2))
+
+        #: planning a lift finds the same changes without writing to the scratch geodatabase
+        assert diff.adds.keys() == changes.adds.keys()
+        assert diff._deletes.keys() == changes._deletes.keys()
+        assert diff.total_rows == changes.total_rows
+
+        return changes
 
     zip_changes = run_hash("ZipCodes", "ZipCodes_same")
     assert len(zip_changes.adds) == 0
@@ -459,6 +467,53 @@ def test_source_row_geometry_changed_to_none(test_gdb):
     assert arcpy.GetCount_management(crate.destination)[0] == "3"
 
 
+def test_chunk():
+    assert list(core._chunk(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(core._chunk([], 2)) == []
+
+
+@patch("forklift.core.arcpy")
+def test_insert_rows_commits_each_chunk(arcpy_mock):
+    crate = Mock()
+    crate.is_table.return_value = False
+    changes = Changes(["NAME", "SHAPE@", core.hash_field])
+    rows = [("a", "shape", "1"), ("b", None, "2"), ("c", "shape", "3"), ("d", "shape", "4")]
+    arcpy_mock.da.SearchCursor.return_value.__enter__.return_value = iter(rows)
+    insert_cursor = arcpy_mock.da.InsertCursor.return_value.__enter__.return_value
+
+    core._insert_rows(crate, changes, chunk_size=2)
+
+    assert arcpy_mock.da.Editor.call_count == 2
+    assert insert_cursor.insertRow.call_count == 3
+
+
+@patch("forklift.core.arcpy")
+def test_delete_rows_commits_each_chunk(arcpy_mock):
+    crate = Mock()
+    arcpy_mock.da.UpdateCursor.return_value.__enter__.return_value = MagicMock()
+
+    core._delete_rows(crate, {"1": None, "2": None, "3": None}, chunk_size=2)
+
+    assert arcpy_mock.da.Editor.call_count == 2
+    assert arcpy_mock.da.UpdateCursor.call_args_list[1][0][2] == "{} IN ('3')".format(core.hash_field)
+
+
+@patch("forklift.core.max_where_hashes", 2)
+@patch("forklift.core.arcpy")
+def test_delete_rows_limits_the_where_clause(arcpy_mock):
+    crate = Mock()
+    arcpy_mock.da.UpdateCursor.return_value.__enter__.return_value = MagicMock()
+
+    core._delete_rows(crate, {"1": None, "2": None, "3": None, "4": None, "5": None}, chunk_size=5)
+
+    assert arcpy_mock.da.Editor.call_count == 1
+    assert [call[0][2] for call in arcpy_mock.da.UpdateCursor.call_args_list] == [
+        "{} IN ('1', '2')".format(core.hash_field),
+        "{} IN ('3', '4')".format(core.hash_field),
+        "{} IN ('5')".format(core.hash_field),
+    ]
+
+
 def test_check_counts(test_gdb):
     #: matching
     crate = Crate("match", test_gdb, test_gdb, "match")
@@ -484,7 +539,7 @@ def test_mirror_fields(test_gdb):
     arcpy.management.CreateFileGDB(path.dirname(TEMP_GDB), path.basename(TEMP_GDB))
     destination = arcpy.management.CreateTable(TEMP_GDB, "MirrorFieldsTable")
 
-    core._mirror_fields(path.join(test_gdb, "MirrorFields"), destination)
+    core._mirror_fields(arcpy.da.Describe(path.join(test_gdb, "MirrorFields"))["fields"], destination)
 
     fields = arcpy.da.Describe(destination)["fields"]
 
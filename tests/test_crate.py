@@ -8,10 +8,10 @@ A module for testing crate.py
 
 import unittest
 from os import path
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from arcpy import SpatialReference, env
-from forklift.models import Crate, names_cache
+from forklift.models import Crate, RowCapture, describes_cache, names_cache, resolve_crates
 from xxhash import xxh64
 
 current_folder = path.dirname(path.abspath(__file__))
@@ -20,6 +20,9 @@ update_tests_sde = path.join(current_folder, "data", "UPDATE_TESTS.sde")
 
 
 class TestCrate(unittest.TestCase):
+    def setUp(self):
+        describes_cache.clear()
+
     def test_pass_all_values(self):
         crate = Crate("sourceName", "blah", "hello", "blur")
         self.assertEqual(crate.source_name, "sourceName")
@@ -164,6 +167,86 @@ class TestCrate(unittest.TestCase):
         crate.result = (Crate.UPDATED_OR_CREATED_WITH_WARNINGS, None)
         self.assertTrue(crate.was_updated())
 
+    def test_get_captured_rows(self):
+        crate = Crate("foo", "bar", "baz", "goo")
+
+        self.assertIsNone(crate.get_captured_rows())
+        self.assertIsNone(crate.get_deleted_hashes())
+
+        crate.captured = RowCapture(["NAME", "FORKLIFT_HASH"], 1024 * 1024)
+        crate.captured.add(("added", "a"), True)
+        crate.captured.add(("unchanged", "b"), False)
+        crate.captured.deletes = ["c"]
+
+        crate.capture_rows()
+        self.assertEqual(list(crate.get_captured_rows()["NAME"]), ["added"])
+
+        crate.capture_rows(Crate.CAPTURE_ALL)
+        self.assertEqual(list(crate.get_captured_rows()["FORKLIFT_HASH"]), ["a", "b"])
+        self.assertEqual(crate.get_deleted_hashes(), ["c"])
+
+    @patch("arcpy.ValidateTableName", side_effect=lambda name, workspace: name)
+    def test_describe_is_lazy(self, validate_table_name):
+        describer = Mock(return_value={"datasetType": "Table"})
+        crate = Crate("foo", "bar", "baz", "goo", describer=describer)
+
+        describer.assert_not_called()
+        validate_table_name.assert_not_called()
+
+        self.assertEqual(crate.result, (Crate.UNINITIALIZED, None))
+        self.assertTrue(crate.is_table())
+        describer.assert_called_once_with(path.join("bar", "foo"))
+
+    def test_describe_error_is_invalid_data(self):
+        describer = Mock(side_effect=Exception("does not exist"))
+
+        with patch("arcpy.ValidateTableName", side_effect=lambda name, workspace: name):
+            crate = Crate("foo", "bar", "baz", "goo", describer=describer)
+
+            self.assertEqual(crate.result, (Crate.INVALID_DATA, "does not exist"))
+
+    def test_set_result_skips_describe(self):
+        describer = Mock()
+        crate = Crate("foo", "bar", "baz", "goo", describer=describer)
+
+        crate.result = (Crate.UPDATED, None)
+
+        self.assertEqual(crate.result, (Crate.UPDATED, None))
+        describer.assert_not_called()
+
+    @patch("arcpy.ValidateTableName", side_effect=lambda name, workspace: name)
+    def test_resolve_crates(self, validate_table_name):
+        describer = Mock(return_value={"datasetType": "Table"})
+        crates = [
+            Crate("one", "workspace_a", "baz", describer=describer),
+            Crate("two", "workspace_a", "baz", describer=describer),
+            Crate("three", "workspace_b", "baz", describer=describer),
+        ]
+
+        resolve_crates(crates, 2)
+
+        self.assertEqual(describer.call_count, 3)
+        self.assertTrue(all(crate._resolved for crate in crates))
+
+        resolve_crates(crates, 2)
+
+        self.assertEqual(describer.call_count, 3)
+
+
+class TestRowCapture(unittest.TestCase):
+    def test_add_drops_rows_over_max_bytes(self):
+        patient = RowCapture(["NAME"], 200)
+
+        patient.add(("a",), True)
+        self.assertEqual(patient.rows, [("a",)])
+
+        patient.add(("a" * 200,), True)
+        self.assertTrue(patient.overflowed)
+        self.assertEqual(patient.rows, [])
+
+        patient.add(("a",), True)
+        self.assertEqual(patient.rows, [])
+
 
 class TestTryFindSourceName(unittest.TestCase):
     def tearDown(self):
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_describes.py
+
+A module that contains tests for describes.py
+"""
+
+from os import utime
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from forklift import describes
+from forklift.cache import PalletCache
+
+
+def get_config_prop(key, default=None):
+    return 60 if key == "describeCacheSeconds" else default
+
+
+def test_memory_values_are_least_recently_used():
+    patient = describes.DescribeCache("test", max_entries=2)
+
+    patient.set("a", 1)
+    patient.set("b", 2)
+    patient.get("A")
+    patient.set("c", 3)
+
+    assert "a" in patient
+    assert "b" not in patient
+    assert patient.get("c") == 3
+
+
+def test_values_are_not_kept_in_the_garage_by_default():
+    patient = describes.DescribeCache("test")
+
+    assert patient._get_store() is None
+
+
+@patch("forklift.describes.config.get_config_prop", get_config_prop)
+def test_values_are_read_from_the_garage(tmp_path):
+    store = PalletCache("test", str(tmp_path / "cache.db"))
+    source = tmp_path / "roads.shp"
+    source.write_text("")
+    location = str(source)
+
+    first = describes.DescribeCache("test")
+    first._store = store
+    first.set(location, ["roads"])
+
+    patient = describes.DescribeCache("test")
+    patient._store = store
+
+    assert patient.get(location) == ["roads"]
+
+
+@patch("forklift.describes.config.get_config_prop", get_config_prop)
+def test_values_from_the_garage_are_invalid_after_the_source_changes(tmp_path):
+    store = PalletCache("test", str(tmp_path / "cache.db"))
+    source = tmp_path / "roads.shp"
+    source.write_text("")
+
+    first = describes.DescribeCache("test")
+    first._store = store
+    first.set(str(source), ["roads"])
+
+    utime(str(source), ns=(0, 0))
+
+    patient = describes.DescribeCache("test")
+    patient._store = store
+
+    assert patient.get(str(source)) is None
+
+
+def test_get_signal_uses_the_first_part_of_the_path_that_exists(tmp_path):
+    assert describes.get_signal(str(tmp_path / "data.gdb" / "Roads")) == tmp_path.stat().st_mtime_ns
+    assert describes.get_signal("https://services.arcgis.com/layer/0") is None
+
+
+def test_serialize_describe_round_trip():
+    spatial_reference = Mock()
+    spatial_reference.exportToString.return_value = "PROJCS[...]"
+    field = SimpleNamespace(name="NAME", type="String", length=50)
+
+    record = describes.serialize_describe(
+        {"datasetType": "FeatureClass", "spatialReference": spatial_reference, "fields": [field], "extent": Mock()}
+    )
+
+    assert record == {
+        "datasetType": "FeatureClass",
+        "spatialReference": "PROJCS[...]",
+        "fields": [{"name": "NAME", "type": "String", "length": 50}],
+    }
+
+    with patch("forklift.describes.arcpy") as arcpy:
+        arcpy.Field.side_effect = SimpleNamespace
+
+        describe = describes.deserialize_describe(record)
+
+    arcpy.SpatialReference.return_value.loadFromString.assert_called_once_with("PROJCS[...]")
+    assert describe["fields"][0].name == "NAME"
+    assert describe["fields"][0].length == 50
+
+
+@patch("forklift.describes.config.get_config_prop", get_config_prop)
+def test_datasets_without_their_own_signal_are_not_kept_in_the_garage(tmp_path):
+    store = PalletCache("test", str(tmp_path / "cache.db"))
+    source = tmp_path / "data.gdb"
+    source.mkdir()
+    location = str(source / "Roads")
+
+    first = describes.DescribeCache("test")
+    first._store = store
+    first.set(location, ["roads"])
+
+    assert first.get(location) == ["roads"]
+    assert store.get(location.lower()) is None
+
+    patient = describes.DescribeCache("test")
+    patient._store = store
+
+    assert patient.get(location) is None
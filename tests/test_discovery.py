@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_discovery.py
+
+A module that contains tests for discovery.py
+"""
+
+from os import makedirs, path, remove
+from unittest.mock import patch
+
+from forklift import discovery
+
+test_data_folder = path.join(path.dirname(path.abspath(__file__)), "data")
+
+
+def write(file_path, contents):
+    makedirs(path.dirname(file_path), exist_ok=True)
+
+    with open(file_path, "w") as python_file:
+        python_file.write(contents)
+
+
+def test_find_pallet_classes():
+    assert discovery.find_pallet_classes(path.join(test_data_folder, "pallet_order.py")) == [
+        "PalletA",
+        "PalletB",
+        "PalletC",
+    ]
+    assert discovery.find_pallet_classes(path.join(test_data_folder, "list_pallets", "not_a_pllet.py")) == []
+
+
+def test_find_pallet_classes_inheritance(tmp_path):
+    file_path = str(tmp_path / "pallet.py")
+    write(
+        file_path,
+        "\n".join(
+            [
+                "from forklift import models",
+                "from sgid import Base",
+                "class Helper(object): pass",
+                "class NotAPallet(Helper): pass",
+                "class Attribute(models.Pallet): pass",
+                "class Imported(Base): pass",
+                "class Child(Imported): pass",
+            ]
+        ),
+    )
+
+    assert discovery.find_pallet_classes(file_path) == ["Attribute", "Child", "Imported"]
+
+
+def test_find_pallet_classes_syntax_error():
+    assert discovery.find_pallet_classes(path.join(path.dirname(test_data_folder), "PalletWithSyntaxErrors.py")) is None
+
+
+def test_find_prunes_ignored_folders(tmp_path):
+    write(str(tmp_path / "repo" / "MyPallet.py"), "class MyPallet(Pallet): pass")
+    write(str(tmp_path / "repo" / "helpers" / "pallet_helpers.py"), "def helper(): pass")
+    write(str(tmp_path / "repo" / "data.gdb" / "pallet.py"), "")
+    write(str(tmp_path / "repo" / "node_modules" / "pallet.py"), "")
+
+    found = discovery.PalletIndex(str(tmp_path / "index.json")).find(str(tmp_path / "repo"))
+
+    assert found == [
+        (str(tmp_path / "repo" / "MyPallet.py"), ["MyPallet"]),
+        (str(tmp_path / "repo" / "helpers" / "pallet_helpers.py"), []),
+    ]
+
+
+def test_find_uses_index_until_file_changes(tmp_path):
+    location = str(tmp_path / "index.json")
+    pallet_file = str(tmp_path / "repo" / "MyPallet.py")
+    write(pallet_file, "class MyPallet(Pallet): pass")
+
+    discovery.PalletIndex(location).find(str(tmp_path / "repo"))
+
+    with patch("forklift.discovery.find_pallet_classes") as find_pallet_classes:
+        discovery.PalletIndex(location).find(str(tmp_path / "repo"))
+
+        find_pallet_classes.assert_not_called()
+
+    write(pallet_file, "class MyPallet(Pallet): pass\nclass OtherPallet(Pallet): pass")
+
+    assert discovery.PalletIndex(location).find(str(tmp_path / "repo")) == [(pallet_file, ["MyPallet", "OtherPallet"])]
+
+
+def test_find_reindexes_when_git_head_moves(tmp_path):
+    location = str(tmp_path / "index.json")
+    repo = tmp_path / "repo"
+    write(str(repo / "MyPallet.py"), "class MyPallet(Pallet): pass")
+    write(str(repo / ".git" / "HEAD"), "ref: refs/heads/main\n")
+    write(str(repo / ".git" / "refs" / "heads" / "main"), "abc\n")
+
+    discovery.PalletIndex(location).find(str(repo))
+
+    assert discovery.PalletIndex(location).heads == {str(repo): "abc"}
+
+    write(str(repo / ".git" / "refs" / "heads" / "main"), "def\n")
+
+    with patch("forklift.discovery.find_pallet_classes", return_value=["MyPallet"]) as find_pallet_classes:
+        discovery.PalletIndex(location).find(str(repo))
+
+        find_pallet_classes.assert_called_once()
+
+
+def test_find_removes_deleted_files(tmp_path):
+    location = str(tmp_path / "index.json")
+    write(str(tmp_path / "repo" / "MyPallet.py"), "class MyPallet(Pallet): pass")
+    discovery.PalletIndex(location).find(str(tmp_path / "repo"))
+
+    remove(str(tmp_path / "repo" / "MyPallet.py"))
+    discovery.PalletIndex(location).find(str(tmp_path / "repo"))
+
+    assert discovery.PalletIndex(location).files == {}
@@ -10,6 +10,8 @@ import unittest
 from json import loads
 from os import makedirs, remove, rmdir
 from os.path import abspath, dirname, exists, join
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
 from unittest.mock import Mock, mock_open, patch
 
 import pytest
@@ -136,13 +138,14 @@ class TestListPallets(CleanUpAlternativeConfig):
         self.assertEqual(pallets[0][1].__name__, "PalletOne")
         self.assertEqual(pallets[3][1].__name__, "NestedPallet")
 
-    def test_list_pallets_from_config(self):
+    @patch("forklift.engine._get_pallets_in_file")
+    def test_list_pallets_from_config(self, get_pallets_in_file):
         config.set_config_prop("warehouse", test_pallets_folder, override=True)
         pallets, _ = engine.list_pallets()
 
         self.assertEqual(len(pallets), 4)
-        self.assertEqual(pallets[0][0], join(test_pallets_folder, "multiple_pallets.py"))
-        self.assertEqual(pallets[0][1].__name__, "PalletOne")
+        self.assertEqual(pallets[0], (join(test_pallets_folder, "multiple_pallets.py"), "PalletOne"))
+        get_pallets_in_file.assert_not_called()
 
     def test_list_pallets_order(self):
         pallets, _ = engine._get_pallets_in_file(join(test_data_folder, "pallet_order.py"))
@@ -185,25 +188,70 @@ class TestListPallets(CleanUpAlternativeConfig):
 
 @patch("forklift.engine.git_update")
 @patch("forklift.lift.process_crates_for")
-@patch("forklift.lift.process_pallets")
+@patch("forklift.lift.PalletPipeline")
 class TestLiftPallets(CleanUpAlternativeConfig):
     def setUp(self):
         engine.init()
 
-    def test_lift_pallets_with_path(self, process_pallets, process_crates_for, git_update):
+    @patch("forklift.lift.process_pallets")
+    def test_lift_pallets_with_path(self, process_pallets, pallet_pipeline, process_crates_for, git_update):
+        pallets = []
+        process_crates_for.side_effect = lambda pallets_to_lift, *args: [
+            args[2](pallet) or pallets.append(pallet) for pallet in pallets_to_lift
+        ]
+
         engine.lift_pallets(join(test_pallets_folder, "multiple_pallets.py"))
 
         self.assertEqual(len(process_crates_for.call_args[0][0]), 2)
-        self.assertEqual(len(process_pallets.call_args[0][0]), 2)
+        pallet_pipeline.assert_not_called()
+        self.assertEqual(process_pallets.call_args[0][0], pallets)
+
+    @patch("forklift.engine._record_phase")
+    @patch("forklift.lift.process_pallets")
+    def test_lift_pallets_does_not_time_crates_as_pallets(
+        self, process_pallets, record_phase, pallet_pipeline, process_crates_for, git_update
+    ):
+        process_crates_for.side_effect = lambda *args: sleep(0.2)
+
+        engine.lift_pallets(join(test_pallets_folder, "multiple_pallets.py"))
+
+        seconds = {call[0][0]: call[0][1] for call in record_phase.call_args_list}
+        self.assertGreaterEqual(seconds["process_crates"], 0.2)
+        self.assertLess(seconds["process_pallets"], 0.2)
+
+    @patch("forklift.engine.names_cache")
+    @patch("forklift.engine.describes_cache")
+    def test_lift_pallets_clears_the_describes(
+        self, describes_cache, names_cache, pallet_pipeline, process_crates_for, git_update
+    ):
+        engine.lift_pallets(join(test_pallets_folder, "multiple_pallets.py"))
 
-    def test_lift_pallets_with_out_path(self, process_pallets, process_crates_for, git_update):
+        describes_cache.clear.assert_called_once()
+        names_cache.clear.assert_called_once()
+
+    @patch("forklift.lift.process_pallets")
+    def test_lift_pallets_with_out_path(self, process_pallets, pallet_pipeline, process_crates_for, git_update):
+        process_crates_for.side_effect = lambda pallets_to_lift, *args: [args[2](pallet) for pallet in pallets_to_lift]
         config.set_config_prop("warehouse", test_pallets_folder, override=True)
         engine.lift_pallets()
 
         self.assertEqual(len(process_crates_for.call_args[0][0]), 4)
         self.assertEqual(len(process_pallets.call_args[0][0]), 4)
 
-    def test_lift_pallets_pallet_arg(self, process_pallets, process_crates_for, git_update):
+    def test_lift_pallets_pipeline(self, pallet_pipeline, process_crates_for, git_update):
+        get_config_prop = config.get_config_prop
+
+        with patch(
+            "forklift.config.get_config_prop",
+            side_effect=lambda key, *args: key == "pipelinePallets" or get_config_prop(key, *args),
+        ):
+            engine.lift_pallets(join(test_pallets_folder, "multiple_pallets.py"))
+
+        pallet = process_crates_for.call_args[0][0][0]
+        process_crates_for.call_args[0][3](pallet)
+        pallet_pipeline.return_value.put.assert_called_once_with(pallet)
+
+    def test_lift_pallets_pallet_arg(self, pallet_pipeline, process_crates_for, git_update):
         engine.lift_pallets(join(test_data_folder, "pallet_argument.py"), "test")
 
         pallet = process_crates_for.call_args[0][0][0]
@@ -214,15 +262,32 @@ class TestLiftPallets(CleanUpAlternativeConfig):
         pallet = process_crates_for.call_args[0][0][0]
         self.assertEqual(pallet.arg, None)
 
-    def test_lift_pallets_alphebetical_order(self, process_pallets, process_crates_for, git_update):
+    def test_lift_pallets_alphebetical_order(self, pallet_pipeline, process_crates_for, git_update):
         engine.lift_pallets(join(test_data_folder, "alphabetize", "pallet.py"))
 
         order = [p.__class__.__name__ for p in process_crates_for.call_args[0][0]]
 
         self.assertEqual(order, ["Pallet1", "Pallet2", "Pallet3"])
 
+    @patch("forklift.engine.Journal")
+    def test_lift_pallets_resume_skips_git_and_uses_journal_arguments(
+        self, journal, pallet_pipeline, process_crates_for, git_update
+    ):
+        journal.return_value.load.return_value = True
+        journal.return_value.file_path = join(test_data_folder, "pallet_argument.py")
+        journal.return_value.pallet_arg = "resumed"
+        journal.return_value.selectors = None
+        journal.return_value.phases = set()
+        journal.return_value.pallet_phases = {}
+
+        engine.lift_pallets(resume=True)
+
+        git_update.assert_not_called()
+        journal.return_value.start.assert_not_called()
+        self.assertEqual(process_crates_for.call_args[0][0][0].arg, "resumed")
+
     @patch("forklift.lift.prepare_packaging_for_pallets")
-    def test_lift_pallets_prepare_packaging(self, prepare_mock, process_pallets, process_crates_for, git_update):
+    def test_lift_pallets_prepare_packaging(self, prepare_mock, pallet_pipeline, process_crates_for, git_update):
         engine.lift_pallets(join(test_data_folder, "pallet_argument.py"))
 
         prepare_mock.assert_called_once()
@@ -232,6 +297,23 @@ class TestEngineGeneral(unittest.TestCase):
     def test_repo_to_url(self):
         self.assertEqual(engine._repo_to_url("repo"), "https://github.com/repo.git")
 
+    @patch("forklift.engine.core.update", return_value=(Crate.UPDATED, None))
+    def test_update_with_journal(self, update):
+        journal = Mock()
+        journal.crates = {"finished": (Crate.NO_CHANGES, None)}
+        finished = Mock()
+        finished.destination = "finished"
+        pending = Mock()
+        pending.destination = "pending"
+        pending.timeout = None
+
+        self.assertEqual(engine._update_with_journal(journal, finished, None, None), (Crate.NO_CHANGES, None))
+        update.assert_not_called()
+        self.assertIs(finished.resumed, True)
+
+        self.assertEqual(engine._update_with_journal(journal, pending, None, None), (Crate.UPDATED, None))
+        journal.record_crate.assert_called_once_with(pending, (Crate.UPDATED, None))
+
     def test_send_report_email(self):
         pytest.skip()
 
@@ -291,16 +373,10 @@ class TestEngineGeneral(unittest.TestCase):
 
 
 class TestGitUpdate(CleanUpAlternativeConfig):
-    @patch("git.Repo.clone_from")
+    @patch("forklift.engine._run_git")
     @patch("forklift.engine._get_repo")
     @patch("forklift.engine._validate_repo")
-    def test_git_update(self, _validate_repo_mock, _get_repo_mock, clone_from_mock):
-        remote_mock = Mock()
-        remote_mock.pull = Mock()
-        remote_mock.pull.return_value = []
-        repo_mock = Mock()
-        repo_mock.remotes = [remote_mock]
-        _get_repo_mock.return_value = repo_mock
+    def test_git_update(self, _validate_repo_mock, _get_repo_mock, run_git_mock):
         _validate_repo_mock.return_value = ""
         engine.init()
         config.set_config_prop("warehouse", test_pallets_folder, override=True)
@@ -308,10 +384,77 @@ class TestGitUpdate(CleanUpAlternativeConfig):
 
         results = engine.git_update()
 
-        clone_from_mock.assert_called_once()
-        remote_mock.pull.assert_called_once()
+        self.assertEqual([call[0][0][0] for call in run_git_mock.call_args_list], ["pull", "clone"])
         self.assertEqual(len(results), 0)
 
+    @patch("forklift.engine._run_git")
+    @patch("forklift.engine._get_repo")
+    def test_git_update_uses_blobless_clones_and_timeouts(self, _get_repo_mock, run_git_mock):
+        engine.init()
+        config.set_config_prop("warehouse", test_pallets_folder, override=True)
+        config.set_config_prop("repositories", ["agrc/nested", "agrc/forklift"], override=True)
+
+        with patch("forklift.engine.default_git_timeout_seconds", 10):
+            engine.git_update()
+
+        pull, clone = run_git_mock.call_args_list
+        self.assertEqual(clone[0][0][:2], ["clone", "--filter=blob:none"])
+        self.assertEqual(pull[0][0], ["pull"])
+
+        for call in [pull, clone]:
+            env = call[1].get("env") or call[0][2]
+            timeout = call[1].get("timeout") or call[0][3]
+            self.assertEqual(env["GIT_HTTP_LOW_SPEED_TIME"], "10")
+            self.assertEqual(env["GIT_TERMINAL_PROMPT"], "0")
+            self.assertEqual(timeout, engine.default_git_repository_timeout_seconds)
+
+    def test_run_git_stops_hung_commands(self):
+        temp = TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        start_seconds = perf_counter()
+
+        with self.assertRaises(TimeoutError):
+            engine._run_git(
+                ["-c", "protocol.ext.allow=always", "clone", "ext::sleep 30", join(temp.name, "hung")], timeout=1
+            )
+
+        self.assertLess(perf_counter() - start_seconds, 10)
+
+    def test_git_update_pulls_existing_repositories(self):
+        from git import Actor, Repo
+
+        temp = TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        author = Actor("forklift", "forklift@utah.gov")
+        origin = Repo.init(join(temp.name, "origin"))
+        with open(join(origin.working_dir, "pallet.py"), "w") as pallet_file:
+            pallet_file.write("")
+        origin.index.add(["pallet.py"])
+        origin.index.commit("first", author=author, committer=author)
+        warehouse = join(temp.name, "warehouse")
+        clone = Repo.clone_from(origin.working_dir, join(warehouse, "pallets"))
+        clone.close()
+        origin.index.commit("second", author=author, committer=author)
+        engine.init()
+        config.set_config_prop("warehouse", warehouse, override=True)
+
+        error, message = engine._clone_or_pull_repo("agrc/pallets", timeout=10, repository_timeout=60)
+
+        self.assertIsNone(error)
+        self.assertIn("git updating: agrc/pallets", message)
+        self.assertIn("updated to", message)
+        with Repo(join(warehouse, "pallets")) as pulled:
+            self.assertEqual(pulled.head.commit, origin.head.commit)
+        origin.close()
+
+    @patch("forklift.engine._clone_or_pull_repo")
+    def test_git_update_returns_errors_in_order(self, _clone_or_pull_repo):
+        _clone_or_pull_repo.side_effect = lambda repo, timeout, repository_timeout: (repo + " error", None)
+        engine.init()
+        config.set_config_prop("repositories", ["agrc/one", "agrc/two", "agrc/three"], override=True)
+
+        self.assertEqual(engine.git_update(), ["agrc/one error", "agrc/two error", "agrc/three error"])
+
 
 class TestPackingSlip(unittest.TestCase):
     def test_format_ticket_for_report(self):
@@ -416,14 +559,43 @@ class TestPackingSlip(unittest.TestCase):
         dump.assert_called_once()
         self.assertEqual(len(dump.call_args[0][0]), 2)
 
-    @patch("forklift.engine.build_pallets", return_data=1)
-    def test_process_packing_slip(self, mock):
+    @patch("forklift.engine._build_pallet")
+    @patch("forklift.engine._get_pallets_in_file")
+    def test_process_packing_slip(self, get_pallets_in_file, build_pallet):
+        AGOLPallet = type("AGOLPallet", (), {})
+        AGOLPalletFailed = type("AGOLPalletFailed", (), {})
+        AGOLPalletFailedForceShip = type("AGOLPalletFailedForceShip", (), {})
+        get_pallets_in_file.return_value = (
+            [
+                ("AGOLPallet.py", AGOLPallet),
+                ("AGOLPallet.py", AGOLPalletFailed),
+                ("AGOLPallet.py", AGOLPalletFailedForceShip),
+            ],
+            None,
+        )
+
         with open(join(test_data_folder, "test_engine", "packing-slip.json")) as slip_file:
             packing_slip = loads(slip_file.read())
 
             pallets = engine._process_packing_slip(packing_slip)
 
             self.assertEqual(len(pallets), 2)
+            get_pallets_in_file.assert_called_once_with("c:\\forklift\\warehouse\\warehouse\\sgid\\AGOLPallet.py")
+            self.assertEqual(build_pallet.call_count, 2)
+
+    @patch("forklift.engine._get_pallets_in_file")
+    def test_process_packing_slip_uses_built_pallets(self, get_pallets_in_file):
+        with open(join(test_data_folder, "test_engine", "packing-slip.json")) as slip_file:
+            packing_slip = loads(slip_file.read())
+
+        built_pallets = [Mock(), Mock()]
+        built_pallets[0].name = packing_slip[0]["name"]
+        built_pallets[1].name = packing_slip[2]["name"]
+
+        pallets = engine._process_packing_slip(packing_slip, built_pallets=built_pallets)
+
+        self.assertEqual(pallets, built_pallets)
+        get_pallets_in_file.assert_not_called()
 
 
 class TestScorchedEarth(CleanUpAlternativeConfig):
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_history.py
+
+A module that contains tests for history.py
+"""
+
+import sqlite3
+from contextlib import closing
+from unittest.mock import Mock
+
+from forklift import history
+from forklift.models import Crate
+
+
+def crate(name, seconds=None, rows=None, adds=None, deletes=None, phase_times=None):
+    mock = Mock()
+    mock.name = name
+    mock.processing_time = seconds
+    mock.total_rows = rows
+    mock.adds = adds
+    mock.deletes = deletes
+    mock.phase_times = phase_times or {}
+    mock.result = (Crate.UPDATED, None)
+
+    return mock
+
+
+def test_record_crates_skips_unprocessed_crates(tmp_path):
+    location = str(tmp_path / "history.db")
+
+    history.record_crates([crate("a", 10, 100), crate("b")], location)
+
+    assert history.get_crate_history(["a", "b"], location) == {"a": (10, 100)}
+
+
+def test_get_crate_history_uses_median_of_recent_runs(tmp_path):
+    location = str(tmp_path / "history.db")
+
+    for seconds in [1, 100, 3, 4, 5, 6]:
+        history.record_crates([crate("a", seconds, seconds * 10)], location)
+
+    assert history.get_crate_history(["a"], location) == {"a": (5, 60)}
+
+
+def test_estimate_durations_falls_back_to_row_counts(tmp_path):
+    location = str(tmp_path / "history.db")
+    history.record_crates([crate("known", 10, 1000)], location)
+
+    estimates = history.estimate_durations(
+        [crate("known"), crate("new"), crate("broken")],
+        lambda c: {"new": 500, "broken": None}[c.name] + 0,
+        location,
+    )
+
+    assert estimates == {"known": 10, "new": 5, "broken": 0}
+
+
+def test_estimate_durations_without_history(tmp_path):
+    location = str(tmp_path / "history.db")
+    count_rows = Mock()
+
+    assert history.estimate_durations([crate("a"), crate("b")], count_rows, location) == {"a": 0, "b": 0}
+    count_rows.assert_not_called()
+
+
+def test_estimate_durations_without_count_rows(tmp_path):
+    location = str(tmp_path / "history.db")
+    history.record_crates([crate("known", 10, 1000)], location)
+
+    assert history.estimate_durations([crate("known"), crate("new")], location=location) == {"known": 10, "new": None}
+
+
+def test_get_latest_results(tmp_path):
+    location = str(tmp_path / "history.db")
+    failed = crate("a", 1, 10)
+    failed.result = (Crate.UNHANDLED_EXCEPTION, "error")
+
+    history.record_crates([crate("a", 1, 10), crate("b", 1, 10)], location)
+    history.record_crates([failed], location)
+
+    assert history.get_latest_results(["a", "b", "c"], location) == {
+        "a": Crate.UNHANDLED_EXCEPTION,
+        "b": Crate.UPDATED,
+    }
+
+
+def test_record_crates_keeps_invalid_data_results(tmp_path):
+    location = str(tmp_path / "history.db")
+    invalid = crate("a")
+    invalid.result = (Crate.INVALID_DATA, "missing source")
+
+    history.record_crates([crate("a", 10, 100)], location)
+    history.record_crates([invalid], location)
+
+    assert history.get_latest_results(["a"], location) == {"a": Crate.INVALID_DATA}
+    assert history.get_crate_history(["a"], location) == {"a": (10, 100)}
+
+
+def test_connect_adds_columns_to_old_databases(tmp_path):
+    location = str(tmp_path / "history.db")
+    with closing(sqlite3.connect(location)) as connection, connection:
+        connection.execute(
+            "CREATE TABLE crates (name TEXT NOT NULL, finished TEXT NOT NULL, seconds REAL, rows INTEGER, result TEXT)"
+        )
+        connection.execute("INSERT INTO crates VALUES ('a', '2020-01-01', 1, 10, 'Updated')")
+
+    history.record_crates([crate("a", 2, 20, 1, 0)], location)
+
+    with closing(history.connect(location)) as connection:
+        rows = connection.execute("SELECT seconds, adds, deletes FROM crates ORDER BY finished").fetchall()
+
+    assert rows == [(1, None, None), (2, 1, 0)]
+
+
+def test_get_stats_summarizes_runs_phases_and_crates(tmp_path):
+    location = str(tmp_path / "history.db")
+
+    for seconds in [10, 12, 30]:
+        history.start_run("lift", location)
+        history.record_phase(history.RUN, "dropoff_data", seconds, size=1024, location=location)
+        history.record_phase(history.SERVER, "copy", seconds * 2, "server1", location=location)
+        history.record_crates(
+            [
+                crate("Parcels_abc", seconds, 100, 5, 1, {"hash": seconds - 1, "edit": 1}),
+                crate("Roads_def", 1, 10),
+            ],
+            location,
+        )
+        history.finish_run(seconds, True, location)
+
+    history.start_run("ship", location)
+
+    assert history.current_run is not None
+
+    stats = history.get_stats("parcels", location=location)
+
+    assert [run["operation"] for run in stats["runs"]] == ["ship", "lift", "lift", "lift"]
+    assert stats["runs"][0]["success"] is None
+    assert stats["runs"][1]["seconds"] == 30
+
+    phases = {(phase["kind"], phase["target"], phase["name"]): phase for phase in stats["phases"]}
+    assert phases[(history.RUN, "", "dropoff_data")]["median"] == 12
+    assert phases[(history.RUN, "", "dropoff_data")]["bytes"] == 1024
+    assert phases[(history.SERVER, "server1", "copy")]["latest"] == 60
+
+    assert [summary["name"] for summary in stats["crates"]] == ["Parcels_abc", "Roads_def"]
+    assert stats["crates"][0]["trend"] == 30 / 11
+    assert stats["crates"][0]["count"] == 3
+
+    assert len(stats["crate_runs"]) == 3
+    assert stats["crate_runs"][-1]["adds"] == 5
+    assert stats["crate_runs"][-1]["phases"] == {"hash": 29, "edit": 1}
+
+    assert "Parcels_abc" in history.format_stats(stats)
+
+    history.finish_run(1, False, location)
+
+    assert history.current_run is None
+
+
+def test_get_stats_limits_days(tmp_path):
+    location = str(tmp_path / "history.db")
+    with closing(history.connect(location)) as connection, connection:
+        connection.execute("INSERT INTO crates (name, finished, seconds) VALUES ('old', '2000-01-01', 1)")
+
+    history.record_crates([crate("new", 1, 10)], location)
+
+    assert [summary["name"] for summary in history.get_stats(days="30", location=location)["crates"]] == ["new"]
+    assert history.format_stats(history.get_stats(location=str(tmp_path / "empty.db"))).startswith(
+        "there is no history yet"
+    )
+
+
+def test_percentile():
+    assert history.percentile([5], 90) == 5
+    assert history.percentile([1, 2, 3, 4, 5], 50) == 3
+    assert history.percentile([10, 0], 90) == 9
+
+
+def test_get_phase_medians_uses_recent_runs_of_the_operation(tmp_path):
+    location = str(tmp_path / "history.db")
+
+    for seconds in [100, 1, 2, 3, 4, 5]:
+        history.start_run("lift", location)
+        history.record_phase(history.RUN, "dropoff_data", seconds, location=location)
+        history.finish_run(seconds, True, location)
+
+    history.start_run("ship", location)
+    history.record_phase(history.RUN, "dropoff_data", 1000, location=location)
+    history.finish_run(1000, True, location)
+
+    assert history.get_phase_medians("lift", location) == {"dropoff_data": 3}
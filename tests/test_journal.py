@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_journal.py
+
+A module that contains tests for journal.py
+"""
+
+from unittest.mock import Mock
+
+from forklift.journal import Journal
+from forklift.models import Crate
+
+
+def test_load_without_journal_has_nothing_to_resume(tmp_path):
+    assert Journal(str(tmp_path / "journal.jsonl")).load() is False
+
+
+def test_load_restores_unfinished_run(tmp_path):
+    location = str(tmp_path / "journal.jsonl")
+    crate = Mock()
+    crate.destination = "c:\\data.gdb\\counties"
+    pallet = Mock()
+    pallet.name = "pallet.py:Pallet"
+    pallet.success = (False, "process error")
+
+    journal = Journal(location)
+    journal.start("pallet.py", "arg", {"crate_pattern": "Roads*"})
+    journal.record_crate(crate, (Crate.UPDATED, None))
+    journal.record_pallet_phase(pallet, "process")
+    journal.record_phase("dropoff_data")
+
+    patient = Journal(location)
+
+    assert patient.load() is True
+    assert patient.file_path == "pallet.py"
+    assert patient.pallet_arg == "arg"
+    assert patient.selectors == {"crate_pattern": "Roads*"}
+    assert patient.crates == {crate.destination: (Crate.UPDATED, None)}
+    assert patient.pallet_phases == {("pallet.py:Pallet", "process"): (False, "process error")}
+    assert patient.phases == {"dropoff_data"}
+
+
+def test_load_finished_run_has_nothing_to_resume(tmp_path):
+    location = str(tmp_path / "journal.jsonl")
+    journal = Journal(location)
+    journal.start(None, None)
+    journal.finish()
+
+    assert Journal(location).load() is False
+
+
+def test_load_skips_partial_entries(tmp_path):
+    location = str(tmp_path / "journal.jsonl")
+    journal = Journal(location)
+    journal.start(None, None)
+
+    with open(location, "a") as journal_file:
+        journal_file.write('{"type": "crate", "destin')
+
+    patient = Journal(location)
+
+    assert patient.load() is True
+    assert patient.crates == {}
+
+
+def test_start_discards_previous_run(tmp_path):
+    location = str(tmp_path / "journal.jsonl")
+    journal = Journal(location)
+    journal.start(None, None)
+    journal.record_phase("gift_wrap")
+
+    Journal(location).start(None, None)
+    patient = Journal(location)
+    patient.load()
+
+    assert patient.phases == set()
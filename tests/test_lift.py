@@ -7,11 +7,13 @@ A module for testing lift.py
 """
 
 import unittest
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 from unittest.mock import Mock, patch
 
 import arcpy
-from forklift import core, engine, lift
+from forklift import config, core, engine, lift
 from forklift.models import Crate, Pallet
 
 fgd_describe = Mock()
@@ -68,6 +70,240 @@ class TestLift(unittest.TestCase):
         self.assertEqual(crate1.result[0], Crate.UPDATED)
         self.assertEqual(crate2.result[0], Crate.UPDATED)
 
+    def test_process_crates_for_calls_ready_when_all_crates_are_finished(self):
+        shared_crate1 = Crate("DNROilGasWells", test_gdb, test_gdb, "a")
+        shared_crate2 = Crate("DNROilGasWells", test_gdb, test_gdb, "a")
+        crate = Crate("DNROilGasWells", test_gdb, test_gdb, "b")
+        pallet1 = Pallet()
+        pallet1._crates = [shared_crate1]
+        pallet2 = Pallet()
+        pallet2._crates = [shared_crate2, crate]
+        empty_pallet = Pallet()
+        update_def = Mock(return_value=(Crate.UPDATED, "message"))
+        on_pallet_ready = Mock()
+        lift.process_crates_for([pallet1, pallet2, empty_pallet], update_def, on_pallet_ready=on_pallet_ready)
+
+        self.assertEqual(on_pallet_ready.call_count, 3)
+        self.assertEqual(on_pallet_ready.call_args_list[0][0][0], empty_pallet)
+        self.assertEqual(on_pallet_ready.call_args_list[1][0][0], pallet1)
+        self.assertEqual(on_pallet_ready.call_args_list[2][0][0], pallet2)
+        self.assertEqual(shared_crate2.result[0], Crate.UPDATED)
+
+    def test_process_crates_for_keeps_going_after_a_crate_raises(self):
+        failed = Crate("DNROilGasWells", test_gdb, test_gdb, "a")
+        crate = Crate("DNROilGasWells", test_gdb, test_gdb, "b")
+        pallet = Pallet()
+        pallet._crates = [failed, crate]
+        on_pallet_ready = Mock()
+
+        def update_def(crate, *args):
+            if crate is failed:
+                raise Exception("boom")
+
+            return (Crate.UPDATED, "message")
+
+        update_def = Mock(side_effect=update_def)
+
+        with patch("forklift.lift.config.get_config_prop", side_effect=lambda key, default=None: default):
+            lift.process_crates_for([pallet], update_def, on_pallet_ready=on_pallet_ready)
+
+        self.assertEqual(update_def.call_count, 2)
+        self.assertEqual(failed.result, (Crate.UNHANDLED_EXCEPTION, "boom"))
+        self.assertEqual(crate.result[0], Crate.UPDATED)
+        on_pallet_ready.assert_called_once_with(pallet)
+
+    @patch("forklift.lift.history.record_crates")
+    def test_process_crates_for_does_not_time_resumed_crates(self, record_crates):
+        resumed = Crate("DNROilGasWells", test_gdb, test_gdb, "a")
+        crate = Crate("DNROilGasWells", test_gdb, test_gdb, "b")
+        pallet = Pallet()
+        pallet._crates = [resumed, crate]
+
+        def update_def(crate, *args):
+            crate.resumed = crate is resumed
+
+            return (Crate.NO_CHANGES, None)
+
+        lift.process_crates_for([pallet], update_def)
+
+        self.assertIsNone(resumed.processing_time)
+        self.assertIsNotNone(crate.processing_time)
+        record_crates.assert_called_once()
+
+    def test_process_crates_for_only_updates_selected_crates(self):
+        selected = Crate("DNROilGasWells", test_gdb, test_gdb, "Roads")
+        skipped = Crate("DNROilGasWells", test_gdb, test_gdb, "Rivers")
+        pallet = Pallet()
+        pallet._crates = [selected, skipped]
+        other_pallet = Pallet()
+        other_pallet._crates = [Crate("DNROilGasWells", test_gdb, test_gdb, "Parcels")]
+        update_def = Mock(return_value=(Crate.UPDATED, "message"))
+        on_pallet_ready = Mock()
+
+        pallets, destinations = lift.select_crates([pallet, other_pallet], crate_pattern="road*")
+        lift.process_crates_for(pallets, update_def, on_pallet_ready=on_pallet_ready, destinations=destinations)
+
+        self.assertEqual(pallets, [pallet])
+        self.assertEqual(destinations, {selected.destination})
+        update_def.assert_called_once()
+        on_pallet_ready.assert_called_once_with(pallet)
+        self.assertEqual(selected.result[0], Crate.UPDATED)
+        self.assertEqual(skipped.result, (Crate.NO_CHANGES, None))
+
+    @patch("forklift.lift.history.estimate_durations")
+    def test_sort_longest_first_counts_crates_without_history(self, estimate_durations):
+        crates = []
+        for name in ["short", "new", "long"]:
+            crate = Mock()
+            crate.name = name
+            crates.append((crate, None))
+        estimate_durations.return_value = {"short": 1, "new": 5, "long": 10}
+
+        estimates = lift._sort_longest_first(crates)
+
+        self.assertEqual([crate.name for crate, _ in crates], ["long", "new", "short"])
+        self.assertEqual(estimates, estimate_durations.return_value)
+        self.assertEqual(estimate_durations.call_args[0][1], lift._count_source_rows)
+
+    @patch("forklift.lift.history.get_latest_results")
+    def test_select_crates_by_workspace_and_failed_results(self, get_latest_results):
+        roads = Mock(destination_name="Roads", destination_workspace="C:\\Hashed\\Roads.gdb", destination="roads")
+        roads.name = "roads_hash"
+        rivers = Mock(destination_name="Rivers", destination_workspace="C:\\Hashed\\Water.gdb", destination="rivers")
+        rivers.name = "rivers_hash"
+        parcels = Mock(destination_name="Parcels", destination_workspace="C:\\Hashed\\Roads.gdb", destination="parcels")
+        parcels.name = "parcels_hash"
+        pallet = Mock()
+        pallet.get_crates.return_value = [roads, rivers, parcels]
+        get_latest_results.return_value = {"roads_hash": Crate.UNHANDLED_EXCEPTION, "rivers_hash": Crate.ERROR}
+
+        _, destinations = lift.select_crates([pallet], destination_workspace="c:\\hashed\\roads.gdb")
+        self.assertEqual(destinations, {"roads", "parcels"})
+
+        _, destinations = lift.select_crates([pallet], only_failed=True)
+        self.assertEqual(destinations, {"roads", "rivers"})
+
+        _, destinations = lift.select_crates([pallet], destination_workspace="*roads.gdb", only_failed=True)
+        self.assertEqual(destinations, {"roads"})
+
+    @patch("forklift.lift.history.get_latest_results", side_effect=sqlite3.DatabaseError("malformed"))
+    def test_select_crates_selects_all_crates_without_history(self, get_latest_results):
+        roads = Mock(destination_name="Roads", destination="roads")
+        rivers = Mock(destination_name="Rivers", destination="rivers")
+        pallet = Mock()
+        pallet.get_crates.return_value = [roads, rivers]
+
+        pallets, destinations = lift.select_crates([pallet], only_failed=True)
+
+        self.assertEqual(pallets, [pallet])
+        self.assertEqual(destinations, {"roads", "rivers"})
+
+    @patch("forklift.lift.history.record_crates")
+    def test_process_crates_for_records_invalid_crates(self, record_crates):
+        invalid = Crate("DNROilGasWells", test_gdb, test_gdb, "a")
+        invalid.result = (Crate.INVALID_DATA, "invalid")
+        crate = Crate("DNROilGasWells", test_gdb, test_gdb, "b")
+        pallet = Pallet()
+        pallet._crates = [invalid, crate]
+        update_def = Mock(return_value=(Crate.NO_CHANGES, None))
+
+        lift.process_crates_for([pallet], update_def)
+
+        update_def.assert_called_once()
+        self.assertEqual(record_crates.call_args[0][0], [crate, invalid])
+
+    @patch("forklift.lift.ProcessPoolExecutor", ThreadPoolExecutor)
+    @patch("forklift.lift.process_pallet_in_worker", return_value=((True, None), 1))
+    def test_pallet_pipeline_processes_pallets_in_workers(self, process_pallet_in_worker):
+        pallet = self.PalletMock()
+        pallet.is_ready_to_ship.return_value = True
+        pallet.requires_processing.return_value = True
+        pallet.get_workspaces.return_value = set()
+        pallet.get_crates.return_value = []
+        pallet.success = (True,)
+        on_processed = Mock()
+
+        with lift.PalletPipeline("arg", on_processed) as pipeline:
+            pipeline.put(pallet)
+            pipeline.put(pallet)
+
+        pallet.process.assert_not_called()
+        self.assertEqual(process_pallet_in_worker.call_count, 2)
+        self.assertEqual(process_pallet_in_worker.call_args[0][1], "arg")
+        self.assertEqual(on_processed.call_count, 2)
+        self.assertEqual(pallet.success, (True, None))
+
+    @patch("forklift.lift.PalletPipeline")
+    def test_process_pallets_uses_workers(self, pallet_pipeline):
+        pallet = self.PalletMock()
+        on_processed = Mock()
+
+        with patch("forklift.lift.config.get_config_prop", return_value=2):
+            lift.process_pallets([pallet], "arg", on_processed)
+
+        pallet_pipeline.assert_called_once_with("arg", on_processed)
+        pallet_pipeline.return_value.__enter__.return_value.put.assert_called_once_with(pallet)
+        pallet.process.assert_not_called()
+
+    def test_workspaces_overlap(self):
+        gdb = path.join("c:", "mapdata", "udnr.gdb")
+        folder = path.join("c:", "mapdata")
+
+        self.assertTrue(lift.workspaces_overlap({gdb}, {gdb}))
+        self.assertTrue(lift.workspaces_overlap({gdb}, {folder}))
+        self.assertTrue(lift.workspaces_overlap({folder}, {"other", gdb}))
+        self.assertFalse(lift.workspaces_overlap({gdb}, {path.join("c:", "mapdata", "udnr2.gdb")}))
+        self.assertFalse(lift.workspaces_overlap({gdb}, set()))
+
+    @patch("forklift.lift.config.get_config_prop", return_value=2)
+    def test_pallet_pipeline_serializes_overlapping_pallets(self, get_config_prop):
+        def pallet_with(*workspaces):
+            pallet = Mock(Pallet)
+            pallet.get_workspaces.return_value = set(workspaces)
+
+            return pallet
+
+        shared = pallet_with("a.gdb", "b.gdb")
+        overlapping = pallet_with("b.gdb")
+        other = pallet_with("c.gdb")
+        another = pallet_with("d.gdb")
+
+        patient = lift.PalletPipeline()
+
+        self.assertEqual(patient._get_startable([shared, overlapping, other, another], []), [shared, other])
+        self.assertEqual(patient._get_startable([overlapping, other], [shared]), [other])
+        self.assertEqual(patient._get_startable([overlapping, other, another], [shared, other]), [])
+
+    @patch("forklift.engine.build_pallets")
+    def test_process_pallet_in_worker(self, build_pallets):
+        crate = Mock()
+        crate.destination = "a"
+        crate.result = (Crate.UNINITIALIZED, None)
+        pallet = Pallet()
+        pallet._crates = [crate]
+        pallet.process = Mock()
+        build_pallets.return_value = ([pallet], [])
+
+        success, seconds = lift.process_pallet_in_worker(
+            "pallet.py:Pallet", "arg", {"a": (Crate.UPDATED, None)}, config.config_location
+        )
+
+        build_pallets.assert_called_once_with("pallet.py:Pallet", "arg")
+        pallet.process.assert_called_once()
+        self.assertEqual(crate.result, (Crate.UPDATED, None))
+        self.assertEqual(success, (True, None))
+        self.assertGreaterEqual(seconds, 0)
+
+    @patch("forklift.engine.build_pallets")
+    def test_process_pallet_in_worker_returns_errors(self, build_pallets):
+        pallet = Pallet()
+        pallet.process = Mock(side_effect=Exception("process error"))
+        build_pallets.return_value = ([pallet], [])
+
+        success, _ = lift.process_pallet_in_worker("pallet.py:Pallet", None, {}, config.config_location)
+
+        self.assertEqual(success, (False, "process error"))
+
     def test_process_pallets_all_requires_processing(self):
         requires_pallet = self.PalletMock()
         requires_pallet.is_ready_to_ship.return_value = True
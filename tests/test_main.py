@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_main.py
+
+A module that contains tests for __main__.py
+"""
+
+import subprocess
+import sys
+
+from forklift import seat
+
+
+def test_cli_does_not_import_arcgis_modules_at_startup():
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import forklift.__main__"], stderr=subprocess.PIPE, text=True
+    )
+    modules = [module for module, _, _ in seat.get_import_times(process.stderr)]
+
+    assert process.returncode == 0, process.stderr
+    assert "forklift.__main__" in modules
+    assert "arcpy" not in modules
+    assert "arcgis" not in modules
+
+
+def test_stats_days_must_be_a_number():
+    process = subprocess.run([sys.executable, "-m", "forklift", "stats", "--days=abc"], capture_output=True, text=True)
+
+    assert process.returncode != 0
+    assert "--days must be a positive number of days" in process.stdout + process.stderr
+    assert "Usage:" in process.stdout + process.stderr
+    assert "Traceback" not in process.stderr
@@ -7,10 +7,13 @@ A module that contains tests for the pallet module.
 """
 
 import unittest
+from os import sep
+from os.path import join, normpath
 from time import sleep
 from unittest.mock import patch
 
-from forklift.models import Crate, Pallet
+from forklift.exceptions import ParallelMapException
+from forklift.models import Crate, Pallet, get_executor_workers
 
 
 class TestPallet(unittest.TestCase):
@@ -147,6 +150,22 @@ class TestPallet(unittest.TestCase):
 
         self.assertEqual(pallet.get_crates()[0].destination_coordinate_system.factoryCode, 26912)
 
+    def test_get_workspaces(self):
+        crate = Crate("", "", join("C:", "MapData", "UDNR.gdb"), "")
+
+        self.patient._crates = [crate, crate]
+        self.patient.copy_data = [join("C:", "MapData", "Copy.gdb") + sep]
+        self.patient.resources = [join("C:", "MapData", "Resources")]
+
+        self.assertEqual(
+            self.patient.get_workspaces(),
+            {
+                normpath(join("c:", "mapdata", "udnr.gdb")),
+                normpath(join("c:", "mapdata", "copy.gdb")),
+                normpath(join("c:", "mapdata", "resources")),
+            },
+        )
+
     def test_is_ready_to_ship_no_crates_returns_true(self):
         self.assertTrue(self.patient.is_ready_to_ship())
 
@@ -227,6 +246,38 @@ class TestPallet(unittest.TestCase):
         self.assertEqual(self.patient.ship(), NotImplemented)
         self.assertEqual(self.patient.validate_crate(None), NotImplemented)
 
+    def test_map(self):
+        results = self.patient.map(lambda value: value * 2, [1, 2, 3], name="double")
+
+        self.assertEqual(results, [2, 4, 6])
+        self.assertIn("double", self.patient.processing_times)
+        self.assertEqual(self.patient.total_processing_time, 0)
+
+    def test_map_captures_exceptions(self):
+        def fail_on_two(value):
+            if value == 2:
+                raise ValueError("two")
+
+            return value
+
+        with self.assertRaises(ParallelMapException) as context:
+            self.patient.map(fail_on_two, [1, 2, 3])
+
+        self.assertEqual(len(context.exception.errors), 1)
+        self.assertEqual(context.exception.errors[0][0], 2)
+        self.assertEqual(context.exception.results, [1, None, 3])
+
+    @patch("forklift.models.cpu_count", return_value=8)
+    @patch("forklift.models.config.get_config_prop")
+    def test_get_executor_workers(self, get_config_prop, cpu_count):
+        get_config_prop.side_effect = lambda key, default: {"crateWorkers": 2, "palletWorkers": 2}.get(key, default)
+
+        self.assertEqual(get_executor_workers(), 4)
+
+        get_config_prop.side_effect = lambda key, default: {"palletExecutorWorkers": 3}.get(key, default)
+
+        self.assertEqual(get_executor_workers(), 3)
+
 
 class TestRequiresProcessing(unittest.TestCase):
     def setUp(self):
@@ -443,3 +494,5 @@ class TestPalletAddPackingSlip(unittest.TestCase):
 
         #: this is basically here to make sure that add_packing_slip doesn't throw an exception
         self.assertFalse(pallet.get_crates()[1].was_updated())
+        self.assertEqual(pallet.get_crates()[1].result, (Crate.NO_CHANGES, None))
+        self.assertFalse(pallet.get_crates()[1]._resolved)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_plan.py
+
+A module that contains tests for plan.py
+"""
+
+import json
+from unittest.mock import Mock, patch
+
+from forklift import plan
+from forklift.models import Changes, Crate
+
+
+def get_crate(name="Roads", result=(Crate.UNINITIALIZED, None), has_global_id=False):
+    crate = Mock()
+    crate.name = name + "_hash"
+    crate.destination_name = name
+    crate.destination = "c:\\hashed.gdb\\" + name
+    crate.result = result
+    crate.source_describe = {"hasGlobalID": has_global_id}
+
+    return crate
+
+
+def get_change_detection(has_table=False, has_changed=False):
+    change_detection = Mock()
+    change_detection.has_table.return_value = has_table
+    change_detection.has_changed.return_value = has_changed
+
+    return change_detection
+
+
+def get_changes(adds, deletes, total_rows):
+    changes = Changes([])
+    changes.adds = dict.fromkeys(adds)
+    changes._deletes = dict.fromkeys(deletes)
+    changes.total_rows = total_rows
+
+    return changes
+
+
+@patch("forklift.plan.arcpy")
+@patch("forklift.plan.core.get_hash_diff")
+def test_plan_crate_with_hash_changes(get_hash_diff, arcpy):
+    arcpy.Exists.return_value = True
+    get_hash_diff.return_value = get_changes(["a", "b"], ["c"], 10)
+
+    crate_plan = plan.plan_crate(get_crate(), Mock(return_value=True), get_change_detection())
+
+    assert crate_plan["strategy"] == plan.HASH
+    assert (crate_plan["adds"], crate_plan["deletes"], crate_plan["source_rows"]) == (2, 1, 10)
+
+
+@patch("forklift.plan.arcpy")
+@patch("forklift.plan.core.get_hash_diff")
+def test_plan_crate_without_changes_is_skipped(get_hash_diff, arcpy):
+    arcpy.Exists.return_value = True
+    get_hash_diff.return_value = get_changes([], [], 10)
+
+    crate_plan = plan.plan_crate(get_crate(has_global_id=True), Mock(return_value=True), get_change_detection())
+
+    assert crate_plan["strategy"] == plan.SKIP
+
+
+@patch("forklift.plan.arcpy")
+def test_plan_crate_with_change_detection(arcpy):
+    arcpy.Exists.return_value = True
+    arcpy.GetCount_management.return_value.getOutput.side_effect = ["20", "15"]
+
+    crate_plan = plan.plan_crate(get_crate(), Mock(return_value=True), get_change_detection(True, True))
+    assert crate_plan["strategy"] == plan.TRUNCATE_AND_LOAD
+    assert (crate_plan["adds"], crate_plan["deletes"]) == (20, 15)
+
+    crate_plan = plan.plan_crate(get_crate(), Mock(return_value=True), get_change_detection(True, False))
+    assert crate_plan["strategy"] == plan.SKIP
+
+
+@patch("forklift.plan.arcpy")
+def test_plan_crate_creates_missing_destinations(arcpy):
+    arcpy.Exists.return_value = False
+    arcpy.GetCount_management.return_value.getOutput.return_value = "20"
+    validate_crate = Mock()
+
+    crate_plan = plan.plan_crate(get_crate(), validate_crate, get_change_detection())
+
+    assert crate_plan["strategy"] == plan.CREATE
+    assert crate_plan["adds"] == 20
+    validate_crate.assert_not_called()
+
+
+@patch("forklift.plan.arcpy")
+def test_plan_crate_invalid(arcpy):
+    arcpy.Exists.return_value = True
+
+    crate_plan = plan.plan_crate(get_crate(result=(Crate.INVALID_DATA, "bad name")), Mock(), get_change_detection())
+    assert (crate_plan["strategy"], crate_plan["message"]) == (plan.INVALID, "bad name")
+
+    crate_plan = plan.plan_crate(get_crate(), Mock(side_effect=Exception("schema")), get_change_detection())
+    assert (crate_plan["strategy"], crate_plan["message"]) == (plan.INVALID, "schema")
+
+
+@patch("forklift.plan.history.estimate_durations")
+@patch("forklift.plan.plan_crate")
+def test_plan_crates_plans_duplicates_once(plan_crate, estimate_durations):
+    roads = get_crate("Roads")
+    duplicate = get_crate("Roads")
+    rivers = get_crate("Rivers")
+    pallet = Mock()
+    pallet.get_crates.return_value = [roads, rivers]
+    other_pallet = Mock()
+    other_pallet.get_crates.return_value = [duplicate]
+    plan_crate.side_effect = lambda crate, validate_crate, change_detection: {"source_rows": 1}
+    estimate_durations.return_value = {"Roads_hash": 5}
+
+    crate_plans = plan.plan_crates([pallet, other_pallet], Mock(), {roads.destination, rivers.destination})
+
+    assert plan_crate.call_count == 2
+    assert [crate_plan["estimated_seconds"] for crate_plan in crate_plans] == [5, None]
+
+
+def test_save_and_format_plan(tmp_path):
+    location = str(tmp_path / "plan.json")
+    lift_plan = {
+        "pallets": ["pallet.py:Pallet"],
+        "crates": [
+            {
+                "name": "Roads",
+                "destination": "c:\\hashed.gdb\\Roads",
+                "strategy": plan.HASH,
+                "adds": 2,
+                "deletes": 1,
+                "source_rows": 10,
+                "message": "duplicate features detected!",
+                "estimated_seconds": 5,
+            }
+        ],
+        "import_errors": [],
+        "estimated_seconds": 5,
+    }
+
+    plan.save(lift_plan, location)
+
+    with open(location) as plan_file:
+        assert json.load(plan_file) == lift_plan
+
+    table = plan.format_plan(lift_plan)
+
+    assert "Roads" in table
+    assert "duplicate features detected!" in table
+    assert "1 crates in 1 pallets" in table
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_progress.py
+
+A module that contains tests for progress.py
+"""
+
+import json
+from unittest.mock import Mock, patch
+from urllib.request import urlopen
+
+import pytest
+
+from forklift import progress
+
+
+def crate(name):
+    mock = Mock()
+    mock.name = name + "_abc"
+    mock.destination_name = name
+
+    return mock
+
+
+@pytest.fixture
+def settings():
+    values = {}
+
+    with patch(
+        "forklift.progress.config.get_config_prop", side_effect=lambda key, default=None: values.get(key, default)
+    ):
+        yield values
+
+
+@pytest.fixture
+def tracker(tmp_path, settings):
+    with patch("forklift.progress.history.get_phase_medians", return_value={"dropoff_data": 100, "gift_wrap": 50}):
+        tracker = progress.Progress(str(tmp_path / "progress.json"))
+        tracker.start()
+
+    yield tracker
+
+    tracker.finish()
+
+
+def read(tracker):
+    with open(tracker.location, encoding="utf-8") as progress_file:
+        return json.load(progress_file)
+
+
+def test_progress_tracks_crates_and_writes_the_file(tracker, settings):
+    settings["crateWorkers"] = 2
+    roads, parcels = crate("Roads"), crate("Parcels")
+
+    tracker.set_phase("process_crates")
+    tracker.add_crates([roads, parcels], {roads.name: 200, parcels.name: 400})
+    tracker.start_crate(roads)
+    tracker.set_rows(roads, "hash", 10000)
+
+    assert read(tracker)["crates"]["current"][0]["name"] == "Roads"
+
+    status = tracker.get_status()
+
+    assert status["state"] == "running"
+    assert status["phase"] == "process_crates"
+    assert status["crates"]["total"] == 2
+    assert status["crates"]["pending"] == ["Parcels"]
+    assert status["crates"]["current"][0]["name"] == "Roads"
+    assert status["crates"]["current"][0]["phase"] == "hash"
+    assert status["crates"]["current"][0]["rows_per_second"] > 0
+    assert 449 < status["estimated_remaining_seconds"] <= 450
+
+    tracker.finish_crate(roads)
+    tracker.set_phase("gift_wrap")
+    status = read(tracker)
+
+    assert status["crates"]["finished"] == 1
+    assert status["crates"]["current"] == []
+    assert 249 < status["estimated_remaining_seconds"] <= 250
+
+    tracker.finish()
+
+    assert read(tracker)["state"] == "finished"
+    assert read(tracker)["estimated_remaining_seconds"] == 0
+
+
+def test_remaining_seconds_include_process_pallets(tmp_path, settings):
+    medians = {"process_pallets": 30, "dropoff_data": 100}
+
+    with patch("forklift.progress.history.get_phase_medians", return_value=medians):
+        tracker = progress.Progress(str(tmp_path / "progress.json"))
+        tracker.start()
+
+    tracker.set_phase("process_crates")
+
+    assert tracker.get_status()["estimated_remaining_seconds"] == 130
+
+    tracker.finish()
+
+
+def test_set_rows_is_throttled(tracker, settings):
+    settings["progressIntervalSeconds"] = 60
+    roads = crate("Roads")
+    tracker.add_crates([roads])
+    tracker.start_crate(roads)
+
+    tracker.set_rows(roads, "insert", 10000)
+
+    assert read(tracker)["crates"]["current"][0]["rows"] == 0
+    assert tracker.get_status()["crates"]["current"][0]["rows"] == 10000
+
+
+def test_progress_ignores_crates_without_a_run(tmp_path, settings):
+    tracker = progress.Progress(str(tmp_path / "progress.json"))
+
+    tracker.add_crates([crate("Roads")])
+    tracker.start_crate(crate("Roads"))
+    tracker.set_rows(crate("Roads"), "hash", 10000)
+
+    assert tracker.get_status()["crates"]["total"] == 0
+    assert not (tmp_path / "progress.json").exists()
+
+
+def test_progress_serves_the_status(tmp_path, settings):
+    settings["progressPort"] = 6544
+
+    with patch("forklift.progress.ThreadingHTTPServer") as server_class:
+        tracker = progress.Progress(str(tmp_path / "progress.json"))
+        tracker.start()
+
+    server_class.assert_called_once()
+    assert server_class.return_value.progress is tracker
+
+    tracker.finish()
+
+    server_class.return_value.shutdown.assert_called_once()
+
+
+def test_progress_handler_responds_with_json(tmp_path, settings):
+    server = progress.ThreadingHTTPServer(("localhost", 0), progress._ProgressHandler)
+    server.progress = progress.Progress(str(tmp_path / "progress.json"))
+    server.progress.start()
+
+    thread = progress.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        with urlopen("http://localhost:{}/".format(server.server_address[1])) as response:
+            assert json.load(response)["state"] == "running"
+    finally:
+        server.shutdown()
+        server.server_close()
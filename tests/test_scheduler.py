@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_scheduler.py
+
+A module that contains tests for scheduler.py
+"""
+
+import unittest
+from itertools import count
+from os import cpu_count
+from threading import Lock
+from time import sleep
+from unittest.mock import Mock, patch
+
+from forklift.scheduler import CrateScheduler, WorkerController, default_host_limit
+
+
+class TestCrateScheduler(unittest.TestCase):
+    def test_run_returns_results_in_job_order(self):
+        patient = CrateScheduler(workers=3)
+
+        def job(value):
+            def run():
+                sleep(0.01 * (3 - value))
+
+                return value
+
+            return run
+
+        self.assertEqual(patient.run([(None, None, job(i)) for i in range(3)]), [0, 1, 2])
+
+    def test_run_respects_host_limits(self):
+        patient = CrateScheduler(workers=6, host_limits={"sql": 2, "default": 1})
+        lock = Lock()
+        running = {}
+        peaks = {}
+
+        def job(host):
+            def run():
+                with lock:
+                    running[host] = running.get(host, 0) + 1
+                    peaks[host] = max(peaks.get(host, 0), running[host])
+
+                sleep(0.02)
+
+                with lock:
+                    running[host] -= 1
+
+            return (host, None, run)
+
+        patient.run([job("sql") for _ in range(5)] + [job("agol") for _ in range(3)] + [job(None) for _ in range(4)])
+
+        self.assertEqual(peaks["sql"], 2)
+        self.assertEqual(peaks["agol"], 1)
+        self.assertGreater(peaks[None], 1)
+
+    def test_run_writes_to_one_workspace_at_a_time(self):
+        patient = CrateScheduler(workers=4)
+        lock = Lock()
+        running = {}
+        peaks = {}
+
+        def job(workspace):
+            def run():
+                with lock:
+                    running[workspace] = running.get(workspace, 0) + 1
+                    peaks[workspace] = max(peaks.get(workspace, 0), running[workspace])
+
+                sleep(0.02)
+
+                with lock:
+                    running[workspace] -= 1
+
+            return (None, workspace, run)
+
+        patient.run([job("roads.gdb") for _ in range(3)] + [job("water.gdb") for _ in range(3)])
+
+        self.assertEqual(peaks, {"roads.gdb": 1, "water.gdb": 1})
+        self.assertEqual(patient.writing, set())
+
+    def test_get_host_limit(self):
+        patient = CrateScheduler(workers=4, host_limits={"SQL.Server": 3})
+
+        self.assertEqual(patient.get_host_limit(None), 4)
+        self.assertEqual(patient.get_host_limit("sql.server"), 3)
+        self.assertEqual(patient.get_host_limit("other"), default_host_limit)
+
+    def test_run_collects_job_errors(self):
+        patient = CrateScheduler()
+        error = ValueError("boom")
+
+        def job():
+            raise error
+
+        self.assertEqual(patient.run([(None, None, job), (None, None, lambda: 2)]), [error, 2])
+        self.assertEqual(patient.running, {None: 0})
+
+    def test_host_limits_are_not_shared(self):
+        patient = CrateScheduler()
+        patient.host_limits["sql"] = 1
+
+        self.assertEqual(CrateScheduler().host_limits, {})
+
+    def test_workers_is_at_least_one(self):
+        self.assertEqual(CrateScheduler(workers=0).workers, 1)
+
+
+class TestWorkerController(unittest.TestCase):
+    def test_initial_workers_are_bounded(self):
+        self.assertEqual(WorkerController(minimum=2, maximum=4).workers, 2)
+        self.assertEqual(WorkerController(minimum=2, maximum=4, initial=10).workers, 4)
+
+    def test_adjust_waits_for_interval(self):
+        patient = WorkerController(minimum=1, maximum=4, interval=60)
+
+        self.assertEqual(patient.adjust(True), 1)
+        self.assertEqual(patient.decisions, [])
+
+    @patch("forklift.scheduler.perf_counter", side_effect=count())
+    @patch("forklift.scheduler.WorkerController.get_cpu_utilization", return_value=0.1)
+    def test_adjust_increases_additively_while_crates_are_waiting(self, *_):
+        patient = WorkerController(minimum=1, maximum=3, interval=0)
+
+        patient.record_rows(100)
+        self.assertEqual(patient.adjust(True), 2)
+        patient.record_rows(1000)
+        self.assertEqual(patient.adjust(True), 3)
+        patient.record_rows(10000)
+        self.assertEqual(patient.adjust(True), 3)
+
+    @patch("forklift.scheduler.WorkerController.get_cpu_utilization", return_value=0.95)
+    def test_adjust_decreases_multiplicatively_when_cpu_is_saturated(self, _):
+        patient = WorkerController(minimum=1, maximum=16, initial=8, interval=0)
+
+        self.assertEqual(patient.adjust(True), 4)
+        self.assertEqual(patient.decisions[0], (8, 4, "cpu is saturated"))
+
+    @patch("forklift.scheduler.WorkerController.get_cpu_utilization", return_value=0.1)
+    def test_adjust_decreases_when_throughput_drops_after_an_increase(self, _):
+        patient = WorkerController(minimum=1, maximum=16, initial=4, interval=0)
+
+        patient.record_rows(1000000)
+        self.assertEqual(patient.adjust(True), 5)
+        self.assertEqual(patient.adjust(True), 2)
+
+    def test_cpu_utilization_uses_cpu_seconds(self):
+        cpu_seconds = Mock(side_effect=[10, 10 + cpu_count()])
+        patient = WorkerController(cpu_seconds=cpu_seconds)
+
+        self.assertEqual(patient.get_cpu_utilization(2), 0.5)
+
+    @patch("forklift.scheduler.WorkerController.get_cpu_utilization", return_value=0.1)
+    def test_scheduler_uses_controller_workers(self, _):
+        controller = WorkerController(minimum=1, maximum=2, interval=0)
+        patient = CrateScheduler(workers=10, controller=controller)
+
+        self.assertEqual(patient.workers, 1)
+
+        patient.run([(None, None, lambda: None) for _ in range(3)])
+
+        self.assertEqual(patient.workers, 2)
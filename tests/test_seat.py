@@ -6,7 +6,10 @@ test_seat.py
 A module that tests seat.py
 """
 
+import sys
 import unittest
+from types import ModuleType
+from unittest.mock import patch
 
 from forklift import seat
 
@@ -26,3 +29,41 @@ class TestSeat(unittest.TestCase):
     def test_format_time_hours(self):
         self.assertEqual(seat.format_time(7200.0), "2.0 hours")
         self.assertEqual(seat.format_time(5410.0), "1.5 hours")
+
+    def test_lazy_import_returns_imported_module(self):
+        import json
+
+        self.assertIs(seat.lazy_import("json"), json)
+
+    def test_lazy_import_missing_module(self):
+        with self.assertRaises(ModuleNotFoundError):
+            seat.lazy_import("not_a_forklift_module")
+
+    def test_finish_lazy_imports(self):
+        sys.modules.pop("colorsys", None)
+
+        try:
+            with patch("forklift.seat._lazy_modules", set()):
+                module = seat.lazy_import("colorsys")
+                self.assertIsNot(type(module), ModuleType)
+
+                seat.finish_lazy_imports()
+
+            self.assertIs(type(module), ModuleType)
+        finally:
+            sys.modules.pop("colorsys", None)
+
+    def test_get_import_times(self):
+        output = "\n".join(
+            [
+                "import time: self [us] | cumulative | imported package",
+                "import time:       120 |        120 |     _io",
+                "import time:       300 |       5300 |   arcpy",
+                "import time:        50 |        170 | forklift",
+                "a warning that is not an import time",
+            ]
+        )
+
+        self.assertEqual(
+            seat.get_import_times(output), [("arcpy", 300, 5300), ("forklift", 50, 170), ("_io", 120, 120)]
+        )
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_server.py
+
+A module that contains tests for server.py
+"""
+
+import stat
+import sys
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+
+from forklift import server
+
+
+def test_is_running_without_key_is_false():
+    with patch("forklift.server.exists", return_value=False):
+        assert server.is_running() is False
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="windows files keep the permissions of their folder")
+def test_key_can_only_be_read_by_the_user(tmp_path):
+    key = tmp_path / "serve.key"
+    key.write_bytes(b"old")
+    key.chmod(0o644)
+
+    with patch("forklift.server.get_key_location", return_value=str(key)):
+        server._write_key()
+
+        assert len(server._read_key()) == 32
+
+    assert stat.S_IMODE(key.stat().st_mode) == 0o600
+
+
+def test_handle_status_and_stop():
+    patient = server.Server(schedule=[], trigger_seconds=None)
+    patient.running = True
+
+    assert patient.handle({"command": "status"}) == {"running": True}
+    assert patient.handle({"command": "stop"}) == {"running": False}
+    assert patient.running is False
+
+
+def test_handle_lift():
+    patient = server.Server(schedule=[], trigger_seconds=None)
+    patient.lift = Mock(return_value="report")
+
+    assert patient.handle({"command": "lift", "file_path": "pallet.py", "pallet_arg": "arg"}) == "report"
+    patient.lift.assert_called_once_with("pallet.py", "arg", False, None, None)
+
+    patient.handle({"command": "lift", "send_emails": False})
+    patient.lift.assert_called_with(None, None, False, None, False)
+
+
+def test_handle_unknown_command():
+    patient = server.Server(schedule=[], trigger_seconds=None)
+
+    with pytest.raises(ValueError):
+        patient.handle({"command": "dance"})
+
+
+def test_tick_runs_scheduled_lift_once():
+    patient = server.Server(schedule=["02:00"], trigger_seconds=None)
+    patient.lift = Mock()
+
+    patient._tick(datetime(2020, 1, 1, 1, 59))
+    patient._tick(datetime(2020, 1, 1, 2, 0, 10))
+    patient._tick(datetime(2020, 1, 1, 2, 0, 40))
+
+    patient.lift.assert_called_once_with()
+
+    patient._tick(datetime(2020, 1, 2, 2, 0, 5))
+
+    assert patient.lift.call_count == 2
+
+
+def test_tick_lifts_when_change_detection_tables_change():
+    patient = server.Server(schedule=[], trigger_seconds=60)
+    patient.last_trigger_check = datetime(2020, 1, 1, 1, 0)
+    patient.executor = Mock()
+    patient.executor.submit.return_value.result.side_effect = [False, True]
+    patient.lift = Mock()
+
+    patient._tick(datetime(2020, 1, 1, 1, 0, 30))
+
+    patient.executor.submit.assert_not_called()
+
+    patient._tick(datetime(2020, 1, 1, 1, 1))
+    patient.lift.assert_not_called()
+
+    patient._tick(datetime(2020, 1, 1, 1, 2))
+    patient.lift.assert_called_once_with(skip_git=True)
+
+
+@pytest.mark.parametrize("error", [BrokenProcessPool("worker died"), ValueError("lift failed")])
+def test_lift_replaces_worker_after_an_error(error):
+    patient = server.Server(schedule=[], trigger_seconds=None)
+    broken = Mock()
+    broken.submit.return_value.result.side_effect = error
+    patient.executor = broken
+    patient._start_worker = Mock()
+
+    with pytest.raises(type(error)):
+        patient.lift(skip_git=True)
+
+    assert patient.executor == patient._start_worker.return_value
+    broken.shutdown.assert_called_once_with(wait=False)
+
+
+def test_handle_connection_sends_errors():
+    patient = server.Server(schedule=[], trigger_seconds=None)
+    connection = MagicMock()
+    connection.recv.return_value = {"command": "dance"}
+
+    patient._handle_connection(connection)
+
+    connection.send.assert_called_once_with({"error": "unknown command: dance"})
+
+
+@patch("forklift.engine.lift_pallets", return_value="report")
+def test_lift_in_worker_sets_send_emails(lift_pallets):
+    from forklift import messaging
+
+    assert server._lift(None, None, True, None, False) == "report"
+    assert messaging.send_emails_override is False
+
+    server._lift(None, None, True, None)
+    assert messaging.send_emails_override is None
@@ -82,3 +82,20 @@ class TestSlack(unittest.TestCase):
         )
 
         self.assertTrue(len(messages) == 1)
+
+    def test_lift_with_anomalies(self):
+        messages = slack.lift_report_to_blocks(
+            {
+                "hostname": "SomeMachineName",
+                "num_success_pallets": 1,
+                "total_pallets": 1,
+                "total_time": "4.5 hours",
+                "git_errors": [],
+                "import_errors": [],
+                "anomalies": ["crate Parcels took 50 minutes which is 10.0x its median of 5 minutes"] * 11,
+                "pallets": [],
+            }
+        )
+
+        self.assertIn("duration anomalies", messages[0])
+        self.assertEqual(messages[0].count("crate Parcels took 50 minutes"), 11)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# * coding: utf8 *
+"""
+test_supervisor.py
+
+A module that contains tests for supervisor.py
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+
+from forklift import supervisor
+from forklift.models import Crate, Pallet
+
+
+def crate_with(timeout):
+    crate = Mock()
+    crate.name = "counties"
+    crate.destination_name = "Counties"
+    crate.timeout = timeout
+
+    return crate
+
+
+class TestSupervisor(unittest.TestCase):
+    @patch("forklift.supervisor.config.get_config_prop", return_value=60)
+    def test_get_timeout_prefers_crate(self, get_config_prop):
+        self.assertEqual(supervisor.get_timeout(crate_with(10)), 10)
+        self.assertEqual(supervisor.get_timeout(crate_with(None)), 60)
+
+    @patch("forklift.supervisor.config.get_config_prop", side_effect=lambda key, default=None: default)
+    @patch("forklift.supervisor.core.update", return_value=(Crate.UPDATED, None))
+    def test_update_without_timeout_runs_in_process(self, update, get_config_prop):
+        crate = crate_with(None)
+
+        self.assertEqual(supervisor.update(crate, None, None), (Crate.UPDATED, None))
+        update.assert_called_once_with(crate, None, None)
+
+    @patch("forklift.supervisor._get_crate_spec", return_value={})
+    @patch("forklift.supervisor._read_tail", return_value="Thread 0x1 (most recent call first):")
+    @patch("forklift.supervisor.multiprocessing")
+    def test_update_stops_hung_worker(self, multiprocessing, read_tail, get_crate_spec):
+        receiver = Mock()
+        receiver.poll.side_effect = [True, False]
+        receiver.recv.return_value = supervisor.ready_message
+        context = multiprocessing.get_context.return_value
+        context.Pipe.return_value = (receiver, Mock())
+        worker = context.Process.return_value
+        worker.is_alive.return_value = True
+
+        status, message = supervisor.update(crate_with(10), Mock(), None)
+
+        receiver.poll.assert_called_with(10 + supervisor.grace_seconds)
+        worker.kill.assert_called_once()
+        self.assertEqual(status, Crate.UNHANDLED_EXCEPTION)
+        self.assertIn("timed out after 10 seconds", message)
+        self.assertIn("most recent call first", message)
+
+    @patch("forklift.supervisor._get_crate_spec", return_value={})
+    @patch("forklift.supervisor.multiprocessing")
+    def test_update_returns_worker_result(self, multiprocessing, get_crate_spec):
+        receiver = Mock()
+        receiver.poll.return_value = True
+        receiver.recv.side_effect = [
+            supervisor.ready_message,
+            ((Crate.UPDATED, None), 10, None, 1, 2, {"hash": 3}, ["counties"], 4),
+        ]
+        context = multiprocessing.get_context.return_value
+        context.Pipe.return_value = (receiver, Mock())
+        context.Process.return_value.is_alive.return_value = False
+        crate = crate_with(10)
+        change_detection = Mock()
+        cpu_seconds = supervisor.worker_cpu_seconds
+
+        self.assertEqual(supervisor.update(crate, Mock(), change_detection), (Crate.UPDATED, None))
+        self.assertEqual(crate.total_rows, 10)
+        self.assertEqual((crate.adds, crate.deletes, crate.phase_times), (1, 2, {"hash": 3}))
+        change_detection.write_hash.assert_called_once_with("counties")
+        self.assertEqual(supervisor.worker_cpu_seconds, cpu_seconds + 4)
+
+    @patch(
+        "forklift.supervisor.config.get_config_prop",
+        side_effect=lambda key, default=None: {"crateWorkers": 2}.get(key, default),
+    )
+    @patch("forklift.supervisor.core.update")
+    @patch("forklift.supervisor._get_crate_spec", return_value={})
+    @patch("forklift.supervisor.multiprocessing")
+    def test_update_concurrent_crates_in_workers(self, multiprocessing, get_crate_spec, update, get_config_prop):
+        receiver = Mock()
+        receiver.poll.return_value = True
+        receiver.recv.side_effect = [supervisor.ready_message, ((Crate.UPDATED, None), 10, None, 1, 2, {}, [], 0)]
+        context = multiprocessing.get_context.return_value
+        context.Pipe.return_value = (receiver, Mock())
+        context.Process.return_value.is_alive.return_value = False
+
+        self.assertEqual(supervisor.update(crate_with(None), Mock(), Mock()), (Crate.UPDATED, None))
+        update.assert_not_called()
+        receiver.poll.assert_called_with(None)
+
+    @patch("forklift.supervisor._get_crate_spec", return_value={})
+    @patch("forklift.supervisor._read_tail", return_value="")
+    @patch("forklift.supervisor.multiprocessing")
+    def test_update_does_not_time_the_worker_startup(self, multiprocessing, read_tail, get_crate_spec):
+        receiver = Mock()
+        receiver.poll.return_value = False
+        context = multiprocessing.get_context.return_value
+        context.Pipe.return_value = (receiver, Mock())
+        worker = context.Process.return_value
+        worker.is_alive.return_value = True
+
+        status, message = supervisor.update(crate_with(10), Mock(), None)
+
+        receiver.poll.assert_called_once_with(supervisor.startup_seconds)
+        worker.kill.assert_called_once()
+        self.assertEqual(status, Crate.UNHANDLED_EXCEPTION)
+        self.assertIn("did not start within", message)
+
+    @patch("forklift.supervisor._get_crate_spec", return_value={})
+    @patch("forklift.supervisor._read_tail", return_value="Fatal Python error: Segmentation fault")
+    @patch("forklift.supervisor.multiprocessing")
+    def test_update_handles_crashed_worker(self, multiprocessing, read_tail, get_crate_spec):
+        receiver = Mock()
+        receiver.poll.return_value = True
+        receiver.recv.side_effect = EOFError()
+        context = multiprocessing.get_context.return_value
+        context.Pipe.return_value = (receiver, Mock())
+        worker = context.Process.return_value
+        worker.is_alive.return_value = False
+        worker.exitcode = -11
+
+        status, message = supervisor.update(crate_with(10), Mock(), None)
+
+        self.assertEqual(status, Crate.UNHANDLED_EXCEPTION)
+        self.assertIn("exited with code -11", message)
+        self.assertIn("Segmentation fault", message)
+
+    @patch("forklift.engine.build_pallets")
+    def test_get_validate_crate_rebuilds_pallet(self, build_pallets):
+        pallet = Mock()
+        build_pallets.return_value = ([pallet], [])
+
+        validate_crate = supervisor._get_validate_crate("pallet.py:Pallet", "arg")
+
+        build_pallets.assert_called_once_with("pallet.py:Pallet", "arg")
+        self.assertEqual(validate_crate, pallet.validate_crate)
+
+    @patch("forklift.engine.build_pallets", return_value=([], ["pallet failed to import"]))
+    def test_get_validate_crate_defaults_to_pallet(self, build_pallets):
+        self.assertEqual(supervisor._get_validate_crate("pallet.py:Pallet").__func__, Pallet.validate_crate)